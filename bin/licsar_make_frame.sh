@@ -27,6 +27,8 @@ if [ -z $1 ]; then
  echo "-f ............... force processing in case the frame is already running in framebatch"
  #echo "-E ............... after resampling, move to an area for copying to ARC4 EIDP"
  echo "-N ............... check if there are new acquisitions since the last run. If not, will cancel the processing"
+ echo "-I ............... incremental update - keep the frame records in framebatch db, only add new epochs/pairs"
+ echo "-e YYYY-MM-DD .... event (earthquake) date - epochs/pairs after it and co-seismic pairs are processed first"
  #echo "-P ............... prioritise... i.e. run on comet queue (default: use short-serial where needed)"
  echo "-A or -B ......... perform ifg gapfill (4 ifgs + extras) for only S1A/S1B"
  echo "-b ............... also do burst overlaps"
@@ -70,9 +72,11 @@ deleteafterstore=0
 prioritise=0
 extradatarefill=''
 rgoff=0
+incremental=0
+eventdate=''
 # fi
 
-while getopts ":cnSEfNPRGAbBDTd" option; do
+while getopts ":cnSEfNPRGAbBDTdIe:" option; do
  case "${option}" in
   D) extradatarefill='-A';
      ;;
@@ -110,6 +114,10 @@ while getopts ":cnSEfNPRGAbBDTd" option; do
      ;;
   N) only_new_rslc=1; echo "Checking if new images appeared since the last processing";
      ;;
+  I) incremental=1; echo "Incremental update of the frame in framebatch db";
+     ;;
+  e) eventdate=${OPTARG}; echo "Prioritising the epochs and pairs of the event on "$eventdate;
+     ;;
   b) bovls=1;
      ;;
   T) terminal=1; echo "will set things and run in terminal";
@@ -331,6 +339,22 @@ fi
 
 #echo "debu 3"
 
+function submit_step {
+ #submits the $step.lotus2.sh array with per task dependencies (each task waits only
+ #for the tasks of the previous step it needs, see frameJobPlan.py). if that fails
+ #with nothing submitted (frameJobPlan.py cancels the arrays of a failed step, or
+ #prints those it could not cancel), the whole array waits for the whole previous
+ #one (given as the 2nd argument)
+ plannedjid=`frameJobPlan.py $frame $1 2>>$logdir/frameJobPlan.err | tail -n1 | gawk '{print $2}'`
+ if [ ! -z "$plannedjid" ]; then
+  echo $plannedjid
+ elif [ -z "$2" ]; then
+  sbatch --parsable $1.lotus2.sh
+ else
+  sbatch -d afterany:$2 --parsable $1.lotus2.sh
+ fi
+}
+
 function prepare_job_script {
  step=$1
  stepcmd=$2
@@ -339,6 +363,7 @@ function prepare_job_script {
  
  rm $step.sh $step.wait.sh 2>/dev/null
  rm $step'.nowait.sh' 2>/dev/null
+ rm $step.plan 2>/dev/null
  rm $step.list 2>/dev/null
 # mysql command is much faster, but it is not available in every server:
 # 12/2023: on LOTUS nodes, the mysql is now in different version and it does not work -- so, switching fully to python solution
@@ -382,6 +407,15 @@ EOF
  mv $step.list2 $step.list 
 #fi
 chmod 777 $step.sql
+ #walltime and memory of the jobs from the processing history (item_timing),
+ #the fixed rules below are used for the jobs not predicted
+ predictResources.py $frame $step $step.list > $step.resources 2>/dev/null || rm -f $step.resources
+ #the jobs of the previous step each job waits for, from the batch db
+ if [ ! -z $stepprev ]; then
+  jobDependencies.py $frame $step > $step.deps 2>/dev/null || rm -f $step.deps
+  #(only the jobs of the previous step of this run can be waited for)
+  gawk '{print $1}' $stepprev.list 2>/dev/null | sort -u > $stepprev.jobids
+ fi
  exptimemax=1
  maxmaxmem=1024
  for jobid in `cat $step.list | gawk {'print $1'} | sort -un`; do
@@ -390,17 +424,22 @@ chmod 777 $step.sql
   waitcmd=""
   rm tmpText 2>/dev/null
   if [ ! -z $stepprev ]; then
-   for image in `grep ^$jobid $step.list | gawk {'print $3'}`; do
-    #get jobid from previous step that is connected to this image
-    grep $image $stepprev.list | gawk {'print $1'} >> tmpText
-   done
-   #need to wait for coreg and will wait also for ifg step
-   #the waiting of unwrap to mk_ifg should be improved! this way is safer but will wait for more than necessary
-   if [ $step == 'framebatch_03_mk_ifg' ] || [ $step == 'framebatch_04_unwrap' ]; then
-    for image in `grep ^$jobid $step.list | gawk {'print $4'}`; do
+   if [ -f $step.deps ]; then
+    #only the jobs processing the items needed by this job (see jobDependencies.py)
+    grep "^$jobid " $step.deps | cut -d ' ' -f2- | tr ' ' '\n' | grep -v '^$' | grep -xFf $stepprev.jobids > tmpText
+   else
+    for image in `grep ^$jobid $step.list | gawk {'print $3'}`; do
      #get jobid from previous step that is connected to this image
      grep $image $stepprev.list | gawk {'print $1'} >> tmpText
     done
+    #need to wait for coreg and will wait also for ifg step
+    #the waiting of unwrap to mk_ifg should be improved! this way is safer but will wait for more than necessary
+    if [ $step == 'framebatch_03_mk_ifg' ] || [ $step == 'framebatch_04_unwrap' ]; then
+     for image in `grep ^$jobid $step.list | gawk {'print $4'}`; do
+      #get jobid from previous step that is connected to this image
+      grep $image $stepprev.list | gawk {'print $1'} >> tmpText
+     done
+    fi
    fi
    for jobid_prev in `cat tmpText | sort -nu`; do
     waitText=$waitText" && ended("$jobid_prev"_"$stepprev")"
@@ -440,6 +479,8 @@ chmod 777 $step.sql
     if [ $burstsnum -ge 90 ]; then maxmem=25000; fi
     if [ $burstsnum -ge 120 ]; then maxmem=32000; fi
    fi
+   predicted=`grep "^$jobid " $step.resources 2>/dev/null`
+   if [ ! -z "$predicted" ]; then maxmem=`echo $predicted | gawk '{print $3}'`; fi
    # update of JASMIN - they somehow decreased default memory... fixing this here for all jobs..
    #extrabsub='-R "rusage[mem='$maxmem']" -M '$maxmem
    extrabsub='-M '$maxmem
@@ -454,6 +495,7 @@ chmod 777 $step.sql
   if [ $step == 'framebatch_04_unwrap' ]; then hoursperone=1.5; fi
   #to be included also number of bursts per frame...
   exptime=`echo $hoursperone*$notoprocess+1.5 | bc | cut -d '.' -f1`
+  if [ ! -z "$predicted" ]; then exptime=`echo $predicted | gawk '{print $2}'`; fi
   if [ $exptime -gt 23 ]; then exptime=23; fi
   if [ $exptime -lt 10 ]; then exptime=0$exptime; fi
   if [ $exptime -gt $exptimemax ]; then exptimemax=$exptime; fi
@@ -505,7 +547,17 @@ EOF
  fi
 
 date
-setFrameInactive.py $frame
+if [ $incremental -eq 1 ]; then
+ # keeping the existing records (and their statuses), createFrameCache will only add the new ones
+ cfcopt='--incremental'
+else
+ cfcopt=''
+ setFrameInactive.py $frame
+fi
+if [ ! -z "$eventdate" ]; then
+ # the post-event and co-seismic items get their own (high priority) jobs
+ cfcopt=$cfcopt' --event '$eventdate
+fi
 echo "Activating the frame"
 setFrameActive.py $frame
 
@@ -518,10 +570,24 @@ setFrameActive.py $frame
   framebatch_data_refill.sh -c $frame $startdate $enddate
  fi
 
+ # jobs per step and their runtime cap of the shortest simulated processing in the queue
+ # (see simulateSchedule.py) - the estimate above is kept if the simulation fails. only
+ # for the full scale runs from scratch: the simulation takes all the epochs of the period
+ # as to be processed (the short updates keep their 8 jobs, incremental ones have most
+ # of the epochs built)
+ if [ $full_scale -eq 1 ] && [ $incremental -eq 0 ]; then
+  schedule=`simulateSchedule.py $frame $startdate $enddate --pick 2>/dev/null | tail -n1`
+  if [ `echo $schedule | wc -w` -eq 2 ]; then
+   no_of_jobs=`echo $schedule | gawk '{print $1}'`
+   cfcopt=$cfcopt' --job-hours '`echo $schedule | gawk '{print $2}'`
+   echo "Simulated schedule: "$no_of_jobs" jobs per step, max. "`echo $schedule | gawk '{print $2}'`" h per job"
+  fi
+ fi
+
  echo "Preparing the frame cache (full scale processing)"
  echo "..may take some 15 minutes or (much) more"
  echo "(recommending using tmux or screen here..)"
- createFrameCache.py $frame $no_of_jobs $startdate $enddate > tmp_jobid.txt
+ createFrameCache.py $cfcopt $frame $no_of_jobs $startdate $enddate > tmp_jobid.txt
  
  # 2021-11-15: createFrameCache will now output also updated startdate and enddate to tmp_jobid.txt
 if [ $SM -lt 1 ]; then
@@ -542,9 +608,9 @@ if [ $neodc_check -gt 0 ] || [ $fillgaps -eq 1 ]; then
    framebatch_data_refill.sh -c $frame $startdate $enddate
   fi
   echo "re-caching the frame"
-  setFrameInactive.py $frame
+  if [ $incremental -eq 0 ]; then setFrameInactive.py $frame; fi
   setFrameActive.py $frame
-  createFrameCache.py $frame $no_of_jobs $startdate $enddate > tmp_jobid.txt
+  createFrameCache.py $cfcopt $frame $no_of_jobs $startdate $enddate > tmp_jobid.txt
  #fi
  if [ `grep -c ^updated tmp_jobid.txt` -gt 0 ]; then
   echo "ERROR - either data missing or another problem"
@@ -600,7 +666,7 @@ fi
   #./$step.nowait.sh
   # 2025/06: running as Job Array:
   echo "Running step 1 as job array"
-  PREVJID=$(sbatch --parsable $step.lotus2.sh)
+  PREVJID=`submit_step $step`
   echo $PREVJID
  else
   echo "To run this step, use ./"$step".nowait.sh"
@@ -620,7 +686,7 @@ fi
  if [ $NORUN -eq 0 ]; then
   # ./$step.wait.sh
   echo "Running step 2 as job array"
-  PREVJID=$(sbatch -d afterany:$PREVJID --parsable $step.lotus2.sh)
+  PREVJID=`submit_step $step $PREVJID`
   echo $PREVJID
  else
   echo "To run this step, use ./"$step".nowait.sh"
@@ -725,7 +791,7 @@ fi
    if [ -f $step.wait.sh ]; then
     #./$step.wait.sh
     echo "Running step 3 as job array"
-    PREVJID=$(sbatch -d afterany:$PREVJID --parsable $step.lotus2.sh)
+    PREVJID=`submit_step $step $PREVJID`
     echo $PREVJID
    else
     echo "ERROR: no mk_ifg script exists - perhaps not enough of input data. Exiting (keeping processing, so you may store at least coregistered files and their LUTs)"
@@ -747,7 +813,7 @@ fi
  if [ $NORUN -eq 0 ]; then
   #./$step.wait.sh
   echo "Running step 4 as job array"
-  PREVJID=$(sbatch -d afterany:$PREVJID --parsable $step.lotus2.sh)
+  PREVJID=`submit_step $step $PREVJID`
   echo $PREVJID
   echo "All jobs are sent for processing."
  else
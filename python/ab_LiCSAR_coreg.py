@@ -17,6 +17,8 @@ import pandas as pd
 from LiCSAR_lib.coreg_lib import *
 from LiCSAR_lib.LiCSAR_misc import *
 from batchLSFLib import set_lotus_job_status
+from batchTimingLib import ItemTimer
+from batchWorkerLib import get_workers,run_items,run_jobs
 
 #to ensure GAMMA will have proper value for CPU count
 #however i had to force processing on 1 core only, so hardcoding here
@@ -62,13 +64,11 @@ class CoregEnv(LicsEnv):
 
 
 ################################################################################
-#Main
+#Job setup
 ################################################################################
-def main(argv):
-    #Paramters
-    jobID = int(argv[1])
-    rslcs = lq.get_unbuilt_rslcs(jobID)
-    frameName = lq.get_frame_from_job(jobID)
+def job_setup(context):
+    #what process_rslc needs besides the rslc (the same for all rslcs of the job)
+    frameName = context.frame
     acqMode = 'iw'
     if frameName.split('_')[1] == 'SM':
         acqMode = 'sm'
@@ -83,18 +83,12 @@ def main(argv):
     #user = os.environ['USER']
     #tempDir = os.path.join(tempDir,user)
     tempDir = os.environ['LiCSAR_temp']
-    mstrDate = lq.get_master(frameName)
+    mstrDate = context.master
     if not mstrDate:
         print('error getting master date - doing workaround')
         import framecare as fc
         mstrDate = pd.Timestamp(fc.get_master(frameName)).to_pydatetime()
-        lq.set_master(lq.get_polyid(frameName), mstrDate)
-#-- -- -- -- -- -- -- -- -- -- -- -- -- -- -- -- -- -- -- -- 
-    print("Processing job {0} in frame {1}".format( jobID, frameName))
-    lq.set_job_started(jobID)
-
-
-#-- -- -- -- -- -- -- -- -- -- -- -- -- -- -- -- -- -- -- -- 
+        lq.set_master(context.polyid, mstrDate)
     rslcCache = os.path.join(cacheDir,frameName,'RSLC')
     builtRslcDates = pd.to_datetime(fnmatch.filter(os.listdir(rslcCache), '20??????'))
     builtRslcs = pd.DataFrame({'acq_date': builtRslcDates})
@@ -107,123 +101,171 @@ def main(argv):
         builtRslcs_orig = builtRslcs.copy(deep=True)
     except:
         builtRslcs_orig = builtRslcs
-    
-    for ind,row in rslcs.iterrows():
-        date = row['acq_date']
-        #oh no.. seeing the lines below makes me think that it is NOT GOOD IDEA to
-        # have many people solve the same issue...
-        # but keeping as it is since it works. ML
-        #Get closes date and use as an aux
-        try:
-            builtRslcs = builtRslcs_orig.copy(deep=True)
-        except:
-            builtRslcs = builtRslcs_orig
-        builtRslcs['date_diff'] = builtRslcs['acq_date'].apply(
-                lambda x: abs(x-date)
-                )
-        closestDate = builtRslcs.sort_values('date_diff').iloc[0].loc['acq_date']
-        if closestDate.date() != mstrDate.date():
-            auxDate = closestDate
-        else:
-            auxDate = None
-
-        #Parse multi look options
-        slcCache = os.path.join(cacheDir,frameName,'SLC')
-        gc.rglks = int(grep1('range_looks',os.path.join(slcCache,mstrDate.strftime('%Y%m%d/%Y%m%d.slc.mli.par'))).split(':')[1].strip())
-        gc.aglks = int(grep1('azimuth_looks',os.path.join(slcCache,mstrDate.strftime('%Y%m%d/%Y%m%d.slc.mli.par'))).split(':')[1].strip())
-        set_lotus_job_status('Setting up {:%y-%m-%d}'.format(date))
+    #Parse multi look options
+    slcCache = os.path.join(cacheDir,frameName,'SLC')
+    rglks = int(grep1('range_looks',os.path.join(slcCache,mstrDate.strftime('%Y%m%d/%Y%m%d.slc.mli.par'))).split(':')[1].strip())
+    aglks = int(grep1('azimuth_looks',os.path.join(slcCache,mstrDate.strftime('%Y%m%d/%Y%m%d.slc.mli.par'))).split(':')[1].strip())
+    return {'jobID':context.job_id,'frameName':frameName,'context':context,
+            'cacheDir':cacheDir,'tempDir':tempDir,'mstrDate':mstrDate,
+            'acqMode':acqMode,'slcCache':slcCache,'builtRslcs':builtRslcs_orig,
+            'rglks':rglks,'aglks':aglks}
+
+################################################################################
+#Process rslc
+################################################################################
+def process_rslc(row,jobSetup,statusWriter):
+    jobID = jobSetup['jobID']
+    frameName = jobSetup['frameName']
+    context = jobSetup['context']
+    mstrDate = jobSetup['mstrDate']
+    acqMode = jobSetup['acqMode']
+    slcCache = jobSetup['slcCache']
+    builtRslcs_orig = jobSetup['builtRslcs']
+    date = row['acq_date']
+    #oh no.. seeing the lines below makes me think that it is NOT GOOD IDEA to
+    # have many people solve the same issue...
+    # but keeping as it is since it works. ML
+    #Get closes date and use as an aux
+    #(from the rslcs built before the job started - also with --workers, so the
+    # aux does not depend on which items of the job happen to be finished)
+    try:
+        builtRslcs = builtRslcs_orig.copy(deep=True)
+    except:
+        builtRslcs = builtRslcs_orig
+    builtRslcs['date_diff'] = builtRslcs['acq_date'].apply(
+            lambda x: abs(x-date)
+            )
+    closestDate = builtRslcs.sort_values('date_diff').iloc[0].loc['acq_date']
+    if closestDate.date() != mstrDate.date():
+        auxDate = closestDate
+    else:
+        auxDate = None
+
+    #multi look options (of the master, read in main)
+    gc.rglks = jobSetup['rglks']
+    gc.aglks = jobSetup['aglks']
+    set_lotus_job_status('Setting up {:%y-%m-%d}'.format(date))
 #-- -- -- -- -- -- -- -- -- -- -- -- -- -- -- -- -- -- -- -- 
-        rc = -3
-        with CoregEnv(jobID,frameName,mstrDate,auxDate,date,cacheDir,tempDir) as env:
-            print("created new processing enviroement {}".format(env.actEnv))
-            print("processing rslc {0} on acquisition date {1:%Y%m%d}".format(
-                    row['rslc_id'],row['acq_date']))
+    rc = -3
+    with ItemTimer(statusWriter,context,'coreg',row['rslc_id'],gc.rglks,gc.aglks) as timer, \
+            CoregEnv(jobID,frameName,mstrDate,auxDate,date,jobSetup['cacheDir'],jobSetup['tempDir']) as env:
+        print("created new processing enviroement {}".format(env.actEnv))
+        print("processing rslc {0} on acquisition date {1:%Y%m%d}".format(
+                row['rslc_id'],row['acq_date']))
 
-            #Set failure status
-            env.cleanHook = lambda : lq.set_rslc_status(row['rslc_id'],UNKOWN_ERROR)
+        #Set failure status
+        env.cleanHook = lambda : statusWriter.set_rslc_status(row['rslc_id'],UNKOWN_ERROR)
+        env.statusBuffer = statusWriter
+        env.timer = timer
 
-            #If source slc was succesfully copied over
-            if os.path.exists(env.srcSlcPath):
-                set_lotus_job_status('Processing {:%y-%m-%d}'.format(date))
+        #If source slc was succesfully copied over
+        if os.path.exists(env.srcSlcPath):
+            set_lotus_job_status('Processing {:%y-%m-%d}'.format(date))
 
-                lq.set_rslc_status(row['rslc_id'],BUILDING) #building status
-                
-                if os.path.exists(env.srcLutPath):
-                    #so if LUT exists for this date, do re-recoregistration. otherwise just.. normal one
-                    if acqMode == 'sm':
-                        print('recoregistration for stripmaps is not ready yet, reprocessing instead!')
-                        rc = coreg_slave_sm(date,'SLC','RSLC',mstrDate.date(),frameName,'.', lq, -1)
-                    else:
-                        rc = recoreg_slave(date,'SLC','RSLC',mstrDate.date(),frameName,'.', lq)
-                        if rc != 0:
-                            # rc code 7 means LUT not found..
-                            slaveLockFile = 'RSLC/'+date.strftime('/%Y%m%d.lock')
-                            if os.path.exists(slaveLockFile):
-                                os.remove(slaveLockFile)
-                            rc = coreg_slave(date,'SLC','RSLC',mstrDate.date(),frameName,'.', lq, -1)
+            statusWriter.set_rslc_status(row['rslc_id'],BUILDING) #building status
+            
+            if os.path.exists(env.srcLutPath):
+                #so if LUT exists for this date, do re-recoregistration. otherwise just.. normal one
+                if acqMode == 'sm':
+                    print('recoregistration for stripmaps is not ready yet, reprocessing instead!')
+                    rc = coreg_slave_sm(date,'SLC','RSLC',mstrDate.date(),frameName,'.', lq, -1)
                 else:
-                    if acqMode == 'sm':
-                        rc = coreg_slave_sm(date,'SLC','RSLC',mstrDate.date(),frameName,'.', lq, -1)
-                    else:
+                    rc = recoreg_slave(date,'SLC','RSLC',mstrDate.date(),frameName,'.', lq)
+                    if rc != 0:
+                        # rc code 7 means LUT not found..
+                        slaveLockFile = 'RSLC/'+date.strftime('/%Y%m%d.lock')
+                        if os.path.exists(slaveLockFile):
+                            os.remove(slaveLockFile)
                         rc = coreg_slave(date,'SLC','RSLC',mstrDate.date(),frameName,'.', lq, -1)
+            else:
+                if acqMode == 'sm':
+                    rc = coreg_slave_sm(date,'SLC','RSLC',mstrDate.date(),frameName,'.', lq, -1)
+                else:
+                    rc = coreg_slave(date,'SLC','RSLC',mstrDate.date(),frameName,'.', lq, -1)
 
-                rslc = os.path.join(env.actEnv,'RSLC',date.strftime('%Y%m%d'),
-                                    date.strftime('%Y%m%d.rslc'))
-                rslc_epochdir = os.path.join(env.actEnv,'RSLC',date.strftime('%Y%m%d'))
-                
-                #if os.path.exists(rslc):
-                #    print("Removing mosaiced image {0}".format(rslc))
-                #    os.remove(rslc)
-
-                #Finally set rslc status to return code
-                try:
-                    #lq.conn.ping(reconnect=True)
-                    try:
-                        reconn_pom = lq.connection_established()
-                        lq.set_rslc_status(row['rslc_id'],rc)
-                    except:
-                        reconn_pom = lq.connection_established()
-                        lq.set_rslc_status(row['rslc_id'],rc)
-                except:
-                    print('debug 1: error in mysql connection - common after Sep 2020 change in mysql db by JASMIN..')
-                    print('but continuing')
-                if os.path.exists(rslc_epochdir):
-                    if rc!=0:
-                        print('there was an error, cleaning the (probably) wrongly generated RSLC')
-                        shutil.rmtree(rslc_epochdir)
-                    else:
-                        cmd = 'create_geoctiffs_to_pub.sh -M {0} {1}'.format(env.actEnv, date.strftime('%Y%m%d'))
-                        rcc = os.system(cmd)
-                
-            else: # otherwise set status to missing slc
-                #lq.conn.ping(reconnect=True)
-                lq.set_rslc_status(row['rslc_id'],MISSING_SLC)
-
-            try:
-                #lq.conn.ping(reconnect=True)
-                set_lotus_job_status('Cleaning {:%y-%m-%d}'.format(date))
-            except:
-                print('debug 2: error in mysql connection - common after Sep 2020 change in mysql db by JASMIN..')
-                print('but continuing')
+            rslc = os.path.join(env.actEnv,'RSLC',date.strftime('%Y%m%d'),
+                                date.strftime('%Y%m%d.rslc'))
+            rslc_epochdir = os.path.join(env.actEnv,'RSLC',date.strftime('%Y%m%d'))
+            
+            #if os.path.exists(rslc):
+            #    print("Removing mosaiced image {0}".format(rslc))
+            #    os.remove(rslc)
+
+            #Finally set rslc status to return code
+            #(buffered - if the db is not reachable now, it stays in the journal)
+            statusWriter.set_rslc_status(row['rslc_id'],rc)
+            timer.rc = rc
+            if os.path.exists(rslc_epochdir):
+                if rc!=0:
+                    print('there was an error, cleaning the (probably) wrongly generated RSLC')
+                    shutil.rmtree(rslc_epochdir)
+                else:
+                    cmd = 'create_geoctiffs_to_pub.sh -M {0} {1}'.format(env.actEnv, date.strftime('%Y%m%d'))
+                    rcc = os.system(cmd)
+            
+        else: # otherwise set status to missing slc
+            #lq.conn.ping(reconnect=True)
+            statusWriter.set_rslc_status(row['rslc_id'],MISSING_SLC)
+
+        try:
+            #lq.conn.ping(reconnect=True)
+            set_lotus_job_status('Cleaning {:%y-%m-%d}'.format(date))
+        except:
+            print('debug 2: error in mysql connection - common after Sep 2020 change in mysql db by JASMIN..')
+            print('but continuing')
 #-- -- -- -- -- -- -- -- -- -- -- -- -- -- -- -- -- -- -- -- 
-       # try:
-       #     lq.conn.ping(reconnect=True)
-       # except:
-       #     print('no reconnection to db')
-        polyID = lq.get_polyid(frameName)
-        slc = lq.get_unreq_slc_on_date(polyID,date)
-        if rc == 0 and not slc.empty:
-            slcDateCache = os.path.join(slcCache,date.strftime('%Y%m%d'))
-            shutil.rmtree(slcDateCache)
-            print("removed slc cache {:%Y%m%d}".format(date))
-            lq.set_slc_status(int(slc.loc[0,'slc_id']),-6)
+   # try:
+   #     lq.conn.ping(reconnect=True)
+   # except:
+   #     print('no reconnection to db')
+    #the slc is not needed once the rslc is built
+    #(slc statuses were read at the start, they are final for this job)
+    slcID,slcStatus = context.slcs.get(date,(None,None))
+    if rc == 0 and slcStatus == BUILT:
+        slcDateCache = os.path.join(slcCache,date.strftime('%Y%m%d'))
+        shutil.rmtree(slcDateCache)
+        print("removed slc cache {:%Y%m%d}".format(date))
+        statusWriter.set_slc_status(int(slcID),REMOVED)
+
+################################################################################
+#Job
+################################################################################
+def process_job(jobID,workers=1):
+    #all the job information incl. slcs of the epochs
+    context = lq.get_job_context(jobID)
+    if not context or context.items.empty:
+        print('no unbuilt rslcs were found in job {}'.format(jobID))
+        return
+    rslcs = context.items
+    frameName = context.frame
+    jobSetup = job_setup(context)
+    #status updates are written by a background thread, so the processing does not
+    #wait for the db (and journaled in case the db is not reachable)
+    statusWriter = lq.StatusWriter(journal=lq.get_status_journal(frameName,jobID))
+    statusWriter.catch_signals()
+#-- -- -- -- -- -- -- -- -- -- -- -- -- -- -- -- -- -- -- -- 
+    print("Processing job {0} in frame {1}".format( jobID, frameName))
+    statusWriter.set_job_started(jobID)
+
+
+#-- -- -- -- -- -- -- -- -- -- -- -- -- -- -- -- -- -- -- -- 
+    run_items(process_rslc,rslcs,jobSetup,statusWriter,workers)
                 
 #-- -- -- -- -- -- -- -- -- -- -- -- -- -- -- -- -- -- -- -- 
-    try:
-        #lq.conn.ping(reconnect=True)
-        lq.set_job_finished(jobID,3)
-    except:
-        print('error in db access')
+    statusWriter.set_job_finished(jobID,3)
+    statusWriter.flush()
+
+################################################################################
+#Main
+################################################################################
+def main(argv):
+    #Paramters
+    #(--workers N: rslcs processed in N processes, default SLURM_CPUS_PER_TASK)
+    workers = get_workers(argv)
+    #JOBID [JOBID ..] - more jobs (of any frames, e.g. of a fleet array task)
+    #are processed one after the other
+    jobIDs = [int(a) for a in argv[1:]]
+    run_jobs(lambda jobID : process_job(jobID,workers),jobIDs)
 
 if __name__ == "__main__":
     sys.exit(main(sys.argv))
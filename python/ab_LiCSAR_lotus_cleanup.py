@@ -1,8 +1,15 @@
 #!/usr/bin/env python
-from batchDBLib import set_job_finished, get_job_status
+from batchDBLib import set_job_finished, get_job_status, get_frame_from_job, get_status_journal, StatusBuffer
 import sys
+import os
 
 jobID = int(sys.argv[1])
+#write status updates that the job could not get to the database
+frameName = get_frame_from_job(jobID)
+if frameName:
+    journal = get_status_journal(frameName, jobID)
+    if journal and os.path.exists(journal):
+        StatusBuffer(journal=journal)
 jobStat = get_job_status(jobID)
 if jobStat != 3:
     set_job_finished(jobID, 9)
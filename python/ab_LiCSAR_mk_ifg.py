@@ -15,6 +15,8 @@ from LiCSAR_lib.LiCSAR_misc import *
 from LiCSAR_lib.ifg_lib import *
 from LiCSAR_lib.coreg_lib import rebuild_rslc
 from batchLSFLib import set_lotus_job_status
+from batchTimingLib import ItemTimer
+from batchWorkerLib import get_workers,run_items,run_jobs
 
 
 #to ensure GAMMA will have proper value for CPU count
@@ -54,13 +56,11 @@ class MkIfgEnv(LicsEnv):
         self.cleanDirs = ['./IFG','./tab','./GEOC'] # Directories to clean on failure
 
 ################################################################################
-#Main
+#Job setup
 ################################################################################
-def main(argv):
-    #Paramters
-    jobID = int(argv[1])
-    ifgs = lq.get_unbuilt_ifgs(jobID)
-    frameName = lq.get_frame_from_job(jobID)
+def job_setup(context):
+    #what process_ifg needs besides the ifg (the same for all ifgs of the job)
+    frameName = context.frame
     try:
         cacheDir = os.environ['BATCH_CACHE_DIR']
     except KeyError as error:
@@ -71,59 +71,106 @@ def main(argv):
     #user = os.environ['USER']
     #tempDir = os.path.join(tempDir,user)
     tempDir = os.environ['LiCSAR_temp']
-    mstrDate = lq.get_master(frameName)
+    mstrDate = context.master
+    #Parse multi look options
+    slcCache = os.path.join(cacheDir,frameName,'SLC')
+    rglks = int(grep1('range_looks',os.path.join(slcCache,mstrDate.strftime('%Y%m%d/%Y%m%d.slc.mli.par'))).split(':')[1].strip())
+    aglks = int(grep1('azimuth_looks',os.path.join(slcCache,mstrDate.strftime('%Y%m%d/%Y%m%d.slc.mli.par'))).split(':')[1].strip())
+    return {'jobID':context.job_id,'frameName':frameName,'context':context,
+            'cacheDir':cacheDir,'tempDir':tempDir,'mstrDate':mstrDate,
+            'rglks':rglks,'aglks':aglks}
 
+################################################################################
+#Process ifg
+################################################################################
+def process_ifg(row,jobSetup,statusWriter):
+    jobID = jobSetup['jobID']
+    frameName = jobSetup['frameName']
+    context = jobSetup['context']
+    mstrDate = jobSetup['mstrDate']
+    dateA = row['acq_date_1']
+    dateB = row['acq_date_2']
+
+    #multi look options (of the master, read in main)
+    gc.rglks = jobSetup['rglks']
+    gc.aglks = jobSetup['aglks']
+
+    set_lotus_job_status('Setting up {:%y-%m-%d}->{:%y-%m-%d}'.format(dateA, dateB))
 #-- -- -- -- -- -- -- -- -- -- -- -- -- -- -- -- -- -- -- -- 
-    print("Processing job {0} in frame {1}".format( jobID, frameName))
-    lq.set_job_started(jobID)
+    with ItemTimer(statusWriter,context,'mk_ifg',row['ifg_id'],gc.rglks,gc.aglks) as timer, \
+            MkIfgEnv(jobID,frameName,mstrDate,dateA,dateB,jobSetup['cacheDir'],jobSetup['tempDir']) as env:
+        print("created new processing enviroement {}".format(env.actEnv))
+        print("processing ifg {0} between dates {1:%Y%m%d} and {2:%Y%m%d}".format(
+                row['ifg_id'],dateA,dateB))
+
+        #Set failure status
+        env.cleanHook = lambda : statusWriter.set_ifg_status(row['ifg_id'],EXCEPTION)
+        env.statusBuffer = statusWriter
+        env.timer = timer
+
+        statusWriter.set_ifg_status(row['ifg_id'],BUILDING) #building status
+        #If source slc was succesfully copied over
+        if os.path.exists(env.srcRSLCAPath) \
+            and os.path.exists(env.srcRSLCBPath):
+
+            set_lotus_job_status('Rebuilding RSLC {:%Y-%m-%d}'.format(dateA))
+            rcA = rebuild_rslc('.',dateA,mstrDate,gc.rglks,gc.aglks)
+            set_lotus_job_status('Rebuilding RSLC {:%Y-%m-%d}'.format(dateA))
+            rcB = rebuild_rslc('.',dateB,mstrDate,gc.rglks,gc.aglks)
+
+        else:
+            rcA = None
+            rcB = None
+
+        if (rcA==0 or rcA==3) and (rcB==0 or rcB==3):
+            set_lotus_job_status('Building {:%y-%m-%d}->{:%y-%m-%d}'.format(dateA, dateB))
+            rc = make_interferogram(mstrDate,dateA,dateB,'.',lq,-1)
+            #Finally set ifg status to return code
+            statusWriter.set_ifg_status(row['ifg_id'],rc)
+            timer.rc = rc
+
+        else: # otherwise set status to missing rslc
+            statusWriter.set_ifg_status(row['ifg_id'],MISSING_RSLC)
+
+        set_lotus_job_status('Cleaning {:%y-%m-%d}->{:%y-%m-%d}'.format(dateA, dateB))
 
-#-- -- -- -- -- -- -- -- -- -- -- -- -- -- -- -- -- -- -- -- 
-    for ind,row in ifgs.iterrows():
-        
-        dateA = row['acq_date_1']
-        dateB = row['acq_date_2']
+################################################################################
+#Job
+################################################################################
+def process_job(jobID,workers=1):
+    context = lq.get_job_context(jobID)
+    if not context or context.items.empty:
+        print('no unbuilt ifgs were found in job {}'.format(jobID))
+        return
+    ifgs = context.items
+    frameName = context.frame
+    jobSetup = job_setup(context)
+    #status updates are written by a background thread, so the processing does not
+    #wait for the db (and journaled in case the db is not reachable)
+    statusWriter = lq.StatusWriter(journal=lq.get_status_journal(frameName,jobID))
+    statusWriter.catch_signals()
 
-        #Parse multi look options
-        slcCache = os.path.join(cacheDir,frameName,'SLC')
-        gc.rglks = int(grep1('range_looks',os.path.join(slcCache,mstrDate.strftime('%Y%m%d/%Y%m%d.slc.mli.par'))).split(':')[1].strip())
-        gc.aglks = int(grep1('azimuth_looks',os.path.join(slcCache,mstrDate.strftime('%Y%m%d/%Y%m%d.slc.mli.par'))).split(':')[1].strip())
+#-- -- -- -- -- -- -- -- -- -- -- -- -- -- -- -- -- -- -- -- 
+    print("Processing job {0} in frame {1}".format( jobID, frameName))
+    statusWriter.set_job_started(jobID)
 
-        set_lotus_job_status('Setting up {:%y-%m-%d}->{:%y-%m-%d}'.format(dateA, dateB))
 #-- -- -- -- -- -- -- -- -- -- -- -- -- -- -- -- -- -- -- -- 
-        with MkIfgEnv(jobID,frameName,mstrDate,dateA,dateB,cacheDir,tempDir) as env:
-            print("created new processing enviroement {}".format(env.actEnv))
-            print("processing ifg {0} between dates {1:%Y%m%d} and {2:%Y%m%d}".format(
-                    row['ifg_id'],dateA,dateB))
-
-            #Set failure status
-            env.cleanHook = lambda : lq.set_ifg_status(row['ifg_id'],EXCEPTION)
-
-            lq.set_ifg_status(row['ifg_id'],BUILDING) #building status
-            #If source slc was succesfully copied over
-            if os.path.exists(env.srcRSLCAPath) \
-                and os.path.exists(env.srcRSLCBPath):
-
-                set_lotus_job_status('Rebuilding RSLC {:%Y-%m-%d}'.format(dateA))
-                rcA = rebuild_rslc('.',dateA,mstrDate,gc.rglks,gc.aglks)
-                set_lotus_job_status('Rebuilding RSLC {:%Y-%m-%d}'.format(dateA))
-                rcB = rebuild_rslc('.',dateB,mstrDate,gc.rglks,gc.aglks)
-
-            else:
-                rcA = None
-                rcB = None
-
-            if (rcA==0 or rcA==3) and (rcB==0 or rcB==3):
-                set_lotus_job_status('Building {:%y-%m-%d}->{:%y-%m-%d}'.format(dateA, dateB))
-                rc = make_interferogram(mstrDate,dateA,dateB,'.',lq,-1)
-                #Finally set ifg status to return code
-                lq.set_ifg_status(row['ifg_id'],rc)
-
-            else: # otherwise set status to missing rslc
-                lq.set_ifg_status(row['ifg_id'],MISSING_RSLC)
-
-            set_lotus_job_status('Cleaning {:%y-%m-%d}->{:%y-%m-%d}'.format(dateA, dateB))
+    run_items(process_ifg,ifgs,jobSetup,statusWriter,workers)
 #-- -- -- -- -- -- -- -- -- -- -- -- -- -- -- -- -- -- -- -- 
-    lq.set_job_finished(jobID,3)
+    statusWriter.set_job_finished(jobID,3)
+    statusWriter.flush()
+
+################################################################################
+#Main
+################################################################################
+def main(argv):
+    #Paramters
+    #(--workers N: ifgs processed in N processes, default SLURM_CPUS_PER_TASK)
+    workers = get_workers(argv)
+    #JOBID [JOBID ..] - more jobs (of any frames, e.g. of a fleet array task)
+    #are processed one after the other
+    jobIDs = [int(a) for a in argv[1:]]
+    run_jobs(lambda jobID : process_job(jobID,workers),jobIDs)
 
 if __name__ == "__main__":
     sys.exit(main(sys.argv))
@@ -14,6 +14,8 @@ import re
 from LiCSAR_lib.mk_imag_lib import *
 from LiCSAR_lib.LiCSAR_misc import *
 from batchLSFLib import set_lotus_job_status
+from batchTimingLib import ItemTimer
+from batchWorkerLib import get_workers,run_items,run_jobs
 
 #to ensure GAMMA will have proper value for CPU count
 #however i had to force processing on 1 core only, so hardcoding here
@@ -63,16 +65,11 @@ def check_all_files_on_disk(files):
     return missing,set(missingFiles)
 
 ################################################################################
-#Main
+#Job setup
 ################################################################################
-def main(argv):
-    #Paramters
-    jobID = int(argv[1])
-    slcs = lq.get_unbuilt_slcs(jobID)
-    if slcs.empty:
-        print('no unbuilt slcs were found. exiting')
-        exit()
-    frameName = lq.get_frame_from_job(jobID)
+def job_setup(context):
+    #what process_slc needs besides the slc (the same for all slcs of the job)
+    frameName = context.frame
     #get acquisition mode - default is 'iw'
     acqMode = 'iw'
     if frameName.split('_')[1] == 'SM':
@@ -88,62 +85,107 @@ def main(argv):
     #user = os.environ['USER']
     #tempDir = os.path.join(tempDir,user)
     tempDir = os.environ['LiCSAR_temp']
-    burstlist = lq.get_bursts_in_frame(frameName)
+    return {'jobID':context.job_id,'frameName':frameName,'context':context,
+            'cacheDir':cacheDir,'tempDir':tempDir,
+            'burstlist':list(context.bursts),'acqMode':acqMode}
+
+################################################################################
+#Process slc
+################################################################################
+def process_slc(row,jobSetup,statusWriter):
+    jobID = jobSetup['jobID']
+    frameName = jobSetup['frameName']
+    context = jobSetup['context']
+    burstlist = jobSetup['burstlist']
+    date = row['acq_date']
+    filesTable,imburstlist = context.epochs[date]
+    files = [f[2] for f in filesTable]
+    missing,missingFiles = check_all_files_on_disk(files)
+#-- -- -- -- -- -- -- -- -- -- -- -- -- -- -- -- -- -- -- -- 
+    if missing:
+        print("Missing files for date {:%Y%m%d}".format(date))
+        statusWriter.set_slc_status(row['slc_id'],FILES_MISSING)
+        with open('missingFiles','a') as f:
+            for missFile in missingFiles:
+                f.write(missFile+'\n')
+#-- -- -- -- -- -- -- -- -- -- -- -- -- -- -- -- -- -- -- -- 
+    else:
+        set_lotus_job_status('Setting up {:%y-%m-%d}'.format(date))
+        with ItemTimer(statusWriter,context,'mk_image',row['slc_id']) as timer, \
+                SlcEnv(jobID,frameName,date,jobSetup['cacheDir'],jobSetup['tempDir']) as env:
+            print("created new processing environment {}".format(env.actEnv))
+            print("processing slc {0} on acquisition date {1:%Y%m%d}".format(
+                    row['slc_id'],row['acq_date']))
+
+            set_lotus_job_status('Processing {:%y-%m-%d}'.format(date))
+            env.cleanHook = lambda : statusWriter.set_slc_status(row['slc_id'],UNKOWN_ERROR)
+            env.statusBuffer = statusWriter
+            env.timer = timer
+
+            #Check that we have no missing bursts
+            imburstlist = list(imburstlist)
+            missingbursts = [b for b in burstlist if not b in imburstlist]
+            if not missingbursts or not check_missing_bursts(burstlist,missingbursts) or not check_missing_bursts_bool:
+                print('List of missing bursts:')
+                print(missingbursts)
+                #we will relax the condition here and checking for only critical missing bursts
+                #if not check_missing_bursts(burstlist,missingbursts):
+                print("All necessary bursts for frame {0} seem to be have been acquired "\
+                        "on {1}...".format(frameName,date))
+                statusWriter.set_slc_status(row['slc_id'],BUILDING) #building....
+                rc = make_frame_image(date,frameName,imburstlist,env.actEnv, lq, -1, jobSetup['acqMode'])
+                statusWriter.set_slc_status(row['slc_id'],rc)
+                timer.rc = rc
+                if rc!=0:
+                    shutil.rmtree('./SLC')
+            else:
+                print("Missing bursts for date {:%Y%m%d}".format(date))
+                statusWriter.set_slc_status(row['slc_id'],MISSING_BURSTS)
+            set_lotus_job_status('Cleaning {:%y-%m-%d}'.format(date))
+
+################################################################################
+#Job
+################################################################################
+def process_job(jobID,workers=1):
+    #all the job information incl. files and bursts of each epoch
+    context = lq.get_job_context(jobID)
+    if not context or context.items.empty:
+        print('no unbuilt slcs were found in job {}'.format(jobID))
+        return
+    slcs = context.items
+    frameName = context.frame
+    jobSetup = job_setup(context)
+    #status updates are written by a background thread, so the processing does not
+    #wait for the db (and journaled in case the db is not reachable)
+    statusWriter = lq.StatusWriter(journal=lq.get_status_journal(frameName,jobID))
+    statusWriter.catch_signals()
 
 #-- -- -- -- -- -- -- -- -- -- -- -- -- -- -- -- -- -- -- -- 
     print("Processing job {0} in frame {1}".format(
             jobID,frameName))
-    lq.set_job_started(jobID)
+    statusWriter.set_job_started(jobID)
 
 #-- -- -- -- -- -- -- -- -- -- -- -- -- -- -- -- -- -- -- -- 
     if os.path.exists('missingFiles'):
         os.remove('missingFiles')
     
-    for ind,row in slcs.iterrows():
-        date = row['acq_date']
-        filesTable = lq.get_frame_files_date(frameName,date)
-        files = [f[2] for f in filesTable]
-        missing,missingFiles = check_all_files_on_disk(files)
-#-- -- -- -- -- -- -- -- -- -- -- -- -- -- -- -- -- -- -- -- 
-        if missing:
-            print("Missing files for date {:%Y%m%d}".format(date))
-            lq.set_slc_status(row['slc_id'],FILES_MISSING)
-            with open('missingFiles','a') as f:
-                for missFile in missingFiles:
-                    f.write(missFile+'\n')
-#-- -- -- -- -- -- -- -- -- -- -- -- -- -- -- -- -- -- -- -- 
-        else:
-            set_lotus_job_status('Setting up {:%y-%m-%d}'.format(date))
-            with SlcEnv(jobID,frameName,date,cacheDir,tempDir) as env:
-                print("created new processing environment {}".format(env.actEnv))
-                print("processing slc {0} on acquisition date {1:%Y%m%d}".format(
-                        row['slc_id'],row['acq_date']))
-
-                set_lotus_job_status('Processing {:%y-%m-%d}'.format(date))
-                env.cleanHook = lambda : lq.set_slc_status(row['slc_id'],UNKOWN_ERROR)
-
-                #Check that we have no missing bursts
-                imburstlist = lq.get_frame_bursts_on_date(frameName,date)
-                missingbursts = [b for b in burstlist if not b in imburstlist]
-                if not missingbursts or not check_missing_bursts(burstlist,missingbursts) or not check_missing_bursts_bool:
-                    print('List of missing bursts:')
-                    print(missingbursts)
-                    #we will relax the condition here and checking for only critical missing bursts
-                    #if not check_missing_bursts(burstlist,missingbursts):
-                    print("All necessary bursts for frame {0} seem to be have been acquired "\
-                            "on {1}...".format(frameName,date))
-                    lq.set_slc_status(row['slc_id'],BUILDING) #building....
-                    rc = make_frame_image(date,frameName,imburstlist,env.actEnv, lq, -1, acqMode)
-                    lq.set_slc_status(row['slc_id'],rc)
-                    if rc!=0:
-                        shutil.rmtree('./SLC')
-                else:
-                    print("Missing bursts for date {:%Y%m%d}".format(date))
-                    lq.set_slc_status(row['slc_id'],MISSING_BURSTS)
-                set_lotus_job_status('Cleaning {:%y-%m-%d}'.format(date))
+    run_items(process_slc,slcs,jobSetup,statusWriter,workers)
 
 #-- -- -- -- -- -- -- -- -- -- -- -- -- -- -- -- -- -- -- -- 
-    lq.set_job_finished(jobID,3)
+    statusWriter.set_job_finished(jobID,3)
+    statusWriter.flush()
+
+################################################################################
+#Main
+################################################################################
+def main(argv):
+    #Paramters
+    #(--workers N: slcs processed in N processes, default SLURM_CPUS_PER_TASK)
+    workers = get_workers(argv)
+    #JOBID [JOBID ..] - more jobs (of any frames, e.g. of a fleet array task)
+    #are processed one after the other
+    jobIDs = [int(a) for a in argv[1:]]
+    run_jobs(lambda jobID : process_job(jobID,workers),jobIDs)
 
 if __name__ == "__main__":
     sys.exit(main(sys.argv))
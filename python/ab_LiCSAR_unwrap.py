@@ -15,6 +15,8 @@ import re
 from LiCSAR_lib.LiCSAR_misc import *
 from LiCSAR_lib.unwrp_lib import *
 from batchLSFLib import set_lotus_job_status
+from batchTimingLib import ItemTimer
+from batchWorkerLib import get_workers,run_items,run_jobs
 
 
 #to ensure GAMMA will have proper value for CPU count
@@ -68,13 +70,11 @@ else:
 
 
 ################################################################################
-#Main
+#Job setup
 ################################################################################
-def main(argv):
-    #Paramters
-    jobID = int(argv[1])
-    unws = lq.get_unbuilt_unws(jobID)
-    frameName = lq.get_frame_from_job(jobID)
+def job_setup(context):
+    #what process_unw needs besides the unw (the same for all unws of the job)
+    frameName = context.frame
     try:
         cacheDir = os.environ['BATCH_CACHE_DIR']
     except KeyError as error:
@@ -85,62 +85,109 @@ def main(argv):
     #user = os.environ['USER']
     #tempDir = os.path.join(tempDir,user)
     tempDir = os.environ['LiCSAR_temp']
-    mstrDate = lq.get_master(frameName)
+    mstrDate = context.master
+    #Parse multi look options
+    slcCache = os.path.join(cacheDir,frameName,'SLC')
+    rglks = int(grep1('range_looks',os.path.join(slcCache,mstrDate.strftime('%Y%m%d/%Y%m%d.slc.mli.par'))).split(':')[1].strip())
+    aglks = int(grep1('azimuth_looks',os.path.join(slcCache,mstrDate.strftime('%Y%m%d/%Y%m%d.slc.mli.par'))).split(':')[1].strip())
+    return {'jobID':context.job_id,'frameName':frameName,'context':context,
+            'cacheDir':cacheDir,'tempDir':tempDir,'mstrDate':mstrDate,
+            'rglks':rglks,'aglks':aglks}
 
+################################################################################
+#Process unw
+################################################################################
+def process_unw(row,jobSetup,statusWriter):
+    jobID = jobSetup['jobID']
+    frameName = jobSetup['frameName']
+    context = jobSetup['context']
+    mstrDate = jobSetup['mstrDate']
+    dateA = row['acq_date_1']
+    dateB = row['acq_date_2']
+
+    #multi look options (of the master, read in main)
+    gc.rglks = jobSetup['rglks']
+    gc.aglks = jobSetup['aglks']
+
+    set_lotus_job_status('Setting up {:%y-%m-%d}->{:%y-%m-%d}'.format(dateA, dateB))
 #-- -- -- -- -- -- -- -- -- -- -- -- -- -- -- -- -- -- -- -- 
-    print("Processing job {0} in frame {1}".format( jobID, frameName))
-    lq.set_job_started(jobID)
+    with ItemTimer(statusWriter,context,'unwrap',row['unw_id'],gc.rglks,gc.aglks) as timer, \
+            UnwrapEnv(jobID,frameName,mstrDate,dateA,dateB,jobSetup['cacheDir'],jobSetup['tempDir']) as env:
+        print("created new processing enviroement {}".format(env.actEnv))
+        print("processing ifg {0} between dates {1:%Y%m%d} and {2:%Y%m%d}".format(
+                row['unw_id'],dateA,dateB))
+
+        #Set failure status
+        env.cleanHook = lambda : statusWriter.set_unw_status(row['unw_id'],EXCEPTION)
+        env.statusBuffer = statusWriter
+        env.timer = timer
+
+        #If source slc was succesfully copied over
+        if os.path.exists(env.srcIFGPath):
+            ifgName = '{0:%Y%m%d}_{1:%Y%m%d}'.format(dateA,dateB)
+            statusWriter.set_unw_status(row['unw_id'],BUILDING) #building status
+            set_lotus_job_status('Building {:%y-%m-%d}->{:%y-%m-%d}'.format(dateA, dateB))
+            if not unwrap_in_geo:
+                rc = do_unwrapping(mstrDate.strftime('%Y%m%d'),ifgName,'./IFG','.',lq,-1)
+                if rc == 0:
+                    ifgPerc = get_ifg_perc_unwrapd(dateA,dateB)
+                    statusWriter.set_unw_perc_unwrpd(row['unw_id'],ifgPerc)
+            else:
+                rc = unwrap_geo(os.getcwd(), frameName, ifgName)
+                #if rc == 0:
+                #    ifgPerc = get_ifg_perc_unwrapd(dateA,dateB)
+                #    statusWriter.set_unw_perc_unwrpd(row['unw_id'],ifgPerc)
+            #Finally set ifg status to return code
+            statusWriter.set_unw_status(row['unw_id'],rc)
+            timer.rc = rc
+
+            if not unwrap_in_geo:
+                if rc == 0:
+                    ifgPerc = get_ifg_perc_unwrapd(dateA,dateB)
+                    statusWriter.set_unw_perc_unwrpd(row['unw_id'],ifgPerc)
+
+        else: # otherwise set status to missing rslc
+            statusWriter.set_unw_status(row['unw_id'],MISSING_IFG)
+            
+        set_lotus_job_status('Cleaning {:%y-%m-%d}->{:%y-%m-%d}'.format(dateA, dateB))
 
-#-- -- -- -- -- -- -- -- -- -- -- -- -- -- -- -- -- -- -- -- 
-    for ind,row in unws.iterrows():
-        
-        dateA = row['acq_date_1']
-        dateB = row['acq_date_2']
+################################################################################
+#Job
+################################################################################
+def process_job(jobID,workers=1):
+    context = lq.get_job_context(jobID)
+    if not context or context.items.empty:
+        print('no unbuilt unws were found in job {}'.format(jobID))
+        return
+    unws = context.items
+    frameName = context.frame
+    jobSetup = job_setup(context)
+    #status updates are written by a background thread, so the processing does not
+    #wait for the db (and journaled in case the db is not reachable)
+    statusWriter = lq.StatusWriter(journal=lq.get_status_journal(frameName,jobID))
+    statusWriter.catch_signals()
 
-        #Parse multi look options
-        slcCache = os.path.join(cacheDir,frameName,'SLC')
-        gc.rglks = int(grep1('range_looks',os.path.join(slcCache,mstrDate.strftime('%Y%m%d/%Y%m%d.slc.mli.par'))).split(':')[1].strip())
-        gc.aglks = int(grep1('azimuth_looks',os.path.join(slcCache,mstrDate.strftime('%Y%m%d/%Y%m%d.slc.mli.par'))).split(':')[1].strip())
+#-- -- -- -- -- -- -- -- -- -- -- -- -- -- -- -- -- -- -- -- 
+    print("Processing job {0} in frame {1}".format( jobID, frameName))
+    statusWriter.set_job_started(jobID)
 
-        set_lotus_job_status('Setting up {:%y-%m-%d}->{:%y-%m-%d}'.format(dateA, dateB))
 #-- -- -- -- -- -- -- -- -- -- -- -- -- -- -- -- -- -- -- -- 
-        with UnwrapEnv(jobID,frameName,mstrDate,dateA,dateB,cacheDir,tempDir) as env:
-            print("created new processing enviroement {}".format(env.actEnv))
-            print("processing ifg {0} between dates {1:%Y%m%d} and {2:%Y%m%d}".format(
-                    row['unw_id'],dateA,dateB))
-
-            #Set failure status
-            env.cleanHook = lambda : lq.set_unw_status(row['unw_id'],EXCEPTION)
-
-            #If source slc was succesfully copied over
-            if os.path.exists(env.srcIFGPath):
-                ifgName = '{0:%Y%m%d}_{1:%Y%m%d}'.format(dateA,dateB)
-                lq.set_unw_status(row['unw_id'],BUILDING) #building status
-                set_lotus_job_status('Building {:%y-%m-%d}->{:%y-%m-%d}'.format(dateA, dateB))
-                if not unwrap_in_geo:
-                    rc = do_unwrapping(mstrDate.strftime('%Y%m%d'),ifgName,'./IFG','.',lq,-1)
-                    if rc == 0:
-                        ifgPerc = get_ifg_perc_unwrapd(dateA,dateB)
-                        lq.set_unw_perc_unwrpd(row['unw_id'],ifgPerc)
-                else:
-                    rc = unwrap_geo(os.getcwd(), frameName, ifgName)
-                    #if rc == 0:
-                    #    ifgPerc = get_ifg_perc_unwrapd(dateA,dateB)
-                    #    lq.set_unw_perc_unwrpd(row['unw_id'],ifgPerc)
-                #Finally set ifg status to return code
-                lq.set_unw_status(row['unw_id'],rc)
-
-                if not unwrap_in_geo:
-                    if rc == 0:
-                        ifgPerc = get_ifg_perc_unwrapd(dateA,dateB)
-                        lq.set_unw_perc_unwrpd(row['unw_id'],ifgPerc)
-
-            else: # otherwise set status to missing rslc
-                lq.set_unw_status(row['unw_id'],MISSING_IFG)
-                
-            set_lotus_job_status('Cleaning {:%y-%m-%d}->{:%y-%m-%d}'.format(dateA, dateB))
+    run_items(process_unw,unws,jobSetup,statusWriter,workers)
 #-- -- -- -- -- -- -- -- -- -- -- -- -- -- -- -- -- -- -- -- 
-    lq.set_job_finished(jobID,3)
+    statusWriter.set_job_finished(jobID,3)
+    statusWriter.flush()
+
+################################################################################
+#Main
+################################################################################
+def main(argv):
+    #Paramters
+    #(--workers N: unws processed in N processes, default SLURM_CPUS_PER_TASK)
+    workers = get_workers(argv)
+    #JOBID [JOBID ..] - more jobs (of any frames, e.g. of a fleet array task)
+    #are processed one after the other
+    jobIDs = [int(a) for a in argv[1:]]
+    run_jobs(lambda jobID : process_job(jobID,workers),jobIDs)
 
 if __name__ == "__main__":
     sys.exit(main(sys.argv))
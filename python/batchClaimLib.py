@@ -0,0 +1,102 @@
+################################################################################
+# Imports
+################################################################################
+import threading
+import traceback
+import socket
+import uuid
+import time
+import os
+import batchDBLib as lq
+
+# pull based processing of a frame stage - the worker loop of claimWorker.py.
+# the worker claims the next claimable item (batchDBLib, Work claiming),
+# keeps its lease alive while processing it and releases it when done. it
+# stops when nothing is claimable and nothing is claimed in the stage and the
+# stages before it, i.e. no more items of the stage can get ready
+
+################################################################################
+#Worker
+################################################################################
+stageOrder = sorted(lq.jobTypes,key=lq.jobTypes.get)
+
+def new_token():
+    return uuid.uuid4().hex
+
+def worker_name():
+    #host:pid (and the slurm array task), to see who holds a claim
+    name = '{}:{}'.format(socket.gethostname(),os.getpid())
+    if 'SLURM_ARRAY_JOB_ID' in os.environ:
+        name += ':{}_{}'.format(os.environ['SLURM_ARRAY_JOB_ID'],
+                                os.environ.get('SLURM_ARRAY_TASK_ID',''))
+    return name[:64]
+
+class LeaseKeeper():
+    #renews the leases of the token every lease/3 [s] in a background thread:
+    #   with LeaseKeeper(token,lease):
+    #       ... process the claimed item
+    #lost is set if the claim was taken over (the lease expired meanwhile,
+    #e.g. the db was not reachable for too long) - the item may then be
+    #processed twice, the later status wins
+    def __init__(self,token,lease=lq.claimLease):
+        self.token = token
+        self.lease = lease
+        self.lost = False
+        self.stop = threading.Event()
+
+    def run(self):
+        while not self.stop.wait(self.lease/3.):
+            try:
+                if not lq.renew_claims(self.token,self.lease):
+                    self.lost = True
+                    print('warning, the claim was lost - another worker may process the item')
+            except Exception as e:
+                print('warning, could not renew the claim: {}'.format(e))
+
+    def __enter__(self):
+        self.thread = threading.Thread(target=self.run,daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self,*args):
+        self.stop.set()
+        self.thread.join()
+
+def run_claims(polyid,jobType,processClaimed,token=None,lease=lq.claimLease,
+               maxItems=None,maxIdle=None,pollWait=60):
+    #claims and processes (processClaimed(itemId)) the items of the frame stage
+    #one after the other, until no more items can get ready, maxItems were
+    #processed or nothing could be claimed for maxIdle [s]. while the earlier
+    #stages are still processed, it checks every pollWait [s] for new
+    #claimable items. returns the number of processed items
+    token = token or new_token()
+    worker = worker_name()
+    stages = stageOrder[:stageOrder.index(jobType)+1]
+    done = 0
+    idleSince = None
+    while maxItems is None or done < maxItems:
+        itemId = lq.claim_item(polyid,jobType,token,worker,lease)
+        if itemId is None:
+            claimable,claimed = lq.get_claim_activity(polyid,stages)
+            if not claimable and not claimed:
+                break
+            idleSince = idleSince or time.time()
+            if maxIdle is not None and time.time()-idleSince > maxIdle:
+                print('nothing to claim for {} s, stopping'.format(maxIdle))
+                break
+            time.sleep(pollWait)
+            continue
+        idleSince = None
+        print('claimed {} {}'.format(lq.jobKinds[jobType],itemId))
+        try:
+            with LeaseKeeper(token,lease):
+                processClaimed(itemId)
+        except Exception:
+            #(the item status is set by the env cleanup) - go on with the next one
+            print('error processing {} {}:\n{}'.format(lq.jobKinds[jobType],itemId,
+                    traceback.format_exc()))
+        #(not on SystemExit/KeyboardInterrupt - a killed worker leaves the claim
+        #to expire, so that the item is claimed again)
+        lq.release_claim(jobType,itemId,token)
+        done += 1
+    return done
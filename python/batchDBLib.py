@@ -4,69 +4,329 @@
 #imports
 ################################################################################
 import pandas as pd
-from sqlalchemy import create_engine,MetaData,Table,select,insert,update,func,delete,between,bindparam
+from sqlalchemy import create_engine,MetaData,Table,select,insert,update,func,delete,between,bindparam,\
+                    literal,null,union_all,case
 from sqlalchemy.sql import and_, or_
 from sqlalchemy.engine.reflection import Inspector
 import sys
+import os
+import re
+import json
+import pickle
+import time
+import atexit
+import signal
+import threading
 import datetime as dt
 from configLib import config
 import numpy as np
+from batchNetworkLib import nearest_pairs
+from batchPackLib import estimate_costs,pack_lpt,pack_contiguous,pack_windows,\
+                    window_starts,window_index,routinePriority,maxJobHours,maxJobItems
+from batchTimingLib import ResourcePredictor
+import functools
+from collections import namedtuple
+from types import MappingProxyType
+from sqlalchemy.exc import SQLAlchemyError,OperationalError,InterfaceError,IntegrityError
 
-#this is a residual to trick batch processing - must be kept
-from LiCSAR_db.LiCSquery import get_ipf
 from sqlalchemy.pool import NullPool
 
 ################################################################################
 # Create SQL engine
 ################################################################################
-engine = create_engine(
-    #'mysql+pymysql://{usr}:{psswd}@{hst}/{dbname}?charset=utf8'.format(
-    #'mysql+pymysql://{usr}:{psswd}@{hst}/{dbname}'.format(
-    'mysql+pymysql://{usr}:{psswd}@{hst}/{dbname}?charset=utf8mb3'.format(
-        usr=config.get('DB','User'),
-        psswd=config.get('DB','Password'),
-        hst=config.get('DB','Host'),
-        dbname=config.get('DB','DBName'),
-        ),
-    poolclass=NullPool,
-    #connect_args={'connect_timeout': 60*60*24},  # using 24 hours timeout - coreg may take so long. still weird, as i close and reopen connection, but.. ok.. whatever
-    pool_pre_ping=True,
-    future=True
-    )
+# the pooling mode is set in the [DB] section of FRAME_BATCH_CONFIG:
+#   Pooling: null   .... (default) new connection for every query
+#   Pooling: queue  .... small pool of persistent connections, options:
+#   PoolSize: 2, PoolMaxOverflow: 2 .... connections kept/extra
+#   PoolRecycle: 240 .... [s] reopen older connections - keep it below the idle
+#                         timeout of the db server (JASMIN drops idle connections)
+def make_engine(pooling=None):
+    if not pooling:
+        pooling = config.get('DB','Pooling',fallback='null')
+    dbUrl = 'mysql+pymysql://{usr}:{psswd}@{hst}/{dbname}?charset=utf8mb3'.format(
+        #'mysql+pymysql://{usr}:{psswd}@{hst}/{dbname}?charset=utf8'.format(
+        #'mysql+pymysql://{usr}:{psswd}@{hst}/{dbname}'.format(
+            usr=config.get('DB','User'),
+            psswd=config.get('DB','Password'),
+            hst=config.get('DB','Host'),
+            dbname=config.get('DB','DBName'),
+            )
+    if pooling == 'queue':
+        return create_engine(dbUrl,
+            pool_size=config.getint('DB','PoolSize',fallback=2),
+            max_overflow=config.getint('DB','PoolMaxOverflow',fallback=2),
+            pool_recycle=config.getint('DB','PoolRecycle',fallback=240),
+            pool_pre_ping=True,
+            future=True
+            )
+    return create_engine(dbUrl,
+        poolclass=NullPool,
+        #connect_args={'connect_timeout': 60*60*24},  # using 24 hours timeout - coreg may take so long. still weird, as i close and reopen connection, but.. ok.. whatever
+        pool_pre_ping=True,
+        future=True
+        )
+
+engine = make_engine()
+#close pooled connections properly at exit
+atexit.register(lambda : engine.dispose())
+
+################################################################################
+# Reconnect on failure
+################################################################################
+reconnectAttempts = config.getint('DB','ReconnectAttempts',fallback=4)
+reconnectWait = 5
+
+def reconnecting(func):
+    #repeats the db call if the connection failed or was dropped, with a fresh pool
+    #(use only for reads and for updates that are safe to repeat)
+    @functools.wraps(func)
+    def wrapper(*args,**kwargs):
+        for attempt in range(reconnectAttempts):
+            try:
+                return func(*args,**kwargs)
+            except (OperationalError,InterfaceError) as e:
+                if attempt == reconnectAttempts-1:
+                    raise
+                print('db connection problem in {}, reconnecting: {}'.format(func.__name__,e))
+                engine.dispose()
+                time.sleep(reconnectWait*(attempt+1))
+    return wrapper
 
 ################################################################################
 # Create table meta data
 ################################################################################
+# the tables are reflected on first use (not at import) and the reflected
+# schema is cached on disk (per db host/name and schemaVersion), so short
+# processes start without the reflection round trips. the cache dir can be set
+# by SchemaCacheDir in the [DB] section, 'SchemaCache: no' switches it off.
+# a cached schema without some of the optional tables/columns (a migration not
+# done when it was reflected) is reflected again once it is older than
+# SchemaRecheckMinutes (default 10), so the migrations are picked up
+schemaVersion = 7  # increase with every change of the batch tables (sql/migration_*.sql)
+tableNames = ['jobs','polygs','polygs2master','files','files2bursts','polygs2bursts',
+              'slc','rslc','ifg','unw','acq_img','bursts']
+#tables and columns used only if they exist (i.e. the migration was done)
+optionalTables = ['frame_progress','item_timing','item_claim','item_retry']
+optionalColumns = {'jobs':['priority'],'slc':['priority'],'rslc':['priority'],
+                   'ifg':['priority'],'unw':['priority'],'item_timing':['error']}
 licsMeta = MetaData()
 
-jobs = Table('jobs',licsMeta)
-polygs = Table('polygs',licsMeta)
-polygs2master = Table('polygs2master',licsMeta)
-files = Table('files',licsMeta)
-files2bursts = Table('files2bursts',licsMeta)
-polygs2bursts = Table('polygs2bursts',licsMeta)
-slc = Table('slc',licsMeta)
-rslc = Table('rslc',licsMeta)
-ifg = Table('ifg',licsMeta)
-unw = Table('unw',licsMeta)
-acq_img = Table('acq_img',licsMeta)
-bursts = Table('bursts',licsMeta)
-
-insp = Inspector.from_engine(engine)
-insp.reflect_table(jobs,None)
-insp.reflect_table(polygs,None)
-insp.reflect_table(files,None)
-insp.reflect_table(files2bursts,None)
-insp.reflect_table(polygs2bursts,None)
-insp.reflect_table(polygs2master,None)
-insp.reflect_table(slc,None)
-insp.reflect_table(rslc,None)
-insp.reflect_table(ifg,None)
-insp.reflect_table(unw,None)
-insp.reflect_table(acq_img,None)
-insp.reflect_table(bursts,None)
+def get_schema_cache():
+    if not config.getboolean('DB','SchemaCache',fallback=True):
+        return None
+    cacheDir = config.get('DB','SchemaCacheDir',
+            fallback=os.path.join(os.path.expanduser('~'),'.cache','licsar_framebatch'))
+    cacheName = 'schema_{}_{}_v{}.pickle'.format(config.get('DB','Host'),
+                    config.get('DB','DBName'),schemaVersion)
+    return os.path.join(cacheDir,re.sub(r'[^\w.-]','_',cacheName))
+
+def reflect_schema():
+    meta = MetaData()
+    insp = Inspector.from_engine(engine)
+    for tableName in tableNames+[t for t in optionalTables if insp.has_table(t)]:
+        insp.reflect_table(Table(tableName,meta),None)
+    return meta
+
+def schema_complete(meta):
+    #all the migrations were done
+    if any(t not in meta.tables for t in optionalTables):
+        return False
+    return all(c in meta.tables[t].c for t,cols in optionalColumns.items() for c in cols)
+
+def load_schema(refresh=False):
+    global licsMeta
+    if licsMeta.tables and not refresh:
+        return licsMeta
+    cacheFile = get_schema_cache()
+    meta = None
+    if cacheFile and os.path.exists(cacheFile) and not refresh:
+        try:
+            with open(cacheFile,'rb') as f:
+                meta = pickle.load(f)
+        except Exception as e:
+            print('warning, could not load schema cache {}: {}'.format(cacheFile,e))
+            meta = None
+        recheck = config.getfloat('DB','SchemaRecheckMinutes',fallback=10)*60
+        if meta and not schema_complete(meta) and \
+                time.time()-os.path.getmtime(cacheFile) > recheck:
+            meta = None
+    if not meta:
+        meta = reflect_schema()
+        if cacheFile:
+            #write through a temporary file - many array tasks may do this at once
+            try:
+                os.makedirs(os.path.dirname(cacheFile),exist_ok=True)
+                tmpFile = '{}.{}'.format(cacheFile,os.getpid())
+                with open(tmpFile,'wb') as f:
+                    pickle.dump(meta,f)
+                os.replace(tmpFile,cacheFile)
+            except OSError as e:
+                print('warning, could not write schema cache {}: {}'.format(cacheFile,e))
+    licsMeta = meta
+    return licsMeta
+
+class LazyTable():
+    #stands for the licsinfo table of the given name until it is first used
+    #(is_clause_element must stay False so sqlalchemy unwraps the proxy)
+    is_clause_element = False
+    def __init__(self,name):
+        self.name = name
+    def __clause_element__(self):
+        return load_schema().tables[self.name]
+    def __getattr__(self,attr):
+        return getattr(self.__clause_element__(),attr)
+
+jobs = LazyTable('jobs')
+polygs = LazyTable('polygs')
+polygs2master = LazyTable('polygs2master')
+files = LazyTable('files')
+files2bursts = LazyTable('files2bursts')
+polygs2bursts = LazyTable('polygs2bursts')
+slc = LazyTable('slc')
+rslc = LazyTable('rslc')
+ifg = LazyTable('ifg')
+unw = LazyTable('unw')
+acq_img = LazyTable('acq_img')
+bursts = LazyTable('bursts')
+frame_progress = LazyTable('frame_progress')
+item_timing = LazyTable('item_timing')
+item_claim = LazyTable('item_claim')
+item_retry = LazyTable('item_retry')
+
+#this is a residual to trick batch processing - must be kept
+#(licsar_proc functions get get_ipf through this module - LiCSquery is loaded only then)
+def __getattr__(name):
+    if name == 'get_ipf':
+        from LiCSAR_db.LiCSquery import get_ipf
+        return get_ipf
+    raise AttributeError("module '{}' has no attribute '{}'".format(__name__,name))
+
+################################################################################
+# Lookup cache
+################################################################################
+# lookups that do not change while a frame is processed (polyid, frame of a job,
+# reference epoch, user) are memoised in the process. the per frame ones are
+# also shared by the array tasks of the frame through a small file in
+# $BATCH_CACHE_DIR/FRAME (switch off by 'LookupCache: no' in [DB], entries are
+# used for LookupCacheMaxAge hours, default 24). set_master and set_inactive
+# drop the frame's cached values, use invalidate_lookups after other changes
+lookupCache = {}
+
+def get_lookup_cache_file(frame):
+    if not config.getboolean('DB','LookupCache',fallback=True):
+        return None
+    try:
+        frameDir = os.path.join(os.environ['BATCH_CACHE_DIR'],str(frame))
+    except KeyError:
+        return None
+    if not os.path.isdir(frameDir):
+        return None
+    return os.path.join(frameDir,'.lookup_cache.pickle')
+
+def read_lookup_cache(frame):
+    cacheFile = get_lookup_cache_file(frame)
+    maxAge = config.getfloat('DB','LookupCacheMaxAge',fallback=24)*3600
+    try:
+        if time.time() - os.path.getmtime(cacheFile) > maxAge:
+            return {}
+        with open(cacheFile,'rb') as f:
+            return pickle.load(f)
+    except Exception:
+        #no cache file (or a broken one)
+        return {}
+
+def write_lookup_cache(frame,kind,value):
+    cacheFile = get_lookup_cache_file(frame)
+    if not cacheFile:
+        return
+    entries = read_lookup_cache(frame)
+    entries[kind] = value
+    try:
+        tmpFile = '{}.{}'.format(cacheFile,os.getpid())
+        with open(tmpFile,'wb') as f:
+            pickle.dump(entries,f)
+        os.replace(tmpFile,cacheFile)
+    except OSError as e:
+        print('warning, could not write lookup cache {}: {}'.format(cacheFile,e))
+
+def cached_lookup(kind,perFrame=True):
+    #memoises func(key), None results are not cached. with perFrame, the key
+    #is a frame name and the value is shared through the frame cache file
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(key):
+            if (kind,key) in lookupCache:
+                return lookupCache[(kind,key)]
+            value = None
+            if perFrame:
+                value = read_lookup_cache(key).get(kind)
+            if value is None:
+                value = func(key)
+                if value is not None and perFrame:
+                    write_lookup_cache(key,kind,value)
+            if value is not None:
+                lookupCache[(kind,key)] = value
+            return value
+        wrapper.uncached = func
+        return wrapper
+    return decorator
+
+def invalidate_lookups(frame=None,polyid=None):
+    #forget the cached values of the frame (given by name or polyid),
+    #or everything if none is given
+    if frame is None and polyid is None:
+        lookupCache.clear()
+        return
+    frames = set([frame]) if frame else set()
+    if polyid is not None:
+        frames.update(key for (kind,key),value in lookupCache.items()
+                          if kind == 'polyid' and value == polyid)
+        if not frames:
+            try:
+                frames.add(get_frame_name(polyid))
+            except SQLAlchemyError:
+                pass
+    for frame in frames:
+        for key in [key for key in lookupCache if key[1] == frame]:
+            del lookupCache[key]
+        cacheFile = get_lookup_cache_file(frame) if frame else None
+        if cacheFile and os.path.exists(cacheFile):
+            try:
+                os.remove(cacheFile)
+            except OSError:
+                pass
+
+################################################################################
+# Date predicates
+################################################################################
+# acq_date columns are (date)times - filtering on func.date(column) prevents
+# mysql from using the acq_date indexes (sql/migration_002_date_indexes.sql),
+# so days are selected by half-open ranges [first day, last day + 1)
+def to_day(date):
+    if isinstance(date,str):
+        return dt.datetime.strptime(date[:10].replace('-',''),'%Y%m%d').date()
+    if isinstance(date,dt.datetime):
+        return date.date()
+    return date
+
+def on_days(column,startdate,enddate=None):
+    startdate = to_day(startdate)
+    enddate = to_day(enddate) if enddate else startdate
+    return and_(column>=startdate,column<enddate+dt.timedelta(days=1))
+
+def on_any_days(column,dates,extraDays=0):
+    #on_days for a list of dates (each with extraDays following days),
+    #touching or overlapping day ranges are merged
+    ranges = []
+    for day in sorted(set(to_day(d) for d in dates)):
+        if ranges and day <= ranges[-1][1]+dt.timedelta(days=1):
+            ranges[-1][1] = max(ranges[-1][1],day+dt.timedelta(days=extraDays))
+        else:
+            ranges.append([day,day+dt.timedelta(days=extraDays)])
+    return or_(*[on_days(column,start,end) for start,end in ranges])
 
 ################################################################################
+@reconnecting
 def get_acq_dates(polyid):
     acqDtSel = select(func.date(files.c.acq_date).distinct()).select_from(
                     files.join(files2bursts, 
@@ -74,109 +334,133 @@ def get_acq_dates(polyid):
                     .join(polygs2bursts, 
                         onclause=files2bursts.c.bid==polygs2bursts.c.bid)
                 ).where(polygs2bursts.c.polyid==polyid)
-    conn = engine.connect()
-    # acqDats = pd.read_sql_query(acqDtSel,conn)
-    result = conn.execute(acqDtSel)
-    conn.close()
-    acqDats = pd.DataFrame(result.fetchall())
+    with engine.connect() as conn:
+        # acqDats = pd.read_sql_query(acqDtSel,conn)
+        result = conn.execute(acqDtSel)
+        acqDats = pd.DataFrame(result.fetchall())
     acqDats.columns = ['acq_date']
     acqDats = acqDats.sort_values(by='acq_date')
     return acqDats
 
 ################################################################################
+@cached_lookup('polyid')
+@reconnecting
 def get_polyid(frame):
-    conn = engine.connect()
-    polygsSel = select(polygs.c.polyid).where(polygs.c.polyid_name==frame)
-    sqlRes = conn.execute(polygsSel)
-    try:
-        output = sqlRes.fetchone()[0]
-    except:
-        print('nothing found')
-        output = None
-    conn.close()
+    with engine.connect() as conn:
+        polygsSel = select(polygs.c.polyid).where(polygs.c.polyid_name==frame)
+        sqlRes = conn.execute(polygsSel)
+        try:
+            output = sqlRes.fetchone()[0]
+        except TypeError:
+            print('nothing found')
+            output = None
     return output
 
+@reconnecting
+def get_active_frames():
+    frameSel = select(polygs.c.polyid_name).where(polygs.c.active==True).order_by(polygs.c.polyid_name)
+    with engine.connect() as conn:
+        return [r[0] for r in conn.execute(frameSel)]
+
 ################################################################################
-def get_frame_from_job(jobID):
-    conn = engine.connect()
-    polygsSel = select(polygs.c.polyid_name).select_from(
+def frame_from_job_query(jobID):
+    return select(polygs.c.polyid_name).select_from(
             jobs.join(polygs,
                 onclause=polygs.c.polyid==jobs.c.polyid)
             ).where(jobs.c.job_id==jobID)
-    sqlRes = conn.execute(polygsSel)
-    try:
-        res = sqlRes.fetchone()[0]
-    except:
-        res = None
-        print('error fetching sql result')
-    conn.close()
+
+@cached_lookup('frame_from_job',perFrame=False)
+@reconnecting
+def get_frame_from_job(jobID):
+    with engine.connect() as conn:
+        polygsSel = frame_from_job_query(jobID)
+        sqlRes = conn.execute(polygsSel)
+        try:
+            res = sqlRes.fetchone()[0]
+        except TypeError:
+            res = None
+            print('error fetching sql result')
     return res
 
 ################################################################################
+jobTypes = {'mk_image':0,
+            'coreg':1,
+            'mk_ifg':2,
+            'unwrap':3
+            }
+#items processed by the jobs of each type
+jobKinds = {'mk_image':'slc',
+            'coreg':'rslc',
+            'mk_ifg':'ifg',
+            'unwrap':'unw'
+            }
+
 def create_job(polyid,user,jobType):
-    jobTypes = {'mk_image':0,
-                'coreg':1,
-                'mk_ifg':2,
-                'unwrap':3
-                }
     jobIns = jobs.insert().values(polyid=polyid,
                                     user=user,
                                     job_type=jobTypes[jobType])
     # conn = engine.connect()
     # sqlRes = conn.execute(jobIns)
-    try:
-        # res = sqlRes.inserted_primary_key[0]
-        # conn.commit()
-        with engine.begin() as conn:
-            res = conn.execute(jobIns)
-            res = res.inserted_primary_key[0]
-    except:
-        res = None
-        print('error fetching sql result')
+    # res = sqlRes.inserted_primary_key[0]
+    # conn.commit()
+    #(not repeated on a connection error - the job may have been created)
+    with engine.begin() as conn:
+        res = conn.execute(jobIns)
+        res = res.inserted_primary_key[0]
     # conn.close()
     return res
 
 ################################################################################
+def create_jobs(polyid,user,jobType,jobN,conn,priorities=None):
+    #creates jobN new jobs within the given (open) transaction (with the
+    #priority of each job if given)
+    jobIns = jobs.insert().values(polyid=polyid,
+                                    user=user,
+                                    job_type=jobTypes[jobType])
+    jids = []
+    for i in range(jobN):
+        if priorities is not None and has_priority():
+            res = conn.execute(jobIns.values(priority=int(priorities[i])))
+        else:
+            res = conn.execute(jobIns)
+        jids.append(res.inserted_primary_key[0])
+    return jids
+
+################################################################################
+@reconnecting
 def set_master(polyid,mstrDate):
-    conn = engine.connect()
-    #get masterID
-    mstrIDQry = select(acq_img.c.img_id).where(and_(func.date(acq_img.c.acq_date)==mstrDate,acq_img.c.polyid==polyid))
-    mstrID = conn.execute(mstrIDQry).fetchone()
-    if mstrID:
-        mstrID = mstrID[0]
-    #check previous existing records over the polyid
-    polycheckQry = select(polygs2master.c.polyid).where(polygs2master.c.polyid==polyid)
-    polycheck = conn.execute(polycheckQry).fetchone()
-    conn.close()
+    with engine.connect() as conn:
+        #get masterID
+        mstrIDQry = select(acq_img.c.img_id).where(and_(acq_img.c.polyid==polyid,on_days(acq_img.c.acq_date,mstrDate)))
+        mstrID = conn.execute(mstrIDQry).fetchone()
+        if mstrID:
+            mstrID = mstrID[0]
+        #check previous existing records over the polyid
+        polycheckQry = select(polygs2master.c.polyid).where(polygs2master.c.polyid==polyid)
+        polycheck = conn.execute(polycheckQry).fetchone()
     if polycheck:
         #Update polygon if there is already a master
         polyDo = polygs2master.update().where(polygs2master.c.polyid==polyid).values(master_img_id=mstrID)
     else:
         #Insert info about master and polygon
         polyDo = polygs2master.insert().values(polyid=polyid,master_img_id=mstrID)
-    try:
-        # res = conn.execute(polyDo)
-        # conn.commit()
-        with engine.begin() as conn:
-            res = conn.execute(polyDo)
-    except:
-        res = None
-        print('error fetching sql result')
+    # res = conn.execute(polyDo)
+    # conn.commit()
+    with engine.begin() as conn:
+        res = conn.execute(polyDo)
+    invalidate_lookups(polyid=polyid)
     return res
 
 ################################################################################
+@reconnecting
 def set_active(polyid):
     # conn = engine.connect()
     #Update polygon
     polyUpd = polygs.update().where(polygs.c.polyid==polyid).values(active=True)
-    try:
-        # res = conn.execute(polyUpd)
-        # conn.commit()
-        with engine.begin() as conn:
-            res = conn.execute(polyUpd)
-    except:
-        res = None
-        print('error fetching sql result')
+    # res = conn.execute(polyUpd)
+    # conn.commit()
+    with engine.begin() as conn:
+        res = conn.execute(polyUpd)
     # conn.close()
     return res
 
@@ -189,6 +473,7 @@ def set_active(polyid):
 #    return conn.execute(polyUpd)
 
 ################################################################################
+@reconnecting
 def set_inactive(polyid):
     # conn = engine.connect()
     #Update polygon
@@ -222,52 +507,74 @@ def set_inactive(polyid):
         res = conn.execute(ifgDlt)
         res = conn.execute(unwDlt)
         res = conn.execute(jobDlt)
+        recount_frame_progress(conn,[polyid])
     # conn.close()
+    invalidate_lookups(polyid=polyid)
     return a
 
 ################################################################################
-def get_master(frameName):
-    conn = engine.connect()
-    #Master date query
-    mstrIDQry = select(acq_img.c.acq_date).select_from(
+@reconnecting
+def clear_frame_jobs(polyid):
+    #removes the jobs of the frame and unlinks its items (keeping their statuses),
+    #so that only the new jobs are listed in the next processing
+    with engine.begin() as conn:
+        for table in [slc,rslc,ifg,unw]:
+            conn.execute(table.update().where(and_(table.c.polyid==polyid,
+                table.c.job_id!=None)).values(job_id=None))
+        res = conn.execute(jobs.delete().where(jobs.c.polyid==polyid))
+    return res.rowcount
+
+################################################################################
+def master_query(frameName):
+    return select(acq_img.c.acq_date).select_from(
             polygs.join(polygs2master,onclause=polygs.c.polyid==polygs2master.c.polyid)\
             .join(acq_img,onclause=polygs2master.c.master_img_id==acq_img.c.img_id)\
             ).where(polygs.c.polyid_name==frameName)
-    #Update polygon
-    mstrDate = conn.execute(mstrIDQry).fetchone()
-    if mstrDate:
-        output = mstrDate[0]
-    else:
-        output = None
-    conn.close()
+
+@cached_lookup('master')
+@reconnecting
+def get_master(frameName):
+    with engine.connect() as conn:
+        #Master date query
+        mstrIDQry = master_query(frameName)
+        #Update polygon
+        mstrDate = conn.execute(mstrIDQry).fetchone()
+        if mstrDate:
+            output = mstrDate[0]
+        else:
+            output = None
     return output
 
 
+@cached_lookup('user')
+@reconnecting
 def get_user(frameName):
-    conn = engine.connect()
-    #query to get user that started processing of the given frame
-    #userIDQry = select([jobs.c.user]).select_from(
-    userIDQry=select(jobs.c.user).select_from(
-            polygs.join(jobs,onclause=polygs.c.polyid==jobs.c.polyid)).where(
-            polygs.c.polyid_name==frameName)
-    userID = conn.execute(userIDQry).fetchone()
+    with engine.connect() as conn:
+        #query to get user that started processing of the given frame
+        #userIDQry = select([jobs.c.user]).select_from(
+        userIDQry=select(jobs.c.user).select_from(
+                polygs.join(jobs,onclause=polygs.c.polyid==jobs.c.polyid)).where(
+                polygs.c.polyid_name==frameName)
+        userID = conn.execute(userIDQry).fetchone()
     if userID:
         output = userID[0]
     else:
         output = None
     return output
 
+@reconnecting
+def get_frame_name(polyid):
+    with engine.connect() as conn:
+        res = conn.execute(select(polygs.c.polyid_name).where(polygs.c.polyid==polyid)).fetchone()
+    return res[0] if res else None
+
 
 ################################################################################
-def add_acq_images(polyid, startdate = None, enddate = None, masterdate = None):
+def get_frame_acq_dates(polyid, startdate = None, enddate = None, masterdate = None):
+    #acquisition dates of the frame (from its files) between startdate and enddate,
+    #always incl. the masterdate - as used for acq_img (see add_acq_images)
     #startdate and enddate MUST be of type date!!!
     acq_dates = get_acq_dates(polyid)
-    #clean data in db
-    imgDlt = acq_img.delete().where(acq_img.c.polyid==polyid)
-    # conn.execute(imgDlt)
-    # conn.commit()
-    with engine.begin() as conn:
-        res = conn.execute(imgDlt)
     if masterdate:
         masteracq = acq_dates[acq_dates['acq_date']==masterdate]
         if startdate:
@@ -295,6 +602,17 @@ def add_acq_images(polyid, startdate = None, enddate = None, masterdate = None):
             else:
                 todel = date2
             acq_dates = acq_dates[acq_dates['acq_date']!=todel]
+    return acq_dates
+
+def add_acq_images(polyid, startdate = None, enddate = None, masterdate = None):
+    #startdate and enddate MUST be of type date!!!
+    acq_dates = get_frame_acq_dates(polyid, startdate, enddate, masterdate)
+    #clean data in db
+    imgDlt = acq_img.delete().where(acq_img.c.polyid==polyid)
+    # conn.execute(imgDlt)
+    # conn.commit()
+    with engine.begin() as conn:
+        res = conn.execute(imgDlt)
     #Rebuild
     polyidSrs = pd.Series(polyid,index=acq_dates.index,name='polyid')
     imgDtFrm = pd.concat([polyidSrs,acq_dates],axis=1)
@@ -304,10 +622,194 @@ def add_acq_images(polyid, startdate = None, enddate = None, masterdate = None):
             acq_img.join(polygs,onclause=acq_img.c.polyid==polygs.c.polyid)).where(
         acq_img.c.polyid==polyid)
     # out = pd.read_sql_query(imgQry,conn)
-    conn = engine.connect()
-    result = conn.execute(imgQry)
-    conn.close()
-    out = pd.DataFrame(result.fetchall())
+    with engine.connect() as conn:
+        result = conn.execute(imgQry)
+        out = pd.DataFrame(result.fetchall())
+    return out
+
+################################################################################
+# Frame tables rebuild in one transaction
+################################################################################
+#rows per multi-row INSERT
+insertChunk = 1000
+
+def sequential_pairs(dates,connections=3):
+    #the default ifg network - each epoch with its following 1..connections
+    #epochs, ordered as in create_ifgs (all 1st neighbours, then 2nd, ..)
+    dates = sorted(dates)
+    return [(dates[i],dates[j]) for i,j in nearest_pairs(len(dates),connections)]
+
+def consecutive_insert_ids(conn):
+    #mysql returns the first id of a multi-row insert and the ids are
+    #consecutive, unless innodb interleaves them (autoinc lock mode 2)
+    if conn.dialect.name != 'mysql':
+        return False
+    lockMode,increment = conn.exec_driver_sql(
+            'SELECT @@innodb_autoinc_lock_mode, @@auto_increment_increment').fetchone()
+    return int(lockMode) < 2 and int(increment) == 1
+
+def insert_rows(conn,table,idCol,polyid,rows,consecutive):
+    #chunked multi-row INSERT, returns the new ids in order of rows. without
+    #consecutive ids, they are read back (auto increment ids grow in insert
+    #order, so the new rows of the frame are the ones with the highest ids)
+    ids = []
+    for i in range(0,len(rows),insertChunk):
+        chunk = rows[i:i+insertChunk]
+        res = conn.execute(table.insert().values(chunk))
+        if consecutive:
+            ids += list(range(res.lastrowid,res.lastrowid+len(chunk)))
+    if rows and not consecutive:
+        idSel = select(table.c[idCol]).where(table.c.polyid==polyid).order_by(
+                table.c[idCol].desc()).limit(len(rows))
+        ids = [r[0] for r in conn.execute(idSel)][::-1]
+    return ids
+
+def delete_rows(conn,table,idCol,ids):
+    #chunked DELETE ... WHERE id IN (...), returns number of deleted rows
+    ids = sorted(set(int(i) for i in ids))
+    count = 0
+    for i in range(0,len(ids),maxInList):
+        count += conn.execute(table.delete().where(
+                table.c[idCol].in_(ids[i:i+maxInList]))).rowcount
+    return count
+
+@reconnecting
+def rebuild_frame_tables(polyid,acq_dates,pairs,slcDates=None,masterdate=None):
+    #replaces acq_img/slc/rslc/ifg/unw rows of the frame in one transaction:
+    #   acq_dates ... dates for acq_img
+    #   pairs ... (date1,date2) of the ifgs/unws
+    #   slcDates ... dates for slcs/rslcs (default: acq_dates)
+    #   masterdate ... if given, the frame reference epoch is set to it (and
+    #                  added to the acq_dates if not there)
+    #returns dict of DataFrames with the new rows (incl. ids):
+    #   acq_img (img_id, acq_date), slc/rslc (slc_id/rslc_id, img_id, acq_date)
+    #   ifg/unw (ifg_id/unw_id, img_id_1, img_id_2)
+    acqDates = set(pd.Timestamp(to_day(d)) for d in acq_dates)
+    if masterdate is not None:
+        #(the reference epoch always gets its acq_img, for polygs2master)
+        acqDates.add(pd.Timestamp(to_day(masterdate)))
+    acqDates = sorted(acqDates)
+    if slcDates is None:
+        slcDates = acqDates
+    slcDates = [pd.Timestamp(to_day(d)) for d in slcDates]
+    pairs = [(pd.Timestamp(to_day(a)),pd.Timestamp(to_day(b))) for a,b in pairs]
+    out = {}
+    with engine.begin() as conn:
+        consecutive = consecutive_insert_ids(conn)
+        for table in [unw,ifg,rslc,slc,acq_img]:
+            conn.execute(table.delete().where(table.c.polyid==polyid))
+        imgIds = insert_rows(conn,acq_img,'img_id',polyid,
+                [{'polyid':polyid,'acq_date':d.date()} for d in acqDates],consecutive)
+        imgOfDate = dict(zip(acqDates,imgIds))
+        out['acq_img'] = pd.DataFrame({'img_id':imgIds,'acq_date':acqDates})
+        for kind,table in [('slc',slc),('rslc',rslc)]:
+            rows = [{'polyid':polyid,'img_id':imgOfDate[d],kind+'_status':-1} for d in slcDates]
+            ids = insert_rows(conn,table,kind+'_id',polyid,rows,consecutive)
+            out[kind] = pd.DataFrame({kind+'_id':ids,'img_id':[r['img_id'] for r in rows],
+                'acq_date':slcDates})
+        for kind,table in [('ifg',ifg),('unw',unw)]:
+            rows = [{'polyid':polyid,'img_id_1':imgOfDate[a],'img_id_2':imgOfDate[b],
+                kind+'_status':-1} for a,b in pairs]
+            ids = insert_rows(conn,table,kind+'_id',polyid,rows,consecutive)
+            out[kind] = pd.DataFrame({kind+'_id':ids,'img_id_1':[r['img_id_1'] for r in rows],
+                'img_id_2':[r['img_id_2'] for r in rows]})
+        recount_frame_progress(conn,[polyid])
+        if masterdate is not None:
+            mstrId = imgOfDate[pd.Timestamp(to_day(masterdate))]
+            conn.execute(polygs2master.delete().where(polygs2master.c.polyid==polyid))
+            conn.execute(polygs2master.insert().values(polyid=polyid,master_img_id=mstrId))
+    if masterdate is not None:
+        invalidate_lookups(polyid=polyid)
+    return out
+
+@reconnecting
+def update_frame_tables(polyid,acq_dates,pairs,slcDates=None,masterdate=None):
+    #incremental version of rebuild_frame_tables - compares the wanted epochs
+    #and pairs with the rows of the frame in one transaction and only inserts
+    #the new ones and deletes (retires) the ones no longer wanted. the existing
+    #rows keep their ids, statuses and job links.
+    #returns the same DataFrames as rebuild_frame_tables (all current rows in
+    #the wanted order) with the extra bool column 'new' in slc/rslc/ifg/unw,
+    #and out['retired'] - number of deleted rows per table
+    acqDates = set(pd.Timestamp(to_day(d)) for d in acq_dates)
+    if masterdate is not None:
+        #(the reference epoch always gets its acq_img, for polygs2master)
+        acqDates.add(pd.Timestamp(to_day(masterdate)))
+    acqDates = sorted(acqDates)
+    if slcDates is None:
+        slcDates = acqDates
+    slcDates = [pd.Timestamp(to_day(d)) for d in slcDates]
+    pairs = [(pd.Timestamp(to_day(a)),pd.Timestamp(to_day(b))) for a,b in pairs]
+    out = {}
+    retired = {}
+    with engine.begin() as conn:
+        consecutive = consecutive_insert_ids(conn)
+        #epochs
+        imgSel = select(acq_img.c.img_id,acq_img.c.acq_date).where(acq_img.c.polyid==polyid)
+        imgOfDate = {pd.Timestamp(to_day(r[1])):r[0] for r in conn.execute(imgSel)}
+        wanted = set(acqDates)
+        droppedImgs = [i for d,i in imgOfDate.items() if d not in wanted]
+        #items of the retired epochs go first
+        for kind,table in [('unw',unw),('ifg',ifg),('rslc',rslc),('slc',slc)]:
+            idCol = kind+'_id'
+            if kind in ['ifg','unw']:
+                onDropped = or_(table.c.img_id_1.in_(droppedImgs),table.c.img_id_2.in_(droppedImgs))
+            else:
+                onDropped = table.c.img_id.in_(droppedImgs)
+            idSel = select(table.c[idCol]).where(and_(table.c.polyid==polyid,onDropped))
+            retired[kind] = delete_rows(conn,table,idCol,
+                    [r[0] for r in conn.execute(idSel)]) if droppedImgs else 0
+        retired['acq_img'] = delete_rows(conn,acq_img,'img_id',droppedImgs)
+        newDates = [d for d in acqDates if d not in imgOfDate]
+        newImgIds = insert_rows(conn,acq_img,'img_id',polyid,
+                [{'polyid':polyid,'acq_date':d.date()} for d in newDates],consecutive)
+        imgOfDate.update(zip(newDates,newImgIds))
+        out['acq_img'] = pd.DataFrame({'img_id':[imgOfDate[d] for d in acqDates],
+            'acq_date':acqDates})
+        #slcs and rslcs
+        for kind,table in [('slc',slc),('rslc',rslc)]:
+            idCol = kind+'_id'
+            itemSel = select(table.c[idCol],table.c.img_id).where(table.c.polyid==polyid)
+            itemOfImg = {r[1]:r[0] for r in conn.execute(itemSel)}
+            wantedImgs = [imgOfDate[d] for d in slcDates]
+            wanted = set(wantedImgs)
+            retired[kind] += delete_rows(conn,table,idCol,
+                    [i for img,i in itemOfImg.items() if img not in wanted])
+            newImgs = [img for img in wantedImgs if img not in itemOfImg]
+            newIds = insert_rows(conn,table,idCol,polyid,
+                    [{'polyid':polyid,'img_id':img,kind+'_status':-1} for img in newImgs],consecutive)
+            itemOfImg.update(zip(newImgs,newIds))
+            itemsNew = set(newImgs)
+            out[kind] = pd.DataFrame({idCol:[itemOfImg[img] for img in wantedImgs],
+                'img_id':wantedImgs,'acq_date':slcDates,
+                'new':[img in itemsNew for img in wantedImgs]})
+        #ifgs and unws
+        wantedPairs = [(imgOfDate[a],imgOfDate[b]) for a,b in pairs]
+        for kind,table in [('ifg',ifg),('unw',unw)]:
+            idCol = kind+'_id'
+            itemSel = select(table.c[idCol],table.c.img_id_1,table.c.img_id_2).where(
+                    table.c.polyid==polyid)
+            itemOfPair = {(r[1],r[2]):r[0] for r in conn.execute(itemSel)}
+            wanted = set(wantedPairs)
+            retired[kind] += delete_rows(conn,table,idCol,
+                    [i for pair,i in itemOfPair.items() if pair not in wanted])
+            newPairs = [pair for pair in wantedPairs if pair not in itemOfPair]
+            newIds = insert_rows(conn,table,idCol,polyid,
+                    [{'polyid':polyid,'img_id_1':a,'img_id_2':b,kind+'_status':-1}
+                        for a,b in newPairs],consecutive)
+            itemOfPair.update(zip(newPairs,newIds))
+            itemsNew = set(newPairs)
+            out[kind] = pd.DataFrame({idCol:[itemOfPair[pair] for pair in wantedPairs],
+                'img_id_1':[a for a,b in wantedPairs],'img_id_2':[b for a,b in wantedPairs],
+                'new':[pair in itemsNew for pair in wantedPairs]})
+        recount_frame_progress(conn,[polyid])
+        if masterdate is not None:
+            mstrId = imgOfDate[pd.Timestamp(to_day(masterdate))]
+            conn.execute(polygs2master.delete().where(polygs2master.c.polyid==polyid))
+            conn.execute(polygs2master.insert().values(polyid=polyid,master_img_id=mstrId))
+    if masterdate is not None or droppedImgs:
+        invalidate_lookups(polyid=polyid)
+    out['retired'] = retired
     return out
 
 ################################################################################
@@ -325,12 +827,12 @@ def create_slcs(polyid,imgDtFrm):
     slcDtFrm = pd.concat([polyidSrs,statSrs,imgDtFrm['img_id']],axis=1)
     with engine.begin() as conn:
         slcDtFrm.to_sql('slc',conn,index=False,if_exists='append')
-    conn = engine.connect()
-    slcQry = select(slc.c.slc_id).where(slc.c.polyid==polyid)
-    # out = pd.read_sql_query(slcQry,conn)
-    result = conn.execute(slcQry)
-    conn.close()
-    out = pd.DataFrame(result.fetchall())
+        recount_frame_progress(conn,[polyid])
+    with engine.connect() as conn:
+        slcQry = select(slc.c.slc_id).where(slc.c.polyid==polyid)
+        # out = pd.read_sql_query(slcQry,conn)
+        result = conn.execute(slcQry)
+        out = pd.DataFrame(result.fetchall())
     return out
 
 ################################################################################
@@ -348,12 +850,12 @@ def create_rslcs(polyid,imgDtFrm):
     rslcDtFrm = pd.concat([polyidSrs,statSrs,imgDtFrm['img_id']],axis=1)
     with engine.begin() as conn:
         rslcDtFrm.to_sql('rslc',conn,index=False,if_exists='append')
-    conn = engine.connect()
-    rslcQry = select(rslc.c.rslc_id, rslc.c.img_id).where(rslc.c.polyid==polyid)
-    # out = pd.read_sql_query(rslcQry,conn)
-    result = conn.execute(rslcQry)
-    conn.close()
-    out = pd.DataFrame(result.fetchall())
+        recount_frame_progress(conn,[polyid])
+    with engine.connect() as conn:
+        rslcQry = select(rslc.c.rslc_id, rslc.c.img_id).where(rslc.c.polyid==polyid)
+        # out = pd.read_sql_query(rslcQry,conn)
+        result = conn.execute(rslcQry)
+        out = pd.DataFrame(result.fetchall())
     return out
 
 ################################################################################
@@ -364,32 +866,18 @@ def create_ifgs(polyid,imgDtFrm):
         res = conn.execute(ifgDlt)
     #Rebuild
     #
-    imgDtFrm = imgDtFrm.sort_values('acq_date')
-    imgSrsA = pd.concat( [
-        imgDtFrm['img_id'].iloc[:-1],
-        imgDtFrm['img_id'].iloc[:-2],
-        imgDtFrm['img_id'].iloc[:-3],
-            ], axis=0, ignore_index=True)
-    imgSrsA.name = 'img_id_1'
-    imgSrsA.index = list(range(0,imgSrsA.shape[0]))
-    imgSrsB = pd.concat( [
-        imgDtFrm['img_id'].iloc[1:],
-        imgDtFrm['img_id'].iloc[2:],
-        imgDtFrm['img_id'].iloc[3:],
-            ], axis=0, ignore_index=True)
-    imgSrsB.name = 'img_id_2'
-    imgSrsA.index = list(range(0,imgSrsA.shape[0]))
-    polyidSrs = pd.Series(polyid,index=imgSrsA.index,name='polyid')
-    statSrs = pd.Series(-1,index=imgSrsA.index,name='ifg_status')
-    ifgDtFrm = pd.concat([polyidSrs,statSrs,imgSrsA,imgSrsB],axis=1)
+    imgIds = imgDtFrm.sort_values('acq_date')['img_id'].values
+    pairs = nearest_pairs(len(imgIds),3)
+    ifgDtFrm = pd.DataFrame({'polyid':polyid,'ifg_status':-1,
+        'img_id_1':imgIds[pairs[:,0]],'img_id_2':imgIds[pairs[:,1]]})
     with engine.begin() as conn:
         ifgDtFrm.to_sql('ifg',conn,index=False,if_exists='append')
-    conn = engine.connect()
-    ifgQry = select(ifg.c.ifg_id).where(ifg.c.polyid==polyid)
-    # out = pd.read_sql_query(ifgQry,conn)
-    result = conn.execute(ifgQry)
-    conn.close()
-    out = pd.DataFrame(result.fetchall())
+        recount_frame_progress(conn,[polyid])
+    with engine.connect() as conn:
+        ifgQry = select(ifg.c.ifg_id).where(ifg.c.polyid==polyid)
+        # out = pd.read_sql_query(ifgQry,conn)
+        result = conn.execute(ifgQry)
+        out = pd.DataFrame(result.fetchall())
     return out
 
 ################################################################################
@@ -402,35 +890,57 @@ def create_unws(polyid,imgDtFrm):
         res = conn.execute(unwDlt)
     #Rebuild
     #conn = engine.connect()
-    imgDtFrm = imgDtFrm.sort_values('acq_date')
-    imgSrsA = pd.concat( [
-        imgDtFrm['img_id'].iloc[:-1],
-        imgDtFrm['img_id'].iloc[:-2],
-        imgDtFrm['img_id'].iloc[:-3],
-            ], axis=0, ignore_index=True)
-    imgSrsA.name = 'img_id_1'
-    imgSrsA.index = list(range(0,imgSrsA.shape[0]))
-    imgSrsB = pd.concat( [
-        imgDtFrm['img_id'].iloc[1:],
-        imgDtFrm['img_id'].iloc[2:],
-        imgDtFrm['img_id'].iloc[3:],
-            ], axis=0, ignore_index=True)
-    imgSrsB.name = 'img_id_2'
-    imgSrsA.index = list(range(0,imgSrsA.shape[0]))
-    polyidSrs = pd.Series(polyid,index=imgSrsA.index,name='polyid')
-    statSrs = pd.Series(-1,index=imgSrsA.index,name='unw_status')
-    unwDtFrm = pd.concat([polyidSrs,statSrs,imgSrsA,imgSrsB],axis=1)
+    imgIds = imgDtFrm.sort_values('acq_date')['img_id'].values
+    pairs = nearest_pairs(len(imgIds),3)
+    unwDtFrm = pd.DataFrame({'polyid':polyid,'unw_status':-1,
+        'img_id_1':imgIds[pairs[:,0]],'img_id_2':imgIds[pairs[:,1]]})
     with engine.begin() as conn:
         unwDtFrm.to_sql('unw',conn,index=False,if_exists='append')
-    conn = engine.connect()
-    unwQry = select(unw.c.unw_id).where(unw.c.polyid==polyid)
-    # out = pd.read_sql_query(unwQry,conn)
-    result = conn.execute(unwQry)
-    conn.close()
-    out = pd.DataFrame(result.fetchall())
+        recount_frame_progress(conn,[polyid])
+    with engine.connect() as conn:
+        unwQry = select(unw.c.unw_id).where(unw.c.polyid==polyid)
+        # out = pd.read_sql_query(unwQry,conn)
+        result = conn.execute(unwQry)
+        out = pd.DataFrame(result.fetchall())
     return out
 
 ################################################################################
+#tables (and their id columns) holding items of the given job type
+jobItems = {'mk_image':(slc,'slc_id'),
+            'coreg':(rslc,'rslc_id'),
+            'mk_ifg':(ifg,'ifg_id'),
+            'unwrap':(unw,'unw_id')
+            }
+#max number of ids in one IN (...) clause
+maxInList = 1000
+
+def link_items_to_job(jobType,itemIds,jobId,conn,priority=None):
+    #set-based linking - one UPDATE ... WHERE id IN (...) within the given transaction
+    itemTable, idCol = jobItems[jobType]
+    itemIds = [int(i) for i in itemIds]
+    values = {'job_id':jobId}
+    if priority is not None and has_priority():
+        values['priority'] = int(priority)
+    for i in range(0,len(itemIds),maxInList):
+        itemUpd = itemTable.update().where(
+                itemTable.c[idCol].in_(itemIds[i:i+maxInList])).values(**values)
+        conn.execute(itemUpd)
+
+def link_items_to_new_jobs(polyid,user,jobType,itemGroups,priorities=None):
+    #creates one job per (non-empty) group of item ids and links the items to it,
+    #everything in one transaction. the jobs and their items get the priority
+    #of the group (routine if not given). returns the new job ids
+    if priorities is None:
+        priorities = [routinePriority]*len(itemGroups)
+    groups = [(g,p) for g,p in zip(itemGroups,priorities) if len(g)]
+    with engine.begin() as conn:
+        jids = create_jobs(polyid,user,jobType,len(groups),conn,[p for g,p in groups])
+        for jid,(itemGroup,priority) in zip(jids,groups):
+            link_items_to_job(jobType,itemGroup,jid,conn,priority)
+    return jids
+
+################################################################################
+@reconnecting
 def link_slc_to_job(slcId,jobId):
     # conn = engine.connect()
     #update
@@ -442,18 +952,74 @@ def link_slc_to_job(slcId,jobId):
     # conn.close()
 
 
-def batch_link_slcs_to_new_jobs(polyid,user,slcIds,batchN):
-    slcIds['bin'] = pd.cut(slcIds['slc_id'],batchN,labels=False)
-    slcGrouped = slcIds.groupby('bin')
-    pom = 1
-    for label,slcGroup in slcGrouped:
-        jid = create_job(polyid,user,'mk_image')
-        if pom:
-            print('first_job_id is',jid)
-        pom = 0
-        slcGroup['slc_id'].map(lambda s:link_slc_to_job(s,jid))
+@reconnecting
+def get_frame_burst_count(polyid):
+    with engine.connect() as conn:
+        res = conn.execute(select(func.count(polygs2bursts.c.bid.distinct())).where(
+            polygs2bursts.c.polyid==polyid)).fetchone()
+    return res[0] if res else None
+
+def pack_job_items(polyid,jobType,itemIds,idCol,batchN,contiguous=False,orderBy=None,windows=None,
+                   capHours=maxJobHours):
+    #groups of the item ids for batchN jobs, balanced by the estimated runtime
+    #of the items (column 'cost' in hours if given, otherwise by the frame size).
+    #jobs that would exceed capHours (the walltime) or the max. items of the
+    #step (maxJobItems) are split (see batchPackLib).
+    #contiguous keeps runs of neighbouring items (sorted by orderBy columns,
+    #default the id) together, windows (column of window numbers) packs every
+    #window to its own jobs. items of different priority (column 'priority')
+    #go to different jobs, those of the highest priority first
+    if 'priority' in itemIds.columns:
+        groups = []
+        for level in sorted(itemIds['priority'].unique(),reverse=True):
+            levelIds = itemIds[itemIds['priority']==level].drop(columns='priority')
+            groups += pack_job_items(polyid,jobType,levelIds,idCol,batchN,contiguous,orderBy,windows,
+                                     capHours)
+        return groups
+    if contiguous or windows:
+        itemIds = itemIds.sort_values(orderBy or idCol,kind='stable')
+    if 'cost' in itemIds.columns:
+        costs = itemIds['cost'].values.astype(float)
+    else:
+        costs = estimate_costs(jobType,len(itemIds),itemHours=predict_item_hours(polyid,jobType))
+    maxItems = maxJobItems.get(jobType)
+    if windows:
+        groups = pack_windows(itemIds[windows].values,costs,batchN,capHours,maxItems)
+    elif contiguous:
+        groups = pack_contiguous(costs,batchN,capHours,maxItems)
+    else:
+        groups = pack_lpt(costs,batchN,capHours,maxItems)
+    if len(groups) > batchN:
+        print('increasing number of {} jobs to {} to fit the walltime and item limits'.format(
+            jobType,len(groups)))
+    ids = itemIds[idCol].values
+    return [ids[g] for g in groups]
+
+def group_priorities(itemIds,idCol,groups):
+    #priority of the jobs of the groups (the highest of their items), None
+    #without the 'priority' column
+    if 'priority' not in itemIds.columns:
+        return None
+    priorityOf = itemIds.set_index(idCol)['priority']
+    return [int(priorityOf[g].max()) if len(g) else routinePriority for g in groups]
+
+def pack_slc_items(polyid,slcIds,batchN,capHours=maxJobHours):
+    #(in the date order if given, to match the coreg windows)
+    orderBy = 'acq_date' if 'acq_date' in slcIds.columns else None
+    return pack_job_items(polyid,'mk_image',slcIds,'slc_id',batchN,contiguous=True,orderBy=orderBy,
+                          capHours=capHours)
+
+def batch_link_slcs_to_new_jobs(polyid,user,slcIds,batchN,capHours=maxJobHours):
+    if slcIds.empty:
+        return
+    slcGroups = pack_slc_items(polyid,slcIds,batchN,capHours)
+    jids = link_items_to_new_jobs(polyid,user,'mk_image',slcGroups,
+                                  group_priorities(slcIds,'slc_id',slcGroups))
+    if jids:
+        print('first_job_id is',jids[0])
 
 ################################################################################
+@reconnecting
 def link_rslc_to_job(rslcId,jobId):
     # conn = engine.connect()
     #update
@@ -464,20 +1030,30 @@ def link_rslc_to_job(rslcId,jobId):
     #conn.commit()
     #conn.close()
 
-def batch_link_rslcs_to_new_jobs(polyid,user,rslcIds,batchN):
-    maxperjob=15
-    if len(rslcIds)/batchN > maxperjob:
-        print('increasing number of jobs to fit the maxperjob limit')
-        batchN = int(len(rslcIds)/maxperjob)
-    numrep = int(len(rslcIds)/batchN) + 1
-    bins = list(np.arange(batchN))*numrep
-    bins = bins[:len(rslcIds)]
-    rslcIds['bin'] = bins
-    #rslcIds['bin'] = pd.cut(rslcIds['rslc_id'],batchN,labels=False)
-    rslcGrouped = rslcIds.groupby('bin')
-    for label,rslcGroup in rslcGrouped:
-        jid = create_job(polyid,user,'coreg')
-        rslcGroup['rslc_id'].map(lambda s:link_rslc_to_job(s,jid))
+def pack_rslc_items(polyid,rslcIds,batchN,byDate=False,capHours=maxJobHours):
+    #(groups, first dates of the windows or None), see batch_link_rslcs_to_new_jobs
+    if not byDate:
+        return pack_job_items(polyid,'coreg',rslcIds,'rslc_id',batchN,capHours=capHours),None
+    #(within a job, the epochs are processed in the order of the rslc ids, see
+    #unbuilt_rslcs_query - not by date. createFrameCache.py creates the rslcs
+    #in the btemp order, the new epochs of an incremental update come last)
+    rslcGroups = pack_job_items(polyid,'coreg',rslcIds,'rslc_id',batchN,
+                                contiguous=True,orderBy='acq_date',capHours=capHours)
+    dateOfRslc = rslcIds.set_index('rslc_id')['acq_date']
+    return rslcGroups,window_starts([dateOfRslc[g].values for g in rslcGroups])
+
+def batch_link_rslcs_to_new_jobs(polyid,user,rslcIds,batchN,byDate=False,capHours=maxJobHours):
+    #rslcs come sorted by btemp to the master - with similar costs they are
+    #dealt round robin, so every job starts close to the master.
+    #byDate (needs acq_date) gives every job a window of consecutive epochs
+    #instead, so the ifgs can be grouped to depend on few coreg jobs - returns
+    #the first dates of the windows (for batch_link_ifgs/unws_to_new_jobs)
+    if rslcIds.empty:
+        return None
+    rslcGroups,windows = pack_rslc_items(polyid,rslcIds,batchN,byDate,capHours)
+    link_items_to_new_jobs(polyid,user,'coreg',rslcGroups,
+                           group_priorities(rslcIds,'rslc_id',rslcGroups))
+    return windows
 
 
 def batch_link_rslcs_to_new_jobs_todo(polyid,user,rslcs_pd,batchN):
@@ -498,12 +1074,12 @@ def batch_link_rslcs_to_new_jobs_todo(polyid,user,rslcs_pd,batchN):
     #for label,rslcGroup in rslcGrouped:
         #make sure each group has no uncoregistrable item
     #    abs(rslcGroup.btemp).min().days
-    for label,rslcGroup in rslcGrouped:
-        jid = create_job(polyid,user,'coreg')
-        rslcGroup['rslc_id'].map(lambda s:link_rslc_to_job(s,jid))
+    rslcGroups = [rslcGroup['rslc_id'] for label,rslcGroup in rslcGrouped]
+    link_items_to_new_jobs(polyid,user,'coreg',rslcGroups)
 
 
 ################################################################################
+@reconnecting
 def link_ifg_to_job(ifgId,jobId):
     # conn = engine.connect()
     #update
@@ -515,14 +1091,30 @@ def link_ifg_to_job(ifgId,jobId):
     # conn.close()
 
 
-def batch_link_ifgs_to_new_jobs(polyid,user,ifgIds,batchN):
-    ifgIds['bin'] = pd.cut(ifgIds['ifg_id'],batchN,labels=False)
-    ifgGrouped = ifgIds.groupby('bin')
-    for label,ifgGroup in ifgGrouped:
-        jid = create_job(polyid,user,'mk_ifg')
-        ifgGroup['ifg_id'].map(lambda s:link_ifg_to_job(s,jid))
+def pack_pair_items(polyid,jobType,pairIds,idCol,batchN,windows=None,capHours=maxJobHours):
+    #ifgs/unws with acq_date_1/2 are packed in the order of their later epoch,
+    #separately for each of the date windows of the coreg jobs if given (then a
+    #job needs only the rslcs of its window and the few before it). without the
+    #dates, in the order of the ids
+    if 'acq_date_2' not in pairIds.columns:
+        return pack_job_items(polyid,jobType,pairIds,idCol,batchN,contiguous=True,capHours=capHours)
+    orderBy = ['acq_date_2','acq_date_1']
+    if windows is None or not len(windows):
+        return pack_job_items(polyid,jobType,pairIds,idCol,batchN,contiguous=True,orderBy=orderBy,
+                              capHours=capHours)
+    pairIds = pairIds.assign(window=window_index(windows,pairIds['acq_date_2'].values))
+    return pack_job_items(polyid,jobType,pairIds,idCol,batchN,orderBy=orderBy,windows='window',
+                          capHours=capHours)
+
+def batch_link_ifgs_to_new_jobs(polyid,user,ifgIds,batchN,windows=None,capHours=maxJobHours):
+    if ifgIds.empty:
+        return
+    ifgGroups = pack_pair_items(polyid,'mk_ifg',ifgIds,'ifg_id',batchN,windows,capHours)
+    link_items_to_new_jobs(polyid,user,'mk_ifg',ifgGroups,
+                           group_priorities(ifgIds,'ifg_id',ifgGroups))
 
 ################################################################################
+@reconnecting
 def link_unw_to_job(unwId,jobId):
     # conn = engine.connect()
     #update
@@ -533,29 +1125,154 @@ def link_unw_to_job(unwId,jobId):
     # conn.commit()
     # conn.close()
 
-def batch_link_unws_to_new_jobs(polyid,user,unwIds,batchN):
-    unwIds['bin'] = pd.cut(unwIds['unw_id'],batchN,labels=False)
-    unwGrouped = unwIds.groupby('bin')
-    for label,unwGroup in unwGrouped:
-        jid = create_job(polyid,user,'unwrap')
-        unwGroup['unw_id'].map(lambda s:link_unw_to_job(s,jid))
+def batch_link_unws_to_new_jobs(polyid,user,unwIds,batchN,windows=None,capHours=maxJobHours):
+    if unwIds.empty:
+        return
+    unwGroups = pack_pair_items(polyid,'unwrap',unwIds,'unw_id',batchN,windows,capHours)
+    link_items_to_new_jobs(polyid,user,'unwrap',unwGroups,
+                           group_priorities(unwIds,'unw_id',unwGroups))
 
 ################################################################################
-def get_unbuilt_slcs(jobID):
+# Job dependencies
+################################################################################
+# jobs of the previous stage that a job has to wait for: coreg for the mk_image
+# jobs of its epochs, mk_ifg for the coreg jobs of the epochs of its ifgs,
+# unwrap for the mk_ifg jobs of its ifgs. only unbuilt items count (on both
+# sides) - a job with everything built neither waits nor is waited for. given
+# the user, only the jobs of the user count (as in the step lists of
+# licsar_make_frame.sh)
+def unbuilt_item(table,kind):
+    return func.coalesce(table.c[kind+'_status'],-1).notin_([0,-6])
+
+def job_dependencies_query(polyid,jobType,user=None):
+    if jobType == 'coreg':
+        pairs = [(rslc,slc,[slc.c.img_id==rslc.c.img_id],'rslc','slc')]
+    elif jobType == 'mk_ifg':
+        pairs = [(ifg,rslc,[rslc.c.img_id==ifg.c.img_id_1],'ifg','rslc'),
+                 (ifg,rslc,[rslc.c.img_id==ifg.c.img_id_2],'ifg','rslc')]
+    elif jobType == 'unwrap':
+        pairs = [(unw,ifg,[ifg.c.img_id_1==unw.c.img_id_1,ifg.c.img_id_2==unw.c.img_id_2],'unw','ifg')]
+    else:
+        return None
+    sels = []
+    for itemTable,preTable,onclause,kind,preKind in pairs:
+        join = itemTable.join(preTable,onclause=and_(preTable.c.polyid==itemTable.c.polyid,*onclause))
+        conds = [itemTable.c.polyid==polyid,itemTable.c.job_id!=None,preTable.c.job_id!=None,
+                 unbuilt_item(itemTable,kind),unbuilt_item(preTable,preKind)]
+        if user:
+            itemJobs = jobs.alias()
+            preJobs = jobs.alias()
+            join = join.join(itemJobs,onclause=itemJobs.c.job_id==itemTable.c.job_id
+                      ).join(preJobs,onclause=preJobs.c.job_id==preTable.c.job_id)
+            conds += [itemJobs.c.user==user,preJobs.c.user==user]
+        sels.append(select(itemTable.c.job_id,preTable.c.job_id.label('pre_job_id')).select_from(
+                join).where(and_(*conds)).distinct())
+    return union_all(*sels) if len(sels) > 1 else sels[0]
+
+@reconnecting
+def get_job_dependencies(polyid,jobType=None,user=None):
+    #{job_id: [job ids it waits for]} of the frame jobs (of the jobType, of
+    #the user) that have to wait for any
+    deps = {}
+    with engine.connect() as conn:
+        for kind in ([jobType] if jobType else ['coreg','mk_ifg','unwrap']):
+            depSel = job_dependencies_query(polyid,kind,user)
+            if depSel is None:
+                continue
+            for jobId,preJobId in conn.execute(depSel):
+                deps.setdefault(int(jobId),set()).add(int(preJobId))
+    return {jobId:sorted(pre) for jobId,pre in sorted(deps.items())}
+
+################################################################################
+# Priorities
+################################################################################
+# items and jobs have a priority (sql/migration_006_priority.sql, the levels
+# are in batchPackLib) - the items of a job are processed, the items claimed
+# and the jobs submitted in the order of it. without the column everything is
+# routine
+def has_priority():
+    return 'priority' in load_schema().tables['jobs'].c
+
+def item_priority(table):
+    return table.c.priority if has_priority() else literal(routinePriority)
+
+def item_order(table,idCol):
+    #the higher priority first, then in the order of the ids
+    if has_priority():
+        return [table.c.priority.desc(),table.c[idCol]]
+    return [table.c[idCol]]
+
+@reconnecting
+def get_job_priorities(polyid,jobType=None):
+    #{job_id: priority} of the frame jobs (of the jobType) above the routine
+    if not has_priority():
+        return {}
+    jobSel = select(jobs.c.job_id,jobs.c.priority).where(and_(jobs.c.polyid==polyid,
+            jobs.c.priority>routinePriority))
+    if jobType:
+        jobSel = jobSel.where(jobs.c.job_type==jobTypes[jobType])
+    with engine.connect() as conn:
+        return {int(jobId):int(priority) for jobId,priority in conn.execute(jobSel)}
+
+################################################################################
+# Pending jobs of many frames
+################################################################################
+def fleet_jobs_query(jobType,frames=None):
+    #jobs of the type with unbuilt items, of the given (otherwise the active)
+    #frames, with the number of the items, of the frame bursts and the priority
+    kind = jobKinds[jobType]
+    itemTable = statusTables[kind][0]
+    burstCount = select(polygs2bursts.c.polyid,
+            func.count(polygs2bursts.c.bid.distinct()).label('n_bursts')
+            ).group_by(polygs2bursts.c.polyid).subquery()
+    jobSel = select(polygs.c.polyid_name.label('frame'),itemTable.c.polyid,itemTable.c.job_id,
+            func.count().label('n_items'),func.max(burstCount.c.n_bursts).label('n_bursts'),
+            func.max(item_priority(itemTable)).label('priority')
+            ).select_from(itemTable.join(polygs,onclause=polygs.c.polyid==itemTable.c.polyid)\
+            .outerjoin(burstCount,onclause=burstCount.c.polyid==itemTable.c.polyid)
+            ).where(and_(itemTable.c.job_id!=None,unbuilt_item(itemTable,kind))
+            ).group_by(polygs.c.polyid_name,itemTable.c.polyid,itemTable.c.job_id
+            ).order_by(polygs.c.polyid_name,itemTable.c.job_id)
+    if frames:
+        jobSel = jobSel.where(polygs.c.polyid_name.in_(list(frames)))
+    else:
+        jobSel = jobSel.where(polygs.c.active==True)
+    return jobSel
+
+@reconnecting
+def get_fleet_jobs(jobType,frames=None):
+    #pending jobs of the type over many frames (see fleetJobPlan.py)
+    cols = ['frame','polyid','job_id','n_items','n_bursts','priority']
+    with engine.connect() as conn:
+        res = conn.execute(fleet_jobs_query(jobType,frames)).fetchall()
+    return pd.DataFrame(res,columns=cols)
 
+################################################################################
+def item_or_job(table,idCol,jobID,itemId=None):
+    #the unbuilt_*_query select the items of a job, or the one item if given
+    if itemId is not None:
+        return table.c[idCol]==itemId
+    return table.c.job_id==jobID
+
+def unbuilt_slcs_query(jobID,itemId=None):
     slcSel = select(slc.c.slc_id,acq_img.c.acq_date).select_from(
             slc.join(acq_img,onclause=acq_img.c.img_id==slc.c.img_id)
-            ).where(and_(slc.c.job_id==jobID,slc.c.slc_status!=0,
-                slc.c.slc_status!=-6))
-    conn = engine.connect()
-    # out = pd.read_sql_query(slcSel,conn,parse_dates=['acq_date'])
-    result = conn.execute(slcSel)
-    conn.close()
-    out = pd.DataFrame(result.fetchall())
+            ).where(and_(item_or_job(slc,'slc_id',jobID,itemId),slc.c.slc_status!=0,
+                slc.c.slc_status!=-6)).order_by(*item_order(slc,'slc_id'))
+    return slcSel
+
+@reconnecting
+def get_unbuilt_slcs(jobID):
+    slcSel = unbuilt_slcs_query(jobID)
+    with engine.connect() as conn:
+        # out = pd.read_sql_query(slcSel,conn,parse_dates=['acq_date'])
+        result = conn.execute(slcSel)
+        out = pd.DataFrame(result.fetchall())
     out['acq_date'] = pd.to_datetime(out['acq_date'])
     return out
 
 ################################################################################
+@reconnecting
 def get_unreq_slcs(polyID):
 
     slcSel = select(slc.c.slc_id,acq_img.c.acq_date).select_from(
@@ -563,72 +1280,75 @@ def get_unreq_slcs(polyID):
                     .join(rslc,onclause=rslc.c.img_id==slc.c.img_id)
             ).where(and_(slc.c.polyid==polyID,slc.c.slc_status==0,
                 rslc.c.rslc_status==0))
-    conn = engine.connect()
-    # out = pd.read_sql_query(slcSel,conn,parse_dates=['acq_date'])
-    result = conn.execute(slcSel)
-    conn.close()
-    out = pd.DataFrame(result.fetchall())
+    with engine.connect() as conn:
+        # out = pd.read_sql_query(slcSel,conn,parse_dates=['acq_date'])
+        result = conn.execute(slcSel)
+        out = pd.DataFrame(result.fetchall())
     out['acq_date'] = pd.to_datetime(out['acq_date'])
     return out
 
 ################################################################################
+@reconnecting
 def get_unreq_slc_on_date(polyID,date):
 
     slcSel = select(slc.c.slc_id,acq_img.c.acq_date).select_from(
             slc.join(acq_img,onclause=acq_img.c.img_id==slc.c.img_id)\
                     .join(rslc,onclause=rslc.c.img_id==slc.c.img_id)
             ).where(and_(slc.c.polyid==polyID,slc.c.slc_status==0,
-                rslc.c.rslc_status==0,func.date(acq_img.c.acq_date)==date.date()))
-    conn = engine.connect()
-    # out = pd.read_sql_query(slcSel,conn,parse_dates=['acq_date'])
-    result = conn.execute(slcSel)
-    conn.close()
-    out = pd.DataFrame(result.fetchall())
+                rslc.c.rslc_status==0,on_days(acq_img.c.acq_date,date)))
+    with engine.connect() as conn:
+        # out = pd.read_sql_query(slcSel,conn,parse_dates=['acq_date'])
+        result = conn.execute(slcSel)
+        out = pd.DataFrame(result.fetchall())
     out['acq_date'] = pd.to_datetime(out['acq_date'])
     return out
 
 ################################################################################
-def get_unbuilt_rslcs(jobID):
-
+def unbuilt_rslcs_query(jobID,itemId=None):
     rslcSel = select(rslc.c.rslc_id,acq_img.c.acq_date).select_from(
             rslc.join(acq_img,onclause=acq_img.c.img_id==rslc.c.img_id)\
             .join(slc,onclause=slc.c.img_id==rslc.c.img_id)
-            ).where(and_(rslc.c.job_id==jobID,rslc.c.rslc_status!=0,
-                rslc.c.rslc_status!=-6,slc.c.slc_status==0))
-    conn = engine.connect()
-    # out = pd.read_sql_query(rslcSel,conn,parse_dates=['acq_date'])
-    result = conn.execute(rslcSel)
-    conn.close()
-    out = pd.DataFrame(result.fetchall())
+            ).where(and_(item_or_job(rslc,'rslc_id',jobID,itemId),rslc.c.rslc_status!=0,
+                rslc.c.rslc_status!=-6,slc.c.slc_status==0)).order_by(*item_order(rslc,'rslc_id'))
+    return rslcSel
+
+@reconnecting
+def get_unbuilt_rslcs(jobID):
+    rslcSel = unbuilt_rslcs_query(jobID)
+    with engine.connect() as conn:
+        # out = pd.read_sql_query(rslcSel,conn,parse_dates=['acq_date'])
+        result = conn.execute(rslcSel)
+        out = pd.DataFrame(result.fetchall())
     out['acq_date'] = pd.to_datetime(out['acq_date'])
     return out
 
+@reconnecting
 def get_all_slcs(polyid):
 
     slcSel = select(slc.c.slc_id,acq_img.c.acq_date).select_from(
             slc.join(acq_img,onclause=acq_img.c.img_id==slc.c.img_id)\
             ).where(slc.c.polyid==polyid)
-    conn = engine.connect()
-    # out = pd.read_sql_query(slcSel,conn,parse_dates=['acq_date'])
-    result = conn.execute(slcSel)
-    conn.close()
-    out = pd.DataFrame(result.fetchall())
+    with engine.connect() as conn:
+        # out = pd.read_sql_query(slcSel,conn,parse_dates=['acq_date'])
+        result = conn.execute(slcSel)
+        out = pd.DataFrame(result.fetchall())
     out['acq_date'] = pd.to_datetime(out['acq_date'])
     return out
 
+@reconnecting
 def get_all_rslcs(polyid):
 
     rslcSel = select(rslc.c.rslc_id,acq_img.c.acq_date).select_from(
             rslc.join(acq_img,onclause=acq_img.c.img_id==rslc.c.img_id)\
             ).where(rslc.c.polyid==polyid)
-    conn = engine.connect()
-    # out = pd.read_sql_query(rslcSel,conn,parse_dates=['acq_date'])
-    result = conn.execute(rslcSel)
-    conn.close()
-    out = pd.DataFrame(result.fetchall())
+    with engine.connect() as conn:
+        # out = pd.read_sql_query(rslcSel,conn,parse_dates=['acq_date'])
+        result = conn.execute(rslcSel)
+        out = pd.DataFrame(result.fetchall())
     out['acq_date'] = pd.to_datetime(out['acq_date'])
     return out
 
+@reconnecting
 def get_all_ifgs(polyid):
     imgA = acq_img.alias()
     imgB = acq_img.alias()
@@ -643,15 +1363,15 @@ def get_all_ifgs(polyid):
             ).where(rslcA.c.polyid==polyid)
             #and_(ifg.c.job_id==jobID,ifg.c.ifg_status!=0,
             #     rslcA.c.rslc_status==0,rslcB.c.rslc_status==0))
-    conn = engine.connect()
-    # out = pd.read_sql_query(ifgSel,conn,parse_dates=['acq_date_1','acq_date_2'])
-    result = conn.execute(ifgSel)
-    conn.close()
-    out = pd.DataFrame(result.fetchall())
+    with engine.connect() as conn:
+        # out = pd.read_sql_query(ifgSel,conn,parse_dates=['acq_date_1','acq_date_2'])
+        result = conn.execute(ifgSel)
+        out = pd.DataFrame(result.fetchall())
     out['acq_date_1'] = pd.to_datetime(out['acq_date_1'])
     out['acq_date_2'] = pd.to_datetime(out['acq_date_2'])
     return out
 
+@reconnecting
 def get_all_unws(polyid):
     imgA = acq_img.alias()
     imgB = acq_img.alias()
@@ -666,31 +1386,175 @@ def get_all_unws(polyid):
             ).where(rslcA.c.polyid==polyid)
             #and_(ifg.c.job_id==jobID,ifg.c.ifg_status!=0,
             #     rslcA.c.rslc_status==0,rslcB.c.rslc_status==0))
-    conn = engine.connect()
-    # ut = pd.read_sql_query(unwSel,conn,parse_dates=['acq_date_1','acq_date_2'])
-    result = conn.execute(unwSel)
-    conn.close()
-    out = pd.DataFrame(result.fetchall())
+    with engine.connect() as conn:
+        # ut = pd.read_sql_query(unwSel,conn,parse_dates=['acq_date_1','acq_date_2'])
+        result = conn.execute(unwSel)
+        out = pd.DataFrame(result.fetchall())
     out['acq_date_1'] = pd.to_datetime(out['acq_date_1'])
     out['acq_date_2'] = pd.to_datetime(out['acq_date_2'])
     return out
 
 ################################################################################
+# Frame processing state in one query
+################################################################################
+#row kinds of the FrameState query (img_id_2 is only used by ifg/unw)
+frameStateKinds = ['acq','master','slc','rslc','ifg','unw']
+
+def frame_state_query(polyid):
+    #union of all the frame's rows with a common set of columns
+    kinds = {k:i for i,k in enumerate(frameStateKinds)}
+    def part(kind,itemId,imgId1,imgId2=None,status=None,jobId=None,value=None,acqDate=None,where=None):
+        cols = [literal(kinds[kind]).label('kind'),itemId.label('item_id'),imgId1.label('img_id_1')]
+        for name,col in [('img_id_2',imgId2),('status',status),('job_id',jobId),
+                         ('value',value),('acq_date',acqDate)]:
+            cols.append((col if col is not None else null()).label(name))
+        return select(*cols).where(where)
+    parts = [part('acq',acq_img.c.img_id,acq_img.c.img_id,value=acq_img.c.bperp,
+                acqDate=acq_img.c.acq_date,where=acq_img.c.polyid==polyid),
+             part('master',polygs2master.c.polyid,polygs2master.c.master_img_id,
+                where=polygs2master.c.polyid==polyid)]
+    for kind,table in [('slc',slc),('rslc',rslc)]:
+        parts.append(part(kind,table.c[kind+'_id'],table.c.img_id,
+                status=table.c[kind+'_status'],jobId=table.c.job_id,
+                where=table.c.polyid==polyid))
+    parts.append(part('ifg',ifg.c.ifg_id,ifg.c.img_id_1,ifg.c.img_id_2,
+                status=ifg.c.ifg_status,jobId=ifg.c.job_id,
+                where=ifg.c.polyid==polyid))
+    parts.append(part('unw',unw.c.unw_id,unw.c.img_id_1,unw.c.img_id_2,
+                status=unw.c.unw_status,jobId=unw.c.job_id,value=unw.c.unw_perc,
+                where=unw.c.polyid==polyid))
+    return union_all(*parts)
+
+class FrameState():
+    #snapshot of the processing state of a frame, i.e. acquisitions, reference
+    #epoch and all slc/rslc/ifg/unw rows with their statuses and job ids.
+    #tables are indexed by acq_date (acq, slcs, rslcs) or by the
+    #(acq_date_1,acq_date_2) pair (ifgs, unws), dates are normalised to days
+    #usage:
+    #   state = FrameState(polyid)
+    #   state.rslc_id('20200107'), state.ifg_id(date1,date2)
+    #   state.rslcs[state.rslcs.rslc_status == 0]
+    def __init__(self,polyid):
+        self.polyid = polyid
+        self.load()
+
+    @reconnecting
+    def load(self):
+        with engine.connect() as conn:
+            rows = conn.execute(frame_state_query(self.polyid)).fetchall()
+        raw = pd.DataFrame(rows,columns=['kind','item_id','img_id_1','img_id_2',
+            'status','job_id','value','acq_date'])
+        kinds = raw['kind'].astype(int).map(lambda k: frameStateKinds[k])
+        #acquisitions
+        acq = raw[kinds=='acq']
+        imgDates = pd.Series(pd.to_datetime(acq.acq_date.values).normalize(),
+                index=acq.img_id_1.astype(np.int32).values)
+        self.acq = pd.DataFrame({'img_id':acq.img_id_1.astype(np.int32).values,
+                'bperp':acq.value.astype(np.float32).values},
+                index=pd.DatetimeIndex(imgDates.values,name='acq_date')).sort_index()
+        self.master = None
+        mstr = raw[kinds=='master'].img_id_1.dropna()
+        if not mstr.empty:
+            self.master = imgDates.get(int(mstr.iloc[0]))
+        #products
+        for kind in ['slc','rslc']:
+            setattr(self,kind+'s',self.build(raw[kinds==kind],kind,imgDates,
+                {'img_id_1':('img_id','acq_date')}))
+        for kind in ['ifg','unw']:
+            setattr(self,kind+'s',self.build(raw[kinds==kind],kind,imgDates,
+                {'img_id_1':('img_id_1','acq_date_1'),'img_id_2':('img_id_2','acq_date_2')},
+                valueCol='unw_perc' if kind == 'unw' else None))
+        return self
+
+    @staticmethod
+    def build(rows,kind,imgDates,imgCols,valueCol=None):
+        out = pd.DataFrame({kind+'_id':rows.item_id.astype(np.int32).values})
+        for rawCol,(imgCol,dateCol) in imgCols.items():
+            out[imgCol] = rows[rawCol].astype(np.int32).values
+            out[dateCol] = imgDates.reindex(out[imgCol].values).values
+        out[kind+'_status'] = pd.array(rows.status.values,dtype='Int8')
+        out['job_id'] = pd.array(rows.job_id.values,dtype='Int32')
+        if valueCol:
+            out[valueCol] = rows.value.astype(np.float32).values
+        return out.set_index([dateCol for imgCol,dateCol in imgCols.values()]).sort_index()
+
+    @staticmethod
+    def to_date(date):
+        #accepts 'YYYYMMDD', date, datetime or Timestamp
+        if isinstance(date,str):
+            return pd.Timestamp(dt.datetime.strptime(date,'%Y%m%d'))
+        return pd.Timestamp(date).normalize()
+
+    def lookup(self,table,column,key):
+        try:
+            res = table.loc[key,column]
+        except KeyError:
+            return None
+        if isinstance(res,pd.Series):
+            res = res.iloc[0]
+        return None if pd.isnull(res) else int(res)
+
+    def slc_id(self,date):
+        return self.lookup(self.slcs,'slc_id',self.to_date(date))
+
+    def rslc_id(self,date):
+        return self.lookup(self.rslcs,'rslc_id',self.to_date(date))
+
+    def ifg_id(self,date1,date2):
+        return self.lookup(self.ifgs,'ifg_id',(self.to_date(date1),self.to_date(date2)))
+
+    def unw_id(self,date1,date2):
+        return self.lookup(self.unws,'unw_id',(self.to_date(date1),self.to_date(date2)))
+
+    def status(self,kind,*dates):
+        #e.g. state.status('rslc',date) or state.status('ifg',date1,date2)
+        table = getattr(self,kind+'s')
+        key = self.to_date(dates[0]) if len(dates) == 1 else tuple(self.to_date(d) for d in dates)
+        return self.lookup(table,kind+'_status',key)
+
+    def ids_on_dates(self,kind,dates):
+        #(slc/rslc) ids of the items on the given dates, e.g. directory names
+        #'YYYYMMDD' - unparseable or unknown dates are skipped
+        dates = pd.DatetimeIndex(pd.to_datetime(pd.Series(list(dates),dtype=object),
+                    format='%Y%m%d',errors='coerce').dropna())
+        table = getattr(self,kind+'s')
+        return table.loc[table.index.isin(dates),kind+'_id'].values
+
+    def ids_on_pairs(self,kind,pairs):
+        #(ifg/unw) ids of the items on the given date pairs 'YYYYMMDD_YYYYMMDD'
+        pairs = pd.Series(list(pairs),dtype=object).str.split('_',expand=True)
+        table = getattr(self,kind+'s')
+        if pairs.empty or pairs.shape[1] < 2:
+            return table[kind+'_id'].values[:0]
+        pairs = pd.MultiIndex.from_arrays([
+                    pd.to_datetime(pairs[0],format='%Y%m%d',errors='coerce'),
+                    pd.to_datetime(pairs[1],format='%Y%m%d',errors='coerce')]).dropna()
+        return table.loc[table.index.isin(pairs),kind+'_id'].values
+
+    def status_counts(self):
+        #number of items per status for each product, e.g. for reporting
+        counts = {}
+        for kind in ['slc','rslc','ifg','unw']:
+            counts[kind] = getattr(self,kind+'s')[kind+'_status'].value_counts(dropna=False)
+        return pd.DataFrame(counts).fillna(0).astype(int)
+
+################################################################################
+@reconnecting
 def get_built_rslcs(polyid):
 
     rslcSel = select(rslc.c.rslc_id,acq_img.c.acq_date).select_from(
             rslc.join(acq_img,onclause=acq_img.c.img_id==rslc.c.img_id)\
             .join(slc,onclause=slc.c.img_id==rslc.c.img_id)
             ).where(and_(rslc.c.polyid==polyid,rslc.c.rslc_status==0))
-    conn = engine.connect()
-    # out = pd.read_sql_query(rslcSel,conn,parse_dates=['acq_date'])
-    result = conn.execute(rslcSel)
-    conn.close()
-    out = pd.DataFrame(result.fetchall())
+    with engine.connect() as conn:
+        # out = pd.read_sql_query(rslcSel,conn,parse_dates=['acq_date'])
+        result = conn.execute(rslcSel)
+        out = pd.DataFrame(result.fetchall())
     out['acq_date'] = pd.to_datetime(out['acq_date'])
     return out
 
 ################################################################################
+@reconnecting
 def get_unreq_rslcs(polyID):
     ifgA = ifg.alias()
     ifgB = ifg.alias()
@@ -701,17 +1565,15 @@ def get_unreq_rslcs(polyID):
                     .join(ifgB,onclause=ifgB.c.img_id_2==rslc.c.img_id)
             ).where(and_(rslc.c.polyid==polyID,rslc.c.rslc_status==0,
                 ifgA.c.ifg_status==0,ifgB.c.ifg_status==0))
-    conn = engine.connect()
-    # out = pd.read_sql_query(rslcSel,conn,parse_dates=['acq_date'])
-    result = conn.execute(rslcSel)
-    conn.close()
-    out = pd.DataFrame(result.fetchall())
+    with engine.connect() as conn:
+        # out = pd.read_sql_query(rslcSel,conn,parse_dates=['acq_date'])
+        result = conn.execute(rslcSel)
+        out = pd.DataFrame(result.fetchall())
     out['acq_date'] = pd.to_datetime(out['acq_date'])
     return out
 
 ################################################################################
-def get_unbuilt_ifgs(jobID):
-
+def unbuilt_ifgs_query(jobID,itemId=None):
     imgA = acq_img.alias()
     imgB = acq_img.alias()
     rslcA = rslc.alias()
@@ -731,18 +1593,23 @@ def get_unbuilt_ifgs(jobID):
             .join(imgB,onclause=imgB.c.img_id==ifg.c.img_id_2)\
             .join(rslcA,onclause=rslcA.c.img_id==ifg.c.img_id_1)\
             .join(rslcB,onclause=rslcB.c.img_id==ifg.c.img_id_2)
-            ).where(and_(ifg.c.job_id==jobID,ifg.c.ifg_status!=0))
-    conn = engine.connect()
-    # out = pd.read_sql_query(ifgSel,conn,parse_dates=['acq_date_1','acq_date_2'])
-    result = conn.execute(ifgSel)
-    conn.close()
-    out = pd.DataFrame(result.fetchall())
+            ).where(and_(item_or_job(ifg,'ifg_id',jobID,itemId),ifg.c.ifg_status!=0)
+            ).order_by(*item_order(ifg,'ifg_id'))
+    return ifgSel
+
+@reconnecting
+def get_unbuilt_ifgs(jobID):
+    ifgSel = unbuilt_ifgs_query(jobID)
+    with engine.connect() as conn:
+        # out = pd.read_sql_query(ifgSel,conn,parse_dates=['acq_date_1','acq_date_2'])
+        result = conn.execute(ifgSel)
+        out = pd.DataFrame(result.fetchall())
     out['acq_date_1'] = pd.to_datetime(out['acq_date_1'])
     out['acq_date_2'] = pd.to_datetime(out['acq_date_2'])
     return out
 
 ################################################################################
-def get_unbuilt_unws(jobID):
+def unbuilt_unws_query(jobID,itemId=None):
     imgA = acq_img.alias()
     imgB = acq_img.alias()
     #unwSel = select([unw.c.unw_id,imgA.c.acq_date.label('acq_date_1'),
@@ -762,17 +1629,23 @@ def get_unbuilt_unws(jobID):
             .join(ifg,
                 onclause=and_(ifg.c.img_id_1==unw.c.img_id_1,
                     ifg.c.img_id_2==unw.c.img_id_2))
-            ).where(and_(unw.c.job_id==jobID,unw.c.unw_status!=0))
-    conn = engine.connect()
-    # out = pd.read_sql_query(unwSel,conn,parse_dates=['acq_date_1','acq_date_2'])
-    result = conn.execute(unwSel)
-    conn.close()
-    out = pd.DataFrame(result.fetchall())
+            ).where(and_(item_or_job(unw,'unw_id',jobID,itemId),unw.c.unw_status!=0)
+            ).order_by(*item_order(unw,'unw_id'))
+    return unwSel
+
+@reconnecting
+def get_unbuilt_unws(jobID):
+    unwSel = unbuilt_unws_query(jobID)
+    with engine.connect() as conn:
+        # out = pd.read_sql_query(unwSel,conn,parse_dates=['acq_date_1','acq_date_2'])
+        result = conn.execute(unwSel)
+        out = pd.DataFrame(result.fetchall())
     out['acq_date_1'] = pd.to_datetime(out['acq_date_1'])
     out['acq_date_2'] = pd.to_datetime(out['acq_date_2'])
     return out
 
 ################################################################################
+@reconnecting
 def get_built_unws(polyID):
 
     imgA = acq_img.alias()
@@ -785,21 +1658,18 @@ def get_built_unws(polyID):
                 onclause=and_(ifg.c.img_id_1==unw.c.img_id_1,
                     ifg.c.img_id_2==unw.c.img_id_2))
             ).where(and_(unw.c.polyid==polyID,unw.c.unw_status==0))
-    conn = engine.connect()
-    # out = pd.read_sql_query(unwSel,conn,parse_dates=['acq_date_1','acq_date_2'])
-    result = conn.execute(unwSel)
-    conn.close()
-    out = pd.DataFrame(result.fetchall())
+    with engine.connect() as conn:
+        # out = pd.read_sql_query(unwSel,conn,parse_dates=['acq_date_1','acq_date_2'])
+        result = conn.execute(unwSel)
+        out = pd.DataFrame(result.fetchall())
     out['acq_date_1'] = pd.to_datetime(out['acq_date_1'])
     out['acq_date_2'] = pd.to_datetime(out['acq_date_2'])
     return out
 
 ################################################################################
 
-def get_bursts_in_frame(framename):
-    conn = engine.connect()
-
-    brstSel = select(bursts.c.bid_tanx.distinct(),bursts.c.centre_lon,bursts.c.centre_lat)\
+def bursts_in_frame_query(framename):
+    return select(bursts.c.bid_tanx.distinct(),bursts.c.centre_lon,bursts.c.centre_lat)\
         .select_from(
             bursts.join(polygs2bursts,
                     onclause=polygs2bursts.c.bid==bursts.c.bid)\
@@ -807,16 +1677,17 @@ def get_bursts_in_frame(framename):
                     onclause=polygs.c.polyid==polygs2bursts.c.polyid)
         ).where(polygs.c.polyid_name==framename)
 
-    sqlRes = conn.execute(brstSel)
-    burstInfo = sqlRes.fetchall()
-    conn.close()
+@reconnecting
+def get_bursts_in_frame(framename):
+    with engine.connect() as conn:
+        brstSel = bursts_in_frame_query(framename)
+        sqlRes = conn.execute(brstSel)
+        burstInfo = sqlRes.fetchall()
     return burstInfo
 
 ################################################################################
-def get_frame_bursts_on_date(frame,date):
-    conn = engine.connect()
-
-    brstSel = select(bursts.c.bid_tanx.distinct(),bursts.c.centre_lon,bursts.c.centre_lat)\
+def frame_bursts_on_dates_query(frame,dates):
+    return select(files.c.acq_date,bursts.c.bid_tanx,bursts.c.centre_lon,bursts.c.centre_lat)\
         .select_from(
             bursts.join(polygs2bursts,
                     onclause=polygs2bursts.c.bid==bursts.c.bid)\
@@ -827,50 +1698,66 @@ def get_frame_bursts_on_date(frame,date):
             .join(files,
                     onclause=files.c.fid==files2bursts.c.fid)
         ).where(and_(polygs.c.polyid_name==frame,
-                    func.date(files.c.acq_date)==date.strftime('%Y-%m-%d'))
-                )
+                    on_any_days(files.c.acq_date,dates))
+                ).distinct()
+
+def group_by_dates(rows,dates,extraDays=0):
+    #rows (acq_date, ...) -> {date: [(...),..]} for each of the dates, a row
+    #belongs to the date if acquired on that day or up to extraDays after
+    onDay = {}
+    for row in rows:
+        day = to_day(row[0])
+        if not tuple(row[1:]) in onDay.setdefault(day,[]):
+            onDay[day].append(tuple(row[1:]))
+    out = {}
+    for date in dates:
+        out[date] = []
+        for i in range(extraDays+1):
+            for row in onDay.get(to_day(date)+dt.timedelta(days=i),[]):
+                if not row in out[date]:
+                    out[date].append(row)
+    return out
 
-    sqlRes = conn.execute(brstSel)
-    burstInfo = sqlRes.fetchall()
-    conn.close()
+@reconnecting
+def get_frame_bursts_on_dates(frame,dates):
+    #bursts (bid_tanx, centre_lon, centre_lat) of the frame acquired on each of
+    #the dates, in one query: returns {date: [bursts..]}
+    if len(dates) == 0:
+        return {}
+    with engine.connect() as conn:
+        sqlRes = conn.execute(frame_bursts_on_dates_query(frame,dates))
+        burstInfo = group_by_dates(sqlRes.fetchall(),dates)
     return burstInfo
 
+def get_frame_bursts_on_date(frame,date):
+    return get_frame_bursts_on_dates(frame,[date])[date]
+
 ################################################################################
+@reconnecting
 def get_frame_files_period(frame,startdate,enddate):
 
-    conn = engine.connect()
-
-    fileQry = select(polygs.c.polyid_name,func.date(files.c.acq_date),\
-            files.c.name, files.c.abs_path).select_from(
-                    files.join(files2bursts,
-                        onclause=files.c.fid==files2bursts.c.fid)\
-                    .join(polygs2bursts,
-                        onclause=polygs2bursts.c.bid==files2bursts.c.bid)\
-                    .join(polygs,
-                        onclause=polygs.c.polyid==polygs2bursts.c.polyid)
-                    ).where(and_(polygs.c.polyid_name==frame,
-                        between(func.date(files.c.acq_date),startdate.date(),enddate.date()))
-                        ).distinct()
-                        # ).order_by(files.c.acq_date).distinct()
-
-    sqlRes = conn.execute(fileQry)
-    try:
+    with engine.connect() as conn:
+        fileQry = select(polygs.c.polyid_name,func.date(files.c.acq_date),\
+                files.c.name, files.c.abs_path).select_from(
+                        files.join(files2bursts,
+                            onclause=files.c.fid==files2bursts.c.fid)\
+                        .join(polygs2bursts,
+                            onclause=polygs2bursts.c.bid==files2bursts.c.bid)\
+                        .join(polygs,
+                            onclause=polygs.c.polyid==polygs2bursts.c.polyid)
+                        ).where(and_(polygs.c.polyid_name==frame,
+                            on_days(files.c.acq_date,startdate,enddate))
+                            ).distinct()
+                            # ).order_by(files.c.acq_date).distinct()
+
+        sqlRes = conn.execute(fileQry)
         res = sqlRes.fetchall()
-    except:
-        res = None
-        print('error fetching sql result')
-    conn.close()
     return res
 
 
 ################################################################################
-def get_frame_files_date(frame,date):
-    if type(date) is not type(dt.datetime.now().date()):
-        date = date.date()
-    
-    conn = engine.connect()
-
-    fileQry = select(polygs.c.polyid_name,\
+def frame_files_dates_query(frame,dates):
+    return select(files.c.acq_date,polygs.c.polyid_name,\
             files.c.name, files.c.abs_path).select_from(
                     files.join(files2bursts,
                         onclause=files.c.fid==files2bursts.c.fid)\
@@ -879,108 +1766,511 @@ def get_frame_files_date(frame,date):
                     .join(polygs,
                         onclause=polygs.c.polyid==polygs2bursts.c.polyid)
                     ).where(and_(polygs.c.polyid_name==frame,
-                                 or_(func.date(files.c.acq_date)==date,
-                                     func.date(files.c.acq_date)==date+dt.timedelta(days=1)
-                                    )
+                                 #files of the date or the day after (date lines..)
+                                 on_any_days(files.c.acq_date,dates,extraDays=1)
                                 )
                         ).distinct()
                         #).order_by(files.c.acq_date).distinct()  # not working in mysql 8
 
-    sqlRes = conn.execute(fileQry)
-    try:
-        res = sqlRes.fetchall()
-    except:
-        res = None
-        print('error fetching sql result')
-    conn.close()
+@reconnecting
+def get_frame_files_dates(frame,dates):
+    #files (polyid_name, name, abs_path) of the frame for each of the dates
+    #(incl. files from the day after), in one query: returns {date: [files..]}
+    if len(dates) == 0:
+        return {}
+    with engine.connect() as conn:
+        sqlRes = conn.execute(frame_files_dates_query(frame,dates))
+        res = group_by_dates(sqlRes.fetchall(),dates,extraDays=1)
     return res
 
+def get_frame_files_date(frame,date):
+    return get_frame_files_dates(frame,[date])[date]
+
 
 ################################################################################
+@reconnecting
 def get_burst_no(frame,date):
 
-    conn = engine.connect()
-
-    brstQry = select(bursts.c.bid_tanx.distinct(), files.c.name, files2bursts.c.burst_no).select_from(
-            bursts.join(files2bursts,
-                onclause=files2bursts.c.bid==bursts.c.bid)\
-            .join(files,
-                onclause=files.c.fid==files2bursts.c.fid)\
-            .join(polygs2bursts,
-                onclause=polygs2bursts.c.bid==bursts.c.bid)\
-            .join(polygs,
-                onclause=polygs.c.polyid==polygs2bursts.c.polyid)
-            ).where(and_(polygs.c.polyid_name==frame,
-                func.date(files.c.acq_date)==date.date())) #\
-            # .order_by(files.c.acq_date)
+    with engine.connect() as conn:
+        brstQry = select(bursts.c.bid_tanx.distinct(), files.c.name, files2bursts.c.burst_no).select_from(
+                bursts.join(files2bursts,
+                    onclause=files2bursts.c.bid==bursts.c.bid)\
+                .join(files,
+                    onclause=files.c.fid==files2bursts.c.fid)\
+                .join(polygs2bursts,
+                    onclause=polygs2bursts.c.bid==bursts.c.bid)\
+                .join(polygs,
+                    onclause=polygs.c.polyid==polygs2bursts.c.polyid)
+                ).where(and_(polygs.c.polyid_name==frame,
+                    on_days(files.c.acq_date,date))) #\
+                # .order_by(files.c.acq_date)
 
-    sqlRes = conn.execute(brstQry)
+        sqlRes = conn.execute(brstQry)
 
-    try:
         res = sqlRes.fetchall()
-    except:
-        res = None
-        print('error fetching sql result')
-    conn.close()
     return res
 
 ################################################################################
+# Frame progress summary
+################################################################################
+# frame_progress (sql/migration_003_frame_progress.sql) holds the number of
+# items per frame, stage and status. the status setters update it in the same
+# transaction (from the old statuses of the changed items), the bulk rebuilds
+# recount the frame. recount_frame_progress(conn) recomputes it from scratch
+# (see frameProgress.py). without the table, nothing is done
+progressKinds = ['slc','rslc','ifg','unw']
+
+def has_frame_progress():
+    return 'frame_progress' in load_schema().tables
+
+def apply_progress(conn,deltas):
+    #deltas ... {(polyid,stage,status):change of the count}
+    now = dt.datetime.now()
+    for (polyid,stage,status),n in deltas.items():
+        if not n:
+            continue
+        key = {'polyid':polyid,'stage':stage,'status':status}
+        if conn.dialect.name == 'mysql':
+            from sqlalchemy.dialects.mysql import insert as mysql_insert
+            progIns = mysql_insert(frame_progress).values(n=n,time_updated=now,**key)
+            conn.execute(progIns.on_duplicate_key_update(n=frame_progress.c.n+n,time_updated=now))
+        else:
+            progUpd = frame_progress.update().where(and_(frame_progress.c.polyid==polyid,
+                    frame_progress.c.stage==stage,frame_progress.c.status==status)).values(
+                            n=frame_progress.c.n+n,time_updated=now)
+            if not conn.execute(progUpd).rowcount:
+                conn.execute(frame_progress.insert().values(n=n,time_updated=now,**key))
+
+def update_items_status(conn,kind,ids,status):
+    #UPDATE of the item statuses (chunked IN lists) incl. the frame_progress
+    #counts, in the transaction of conn. returns number of updated rows
+    statTable, idCol = statusTables[kind]
+    statCol = statTable.c[kind+'_status']
+    ids = sorted(set(int(i) for i in ids))
+    progress = kind in progressKinds and has_frame_progress()
+    count = 0
+    for i in range(0,len(ids),maxInList):
+        onIds = statTable.c[idCol].in_(ids[i:i+maxInList])
+        if progress:
+            oldSel = select(statTable.c.polyid,statCol,func.count()).where(and_(onIds,
+                    statCol.is_distinct_from(status))).group_by(statTable.c.polyid,statCol)
+            old = conn.execute(oldSel).fetchall()
+        count += conn.execute(statTable.update().where(onIds).values(
+                {kind+'_status':status})).rowcount
+        if progress:
+            deltas = {}
+            for polyid,oldStatus,n in old:
+                if oldStatus is not None:
+                    deltas[(polyid,kind,oldStatus)] = deltas.get((polyid,kind,oldStatus),0)-n
+                if status is not None:
+                    deltas[(polyid,kind,status)] = deltas.get((polyid,kind,status),0)+n
+            apply_progress(conn,deltas)
+    return count
+
+def recount_frame_progress(conn,polyids=None):
+    #recomputes frame_progress of the given frames (all if None) from the item tables
+    if not has_frame_progress():
+        return 0
+    now = dt.datetime.now()
+    progDlt = frame_progress.delete()
+    if polyids is not None:
+        progDlt = progDlt.where(frame_progress.c.polyid.in_(polyids))
+    conn.execute(progDlt)
+    count = 0
+    for kind in progressKinds:
+        statTable = statusTables[kind][0]
+        statCol = statTable.c[kind+'_status']
+        cntSel = select(statTable.c.polyid,literal(kind),statCol,func.count(),
+                literal(now)).where(statCol!=None).group_by(statTable.c.polyid,statCol)
+        if polyids is not None:
+            cntSel = cntSel.where(statTable.c.polyid.in_(polyids))
+        res = conn.execute(frame_progress.insert().from_select(
+                ['polyid','stage','status','n','time_updated'],cntSel))
+        count += res.rowcount
+    return count
+
+@reconnecting
+def refresh_frame_progress(polyids=None):
+    with engine.begin() as conn:
+        return recount_frame_progress(conn,polyids)
+
+def frame_progress_query(frame=None,activeOnly=True):
+    #per frame and stage: total number of items and the built ones
+    #(slcs removed after coreg count as built)
+    built = or_(frame_progress.c.status==0,
+            and_(frame_progress.c.stage=='slc',frame_progress.c.status==-6))
+    progSel = select(polygs.c.polyid_name.label('frame'),frame_progress.c.stage,
+            func.sum(frame_progress.c.n).label('total'),
+            func.sum(case((built,frame_progress.c.n),else_=0)).label('built'),
+            func.max(frame_progress.c.time_updated).label('time_updated')).select_from(
+                    frame_progress.join(polygs,onclause=polygs.c.polyid==frame_progress.c.polyid)
+            ).group_by(polygs.c.polyid_name,frame_progress.c.stage)
+    if frame:
+        progSel = progSel.where(polygs.c.polyid_name==frame)
+    if activeOnly:
+        progSel = progSel.where(polygs.c.active==True)
+    return progSel
+
+@reconnecting
+def get_frame_progress(frame=None,activeOnly=True):
+    #frame coverage report from frame_progress - one row per frame with the
+    #built/total ratio and counts per stage (instead of sql/frameQry.sql)
+    with engine.connect() as conn:
+        res = conn.execute(frame_progress_query(frame,activeOnly)).fetchall()
+    prog = pd.DataFrame(res,columns=['frame','stage','total','built','time_updated'])
+    if prog.empty:
+        return prog
+    prog['coverage'] = prog['built']/prog['total']
+    out = prog.pivot(index='frame',columns='stage',values=['coverage','built','total'])
+    out.columns = ['{}_{}'.format(stage,col) for col,stage in out.columns]
+    out['time_updated'] = prog.groupby('frame')['time_updated'].max()
+    return out.reset_index()
+
+@reconnecting
+def get_frame_status_counts(frame):
+    #{stage: {status: count}} of one frame, from frame_progress
+    progSel = select(frame_progress.c.stage,frame_progress.c.status,frame_progress.c.n).select_from(
+            frame_progress.join(polygs,onclause=polygs.c.polyid==frame_progress.c.polyid)
+            ).where(polygs.c.polyid_name==frame)
+    with engine.connect() as conn:
+        res = conn.execute(progSel).fetchall()
+    out = {}
+    for stage,status,n in res:
+        out.setdefault(stage,{})[status] = n
+    return out
+
+################################################################################
+# Processing time history
+################################################################################
+# item_timing (sql/migration_004_item_timing.sql) keeps the runtime and peak
+# RSS of every processed item, with the frame size and multilook - written by
+# the ab_LiCSAR_* scripts through the status writer (see batchTimingLib.ItemTimer).
+# without the table, the records are dropped and the predictor uses the fixed
+# estimates
+timingHistoryDays = 365
+
+def has_item_timing():
+    return 'item_timing' in load_schema().tables
+
+def insert_item_timings(conn,records):
+    if not records or not has_item_timing():
+        return
+    rows = []
+    for record in records:
+        #(the error column exists since sql/migration_007_item_retry.sql)
+        row = {k:v for k,v in record.items() if k in item_timing.c}
+        if isinstance(row.get('time_finished'),str):
+            row['time_finished'] = dt.datetime.fromisoformat(row['time_finished'])
+        rows.append(row)
+    conn.execute(item_timing.insert(),rows)
+
+@reconnecting
+def get_item_timings(stage=None,nBursts=None,days=timingHistoryDays):
+    #item_timing records of the last days (of the stage, of frames of similar size)
+    cols = ['polyid','stage','n_bursts','n_swaths','rglks','aglks','runtime_s','max_rss_mb','rc']
+    if not has_item_timing():
+        return pd.DataFrame(columns=cols)
+    timSel = select(*[item_timing.c[c] for c in cols]).where(
+            item_timing.c.time_finished >= dt.datetime.now()-dt.timedelta(days=days))
+    if stage:
+        timSel = timSel.where(item_timing.c.stage==stage)
+    if nBursts:
+        timSel = timSel.where(between(item_timing.c.n_bursts,nBursts//2,nBursts*2))
+    with engine.connect() as conn:
+        res = conn.execute(timSel).fetchall()
+    return pd.DataFrame(res,columns=cols)
+
+def get_resource_predictor(stage=None,nBursts=None):
+    #ResourcePredictor from the history (of the stage, frames of similar size)
+    return ResourcePredictor(get_item_timings(stage,nBursts))
+
+def predict_item_hours(polyid,stage,nBursts=None):
+    #expected runtime of an item of the frame (nBursts - its burst count, if
+    #already known)
+    if nBursts is None:
+        nBursts = get_frame_burst_count(polyid)
+    return get_resource_predictor(stage,nBursts).item(stage,nBursts)[0]
+
+################################################################################
+# Work claiming
+################################################################################
+# pull based processing (claimWorker.py): instead of processing the items fixed
+# to its job, a worker takes the next claimable item of a frame stage. a claim
+# is a row of item_claim (sql/migration_005_item_claim.sql) with the token of
+# the worker and the end of its lease. it is taken atomically - by the INSERT
+# (the primary key lets only one worker in) or, for an expired lease, by an
+# UPDATE conditional on the old token. the worker renews the lease while
+# processing and clears it when done - the row stays, so a failed item is not
+# taken again in the same run (clear_claims before a new one). an item is
+# claimable if it is unbuilt, the items it needs (slc of an rslc, rslcs of an
+# ifg, ifg of an unw) are built, and it has no claim or an expired one with
+# less than claimMaxAttempts attempts. the leases use the clocks of the
+# workers - keep claimLease [s] well above their skew
+claimLease = 1800
+claimMaxAttempts = 3
+#claimable items tried by claim_item before giving up (others may be faster)
+claimCandidates = 20
+
+def has_item_claim():
+    return 'item_claim' in load_schema().tables
+
+def pending_prerequisite(jobType,itemTable):
+    #condition: an item of the frame needed by the item is not built
+    if jobType == 'coreg':
+        pre = [(slc,'slc',[slc.c.img_id==itemTable.c.img_id])]
+    elif jobType == 'mk_ifg':
+        pre = [(rslc,'rslc',[rslc.c.img_id.in_([itemTable.c.img_id_1,itemTable.c.img_id_2])])]
+    elif jobType == 'unwrap':
+        pre = [(ifg,'ifg',[ifg.c.img_id_1==itemTable.c.img_id_1,ifg.c.img_id_2==itemTable.c.img_id_2])]
+    else:
+        return None
+    return or_(*[select(preTable.c.polyid).where(and_(preTable.c.polyid==itemTable.c.polyid,
+            unbuilt_item(preTable,preKind),*onclause)).exists() for preTable,preKind,onclause in pre])
+
+def claimable_items_query(polyid,jobType,now,pendingOnly=False):
+    #ids of the claimable items and the tokens of their expired claims (None
+    #if not claimed yet), the higher priority first. pendingOnly leaves out the
+    #items never claimed that failed already (e.g. in the job arrays) - they
+    #are claimable, but nobody may be going to claim them
+    kind = jobKinds[jobType]
+    itemTable,idCol = statusTables[kind]
+    unclaimed = item_claim.c.item_id==None
+    if pendingOnly:
+        unclaimed = and_(unclaimed,func.coalesce(itemTable.c[kind+'_status'],-1).in_([-1,BUILDING]))
+    conds = [itemTable.c.polyid==polyid,unbuilt_item(itemTable,kind),
+             or_(unclaimed,
+                 and_(item_claim.c.lease_until<now,item_claim.c.attempts<claimMaxAttempts))]
+    pending = pending_prerequisite(jobType,itemTable)
+    if pending is not None:
+        conds.append(~pending)
+    return select(itemTable.c[idCol],item_claim.c.token).select_from(
+            itemTable.outerjoin(item_claim,onclause=and_(item_claim.c.stage==jobType,
+                item_claim.c.item_id==itemTable.c[idCol]))
+            ).where(and_(*conds)).order_by(*item_order(itemTable,idCol))
+
+@reconnecting
+def claim_item(polyid,jobType,token,worker=None,lease=claimLease):
+    #claims the next claimable item of the frame stage for the worker of the
+    #token, returns its id (None if there is nothing to claim)
+    now = dt.datetime.now().replace(microsecond=0)
+    with engine.connect() as conn:
+        cands = conn.execute(claimable_items_query(polyid,jobType,now).limit(claimCandidates)).fetchall()
+    values = {'token':token,'worker':worker,'claimed_at':now,
+              'lease_until':now+dt.timedelta(seconds=lease)}
+    for itemId,oldToken in cands:
+        try:
+            with engine.begin() as conn:
+                if oldToken is None:
+                    conn.execute(item_claim.insert().values(stage=jobType,item_id=itemId,
+                            polyid=polyid,attempts=1,**values))
+                    return int(itemId)
+                claimUpd = item_claim.update().where(and_(item_claim.c.stage==jobType,
+                        item_claim.c.item_id==itemId,item_claim.c.token==oldToken,
+                        item_claim.c.lease_until<now)).values(
+                                attempts=item_claim.c.attempts+1,**values)
+                if conn.execute(claimUpd).rowcount == 1:
+                    return int(itemId)
+        except IntegrityError:
+            #claimed by another worker in the meantime
+            continue
+    return None
+
+@reconnecting
+def renew_claims(token,lease=claimLease):
+    #extends the active leases of the worker, returns their number (0 if
+    #they were lost - expired and taken by another worker)
+    now = dt.datetime.now().replace(microsecond=0)
+    claimUpd = item_claim.update().where(and_(item_claim.c.token==token,
+            item_claim.c.lease_until!=None)).values(lease_until=now+dt.timedelta(seconds=lease))
+    with engine.begin() as conn:
+        return conn.execute(claimUpd).rowcount
+
+@reconnecting
+def release_claim(jobType,itemId,token):
+    #the item is done (whatever its status) - the claim stays without a lease
+    claimUpd = item_claim.update().where(and_(item_claim.c.stage==jobType,
+            item_claim.c.item_id==itemId,item_claim.c.token==token)).values(lease_until=None)
+    with engine.begin() as conn:
+        return conn.execute(claimUpd).rowcount
+
+@reconnecting
+def clear_claims(polyid,jobType=None):
+    #drops the finished and expired claims of the frame (stage), so all its
+    #unbuilt items can be claimed again. returns their number
+    now = dt.datetime.now().replace(microsecond=0)
+    claimDlt = item_claim.delete().where(and_(item_claim.c.polyid==polyid,
+            or_(item_claim.c.lease_until==None,item_claim.c.lease_until<now)))
+    if jobType:
+        claimDlt = claimDlt.where(item_claim.c.stage==jobType)
+    with engine.begin() as conn:
+        return conn.execute(claimDlt).rowcount
+
+@reconnecting
+def get_claim_activity(polyid,stages):
+    #numbers of the claimable items (not failed before, see
+    #claimable_items_query) and of the claimed ones (active lease) of the
+    #frame stages - nothing of both means there is no more work coming
+    now = dt.datetime.now().replace(microsecond=0)
+    claimable = 0
+    with engine.connect() as conn:
+        for jobType in stages:
+            claimable += conn.execute(select(func.count()).select_from(
+                    claimable_items_query(polyid,jobType,now,pendingOnly=True).subquery())).scalar()
+        claimed = conn.execute(select(func.count()).where(and_(item_claim.c.polyid==polyid,
+                item_claim.c.stage.in_(list(stages)),item_claim.c.lease_until>=now))).scalar()
+    return claimable,claimed
+
+################################################################################
+# Retries
+################################################################################
+# failed items to be retried (retryFailed.py, batchRetryLib): items with a
+# failure status in a job that is over - left building (-5) or unprocessed
+# (-1, e.g. not reached by a job killed at walltime, or requeued to a retry
+# job that died) only if the job finished, was cleaned up after a kill or
+# started more than staleJobHours ago (a job killed with its cleanup). every
+# failure gets a row in item_retry
+# (sql/migration_007_item_retry.sql), keyed by the item and the job it failed
+# in - the retry history of the item
+BUILDING = -5
+UNPROCESSED = -1
+staleJobHours = 168
+
+def has_item_retry():
+    return 'item_retry' in load_schema().tables
+
+def failed_items_query(polyid,jobType,now):
+    #failed items of the frame stage with their job, the last error recorded
+    #by their ItemTimer in it and whether the items they need are built (mk_image:
+    #with the acquisition date, the files are checked by the caller)
+    kind = jobKinds[jobType]
+    itemTable,idCol = statusTables[kind]
+    status = func.coalesce(itemTable.c[kind+'_status'],UNPROCESSED)
+    cols = [itemTable.c[idCol].label('item_id'),status.label('status'),itemTable.c.job_id,
+            jobs.c.job_status,jobs.c.time_finished]
+    if has_item_timing() and 'error' in item_timing.c:
+        timing = item_timing.alias()
+        lastTiming = select(func.max(timing.c.timing_id)).where(and_(
+                timing.c.stage==jobType,timing.c.item_id==itemTable.c[idCol],
+                timing.c.job_id==itemTable.c.job_id)).correlate_except(timing).scalar_subquery()
+        cols.append(select(item_timing.c.error).where(item_timing.c.timing_id==lastTiming
+                ).correlate_except(item_timing).scalar_subquery().label('error'))
+    else:
+        cols.append(null().label('error'))
+    pending = pending_prerequisite(jobType,itemTable)
+    cols.append((~pending if pending is not None else literal(True)).label('inputs_ready'))
+    join = itemTable.join(jobs,onclause=jobs.c.job_id==itemTable.c.job_id)
+    if jobType == 'mk_image':
+        cols.append(acq_img.c.acq_date)
+        join = join.join(acq_img,onclause=acq_img.c.img_id==itemTable.c.img_id)
+    jobOver = or_(jobs.c.job_status.in_([3,9]),
+                  jobs.c.time_started<now-dt.timedelta(hours=staleJobHours))
+    return select(*cols).select_from(join).where(and_(itemTable.c.polyid==polyid,
+            status.notin_([0,-6]),
+            or_(status.notin_([BUILDING,UNPROCESSED]),jobOver))).order_by(itemTable.c[idCol])
+
+@reconnecting
+def get_failed_items(polyid,jobType):
+    now = dt.datetime.now().replace(microsecond=0)
+    with engine.connect() as conn:
+        result = conn.execute(failed_items_query(polyid,jobType,now))
+        return pd.DataFrame(result.fetchall(),columns=list(result.keys()))
+
+@reconnecting
+def get_retry_history(polyid,jobType=None):
+    #item_retry rows of the frame (stage), in the order of the failures
+    retrySel = select(item_retry).where(item_retry.c.polyid==polyid).order_by(item_retry.c.retry_id)
+    if jobType:
+        retrySel = retrySel.where(item_retry.c.stage==jobType)
+    with engine.connect() as conn:
+        result = conn.execute(retrySel)
+        return pd.DataFrame(result.fetchall(),columns=list(result.keys()))
+
+@reconnecting
+def record_failures(newRows,updRows):
+    #inserts the item_retry rows of the new failures and updates the given
+    #columns of the known ones (dicts with their retry_id), in one transaction
+    with engine.begin() as conn:
+        if newRows:
+            conn.execute(item_retry.insert(),newRows)
+        for row in updRows:
+            conn.execute(item_retry.update().where(item_retry.c.retry_id==row['retry_id']).values(
+                    {k:v for k,v in row.items() if k != 'retry_id'}))
+
+def requeue_failed_items(polyid,user,jobType,itemGroups,retryIds):
+    #creates one job per group of the failed items, in one transaction: the
+    #items are linked to it and set unprocessed (-1), their item_retry rows
+    #(retryIds {item id: retry_id}) get the job. returns the new job ids
+    kind = jobKinds[jobType]
+    itemGroups = [itemGroup for itemGroup in itemGroups if len(itemGroup)]
+    with engine.begin() as conn:
+        jids = create_jobs(polyid,user,jobType,len(itemGroups),conn)
+        for jid,itemGroup in zip(jids,itemGroups):
+            link_items_to_job(jobType,itemGroup,jid,conn)
+            update_items_status(conn,kind,itemGroup,-1)
+            ids = [int(retryIds[i]) for i in itemGroup]
+            for i in range(0,len(ids),maxInList):
+                conn.execute(item_retry.update().where(
+                        item_retry.c.retry_id.in_(ids[i:i+maxInList])).values(retry_job_id=jid))
+    return jids
+
+################################################################################
+@reconnecting
 def set_slc_status(slcID,slcStat):
     # conn = engine.connect()
-    slcUpd = slc.update().where(slc.c.slc_id==slcID).values(slc_status=slcStat)
     with engine.begin() as conn:
-        res = conn.execute(slcUpd)
+        res = update_items_status(conn,'slc',[slcID],slcStat)
     # conn.execute(slcUpd)
     # conn.commit()
     # conn.close()
 
 ################################################################################
+@reconnecting
 def set_rslc_status(rslcID,rslcStat):
     # conn = engine.connect()
-    rslcUpd = rslc.update().where(rslc.c.rslc_id==rslcID).values(rslc_status=rslcStat)
     with engine.begin() as conn:
-        res = conn.execute(rslcUpd)
+        res = update_items_status(conn,'rslc',[rslcID],rslcStat)
     # conn.execute(rslcUpd)
     # conn.commit()
     # conn.close()
 
+@reconnecting
 def get_rslc_status(rslcID):
-    conn = engine.connect()
-    rslcSel = select(rslc.c.rslc_status).select_from(rslc).where(rslc.c.rslc_id==rslcID)
-    sqlRes = conn.execute(rslcSel)
-    a = sqlRes.fetchall()
-    conn.close()
+    with engine.connect() as conn:
+        rslcSel = select(rslc.c.rslc_status).select_from(rslc).where(rslc.c.rslc_id==rslcID)
+        sqlRes = conn.execute(rslcSel)
+        a = sqlRes.fetchall()
     return int(str(a[0]).replace('(','').split(',')[0])
 
+@reconnecting
 def get_slc_status(slcID):
-    conn = engine.connect()
-    slcSel = select(slc.c.slc_status).select_from(slc).where(slc.c.slc_id==slcID)
-    sqlRes = conn.execute(slcSel)
-    a = sqlRes.fetchall()
-    conn.close()
+    with engine.connect() as conn:
+        slcSel = select(slc.c.slc_status).select_from(slc).where(slc.c.slc_id==slcID)
+        sqlRes = conn.execute(slcSel)
+        a = sqlRes.fetchall()
     return int(str(a[0]).replace('(','').split(',')[0])
 
 ################################################################################
+@reconnecting
 def set_ifg_status(ifgID,ifgStat):
     # conn = engine.connect()
-    ifgUpd = ifg.update().where(ifg.c.ifg_id==ifgID).values(ifg_status=ifgStat)
     with engine.begin() as conn:
-        res = conn.execute(ifgUpd)
+        res = update_items_status(conn,'ifg',[ifgID],ifgStat)
     # conn.execute(ifgUpd)
     # conn.commit()
     # conn.close()
 
 ################################################################################
+@reconnecting
 def set_unw_status(unwID,unwStat):
     # conn = engine.connect()
-    unwUpd = unw.update().where(unw.c.unw_id==unwID).values(unw_status=unwStat)
     with engine.begin() as conn:
-        res = conn.execute(unwUpd)
+        res = update_items_status(conn,'unw',[unwID],unwStat)
     # conn.execute(unwUpd)
     # conn.commit()
     # conn.close()
 
 ################################################################################
+@reconnecting
 def set_unw_perc_unwrpd(unwID,unwPerc):
     # conn = engine.connect()
     unwUpd = unw.update().where(unw.c.unw_id==unwID).values(unw_perc=unwPerc)
@@ -991,6 +2281,19 @@ def set_unw_perc_unwrpd(unwID,unwPerc):
     # conn.close()
 
 ################################################################################
+@reconnecting
+def set_items_status(itemIds,status):
+    #bulk status update, e.g. set_items_status({'slc':[..],'rslc':[..]},0)
+    #one UPDATE ... WHERE id IN (...) per table (and chunk), all in one transaction.
+    #returns number of updated rows per table
+    counts = {}
+    with engine.begin() as conn:
+        for kind,ids in itemIds.items():
+            counts[kind] = update_items_status(conn,kind,ids,status)
+    return counts
+
+################################################################################
+@reconnecting
 def set_job_started(jobID):
     # conn = engine.connect()
     jobUpd = jobs.update().where(jobs.c.job_id==jobID).values(job_status=2,time_started=dt.datetime.now())
@@ -1001,6 +2304,7 @@ def set_job_started(jobID):
     # conn.close()
 
 ################################################################################
+@reconnecting
 def set_job_finished(jobID,jobStat):
     # conn = engine.connect()
     jobUpd = jobs.update().where(jobs.c.job_id==jobID).values(job_status=jobStat,time_finished=dt.datetime.now())
@@ -1011,26 +2315,25 @@ def set_job_finished(jobID,jobStat):
     # conn.close()
 
 ################################################################################
+@reconnecting
 def get_job_status(jobID):
-    conn = engine.connect()
-    
-    jobSel = select(jobs.c.job_status).where(jobs.c.job_id==jobID)
-    res = conn.execute(jobSel)
-    ress = res.fetchone()
-    conn.close()
+    with engine.connect() as conn:
+        jobSel = select(jobs.c.job_status).where(jobs.c.job_id==jobID)
+        res = conn.execute(jobSel)
+        ress = res.fetchone()
     return ress
 
+@reconnecting
 def get_baseline(polyID):
     bsLnSel = select(acq_img.c.acq_date,acq_img.c.bperp).\
             where(and_(
                 acq_img.c.polyid==polyID,
                 acq_img.c.bperp!=None
                 ))
-    conn = engine.connect()
-    # out = pd.read_sql_query(bsLnSel,conn)
-    result = conn.execute(bsLnSel)
-    conn.close()
-    out = pd.DataFrame(result.fetchall())
+    with engine.connect() as conn:
+        # out = pd.read_sql_query(bsLnSel,conn)
+        result = conn.execute(bsLnSel)
+        out = pd.DataFrame(result.fetchall())
     return out
 
 ################################################################################
@@ -1039,14 +2342,357 @@ def set_baseline(polyid,baselineDataframe):
     bsLnUpd = acq_img.update().\
             where(and_(
                 acq_img.c.polyid==polyid,
-                func.date(acq_img.c.acq_date)==bindparam('Date')
+                acq_img.c.acq_date>=bindparam('Date'),
+                acq_img.c.acq_date<bindparam('DateEnd')
                 )).values(bperp=bindparam('Bperp'))
-    baselineDataframe['Date']=baselineDataframe['Date'].map(
-            lambda x: x.date())
+    baselineDataframe['Date']=baselineDataframe['Date'].map(to_day)
+    baselineDataframe['DateEnd']=baselineDataframe['Date'].map(
+            lambda x: x+dt.timedelta(days=1))
     bsLnDict = baselineDataframe.to_dict(orient='records')
     with engine.begin() as conn:
-        res = conn.execute(bsLnUpd)
-        res = conn.execute(bsLnDict)
+        res = conn.execute(bsLnUpd,bsLnDict)
     # conn.execute(bsLnUpd,bsLnDict)
     # conn.commit()
     # conn.close()
+
+################################################################################
+# Job context
+################################################################################
+# everything a stage script needs to know about its job, read in one
+# transaction at the start so that the per epoch loops do not query the db:
+#   frame, polyid, master ... frame name, its id and reference epoch
+#   items ... unbuilt items of the job (as from get_unbuilt_*)
+#   bursts ... bursts of the frame (as from get_bursts_in_frame)
+#   epochs ... (mk_image) date -> (files, bursts) as from get_frame_files_date
+#              and get_frame_bursts_on_date
+#   slcs ... (coreg) date -> (slc_id, slc_status) of the job's epochs
+class JobContext(namedtuple('JobContext',['job_id','job_type','frame','polyid',
+                             'master','items','bursts','epochs','slcs'])):
+    #(epochs and slcs are read only views - pickled as dicts, e.g. for the
+    #worker processes of batchWorkerLib, and made read only again)
+    __slots__ = ()
+    def __reduce__(self):
+        return (job_context,tuple(dict(f) if isinstance(f,MappingProxyType) else f for f in self))
+
+def job_context(*fields):
+    return JobContext(*fields)._replace(epochs=MappingProxyType(dict(fields[7])),
+                                        slcs=MappingProxyType(dict(fields[8])))
+
+unbuiltQueries = {'mk_image':(unbuilt_slcs_query,['acq_date']),
+                  'coreg':(unbuilt_rslcs_query,['acq_date']),
+                  'mk_ifg':(unbuilt_ifgs_query,['acq_date_1','acq_date_2']),
+                  'unwrap':(unbuilt_unws_query,['acq_date_1','acq_date_2'])}
+
+def read_context(conn,jobID,jobType,polyid,frame,itemId=None):
+    itemQuery,dateCols = unbuiltQueries[jobType]
+    result = conn.execute(itemQuery(jobID,itemId))
+    items = pd.DataFrame(result.fetchall(),columns=list(result.keys()))
+    for dateCol in dateCols:
+        items[dateCol] = pd.to_datetime(items[dateCol])
+    mstrDate = conn.execute(master_query(frame)).fetchone()
+    burstList = tuple(tuple(b) for b in conn.execute(bursts_in_frame_query(frame)))
+    epochs = {}
+    if jobType == 'mk_image' and not items.empty:
+        dates = list(items['acq_date'])
+        epochFiles = group_by_dates(conn.execute(frame_files_dates_query(frame,dates)),
+                                    dates,extraDays=1)
+        epochBursts = group_by_dates(conn.execute(frame_bursts_on_dates_query(frame,dates)),
+                                     dates)
+        for date in dates:
+            epochs[date] = (tuple(epochFiles[date]),tuple(epochBursts[date]))
+    slcs = {}
+    if jobType == 'coreg':
+        slcSel = select(acq_img.c.acq_date,slc.c.slc_id,slc.c.slc_status).select_from(
+                rslc.join(slc,onclause=slc.c.img_id==rslc.c.img_id)\
+                .join(acq_img,onclause=acq_img.c.img_id==rslc.c.img_id)
+                ).where(item_or_job(rslc,'rslc_id',jobID,itemId))
+        for acqDate,slcId,slcStatus in conn.execute(slcSel):
+            slcs[pd.Timestamp(acqDate)] = (slcId,slcStatus)
+    return JobContext(job_id=jobID,job_type=jobType,frame=frame,polyid=polyid,
+            master=mstrDate[0] if mstrDate else None,items=items,bursts=burstList,
+            epochs=MappingProxyType(epochs),slcs=MappingProxyType(slcs))
+
+@reconnecting
+def get_job_context(jobID):
+    jobSel = select(jobs.c.job_type,jobs.c.polyid,polygs.c.polyid_name).select_from(
+            jobs.join(polygs,onclause=polygs.c.polyid==jobs.c.polyid)
+            ).where(jobs.c.job_id==jobID)
+    with engine.begin() as conn:
+        job = conn.execute(jobSel).fetchone()
+        if not job:
+            print('job {} not found'.format(jobID))
+            return None
+        jobType = [k for k,v in jobTypes.items() if v == job.job_type][0]
+        return read_context(conn,jobID,jobType,job.polyid,job.polyid_name)
+
+@reconnecting
+def get_item_context(jobType,itemId):
+    #context of one item of the stage (e.g. claimed by a worker, see Work
+    #claiming) - items has just this item, if it is still unbuilt. job_id is
+    #the job the item is linked to (0 if none)
+    itemTable,idCol = statusTables[jobKinds[jobType]]
+    itemSel = select(itemTable.c.job_id,itemTable.c.polyid,polygs.c.polyid_name).select_from(
+            itemTable.join(polygs,onclause=polygs.c.polyid==itemTable.c.polyid)
+            ).where(itemTable.c[idCol]==itemId)
+    with engine.begin() as conn:
+        item = conn.execute(itemSel).fetchone()
+        if not item:
+            print('{} {} not found'.format(jobKinds[jobType],itemId))
+            return None
+        return read_context(conn,item.job_id or 0,jobType,item.polyid,item.polyid_name,itemId)
+
+################################################################################
+# Buffered status writer
+################################################################################
+#tables (and their id columns) that can be updated through StatusBuffer
+statusTables = {'slc':(slc,'slc_id'),
+                'rslc':(rslc,'rslc_id'),
+                'ifg':(ifg,'ifg_id'),
+                'unw':(unw,'unw_id'),
+                'jobs':(jobs,'job_id')
+                }
+
+def get_status_journal(frame,jobID):
+    #local journal of not-yet-written status updates of the job, kept in the frame LOGS dir
+    try:
+        logDir = os.path.join(os.environ['BATCH_CACHE_DIR'],frame,'LOGS')
+    except KeyError:
+        return None
+    if not os.path.isdir(logDir):
+        return None
+    return os.path.join(logDir,'status_journal_{}.txt'.format(jobID))
+
+class StatusBuffer():
+    #collects status updates in memory and writes them in one transaction,
+    #either at flush() (called at exit), or when flushInterval [s] has passed.
+    #if journal is given, every update is also appended to this file until it
+    #gets to the database - the journal is replayed when the buffer is created again
+    def __init__(self,flushInterval=None,journal=None):
+        self.flushInterval = flushInterval
+        self.journal = journal
+        self.pending = {}
+        self.lastFlush = time.time()
+        if self.journal and os.path.exists(self.journal):
+            self.replay_journal()
+        atexit.register(self.flush)
+
+    def set(self,table,itemId,column,value):
+        if hasattr(value,'item'):
+            value = value.item() #numpy to python type
+        key = (table,int(itemId),column)
+        #repeated updates of the same row are coalesced - the last one wins
+        self.pending.pop(key,None)
+        self.pending[key] = value
+        if self.journal:
+            try:
+                with open(self.journal,'a') as f:
+                    f.write(json.dumps([table,int(itemId),column,value],default=str)+'\n')
+            except OSError:
+                print('warning, could not write to status journal '+self.journal)
+        if self.flushInterval is not None:
+            if time.time() - self.lastFlush > self.flushInterval:
+                self.flush()
+
+    def set_slc_status(self,slcID,slcStat):
+        self.set('slc',slcID,'slc_status',slcStat)
+
+    def set_rslc_status(self,rslcID,rslcStat):
+        self.set('rslc',rslcID,'rslc_status',rslcStat)
+
+    def set_ifg_status(self,ifgID,ifgStat):
+        self.set('ifg',ifgID,'ifg_status',ifgStat)
+
+    def set_unw_status(self,unwID,unwStat):
+        self.set('unw',unwID,'unw_status',unwStat)
+
+    def set_unw_perc_unwrpd(self,unwID,unwPerc):
+        self.set('unw',unwID,'unw_perc',unwPerc)
+
+    def set_job_started(self,jobID):
+        self.set('jobs',jobID,'job_status',2)
+        self.set('jobs',jobID,'time_started',dt.datetime.now().replace(microsecond=0))
+
+    def set_job_finished(self,jobID,jobStat):
+        self.set('jobs',jobID,'job_status',jobStat)
+        self.set('jobs',jobID,'time_finished',dt.datetime.now().replace(microsecond=0))
+
+    def set_item_timing(self,record):
+        #(keyed by the item - a repeated attempt within the job replaces it)
+        self.set('item_timing',record['item_id'],record['stage'],record)
+
+    def read_journal(self):
+        with open(self.journal,'r') as f:
+            for line in f:
+                try:
+                    table,itemId,column,value = json.loads(line)
+                    if column.startswith('time_') and value:
+                        value = dt.datetime.fromisoformat(value)
+                except ValueError:
+                    #probably partially written line of a killed job
+                    continue
+                key = (table,itemId,column)
+                self.pending.pop(key,None)
+                self.pending[key] = value
+
+    def replay_journal(self):
+        self.read_journal()
+        if self.pending:
+            print('replaying {} status updates from {}'.format(len(self.pending),self.journal))
+            self.flush()
+
+    @staticmethod
+    def write_pending(pending):
+        #one executemany per table/column, everything in one transaction
+        #(item statuses grouped by the value, to keep frame_progress updated)
+        grouped = {}
+        statuses = {}
+        timings = []
+        for (table,itemId,column),value in pending.items():
+            if table == 'item_timing':
+                timings.append(value)
+            elif table in progressKinds and column == table+'_status':
+                statuses.setdefault((table,value),[]).append(itemId)
+            else:
+                grouped.setdefault((table,column),[]).append({'b_id':itemId,'b_value':value})
+        @reconnecting
+        def write_grouped():
+            with engine.begin() as conn:
+                for (table,value),ids in statuses.items():
+                    update_items_status(conn,table,ids,value)
+                for (table,column),rows in grouped.items():
+                    statTable, idCol = statusTables[table]
+                    statUpd = statTable.update().where(
+                            statTable.c[idCol]==bindparam('b_id')).values(
+                                    {column:bindparam('b_value')})
+                    conn.execute(statUpd,rows)
+                insert_item_timings(conn,timings)
+        write_grouped()
+
+    def flush(self):
+        self.lastFlush = time.time()
+        if not self.pending:
+            return True
+        try:
+            self.write_pending(self.pending)
+        except SQLAlchemyError as e:
+            print('warning, could not write {} status updates to the database: {}'.format(
+                len(self.pending),e))
+            if self.journal:
+                print('they are kept in '+self.journal)
+            return False
+        self.pending = {}
+        if self.journal and os.path.exists(self.journal):
+            os.remove(self.journal)
+        return True
+
+    def catch_signals(self):
+        #turn SIGTERM (e.g. walltime kill) into SystemExit, so the running
+        #LicsEnv gets to its cleanHook and the buffer is flushed at exit
+        def handler(signum,frame):
+            print('received signal {}, exiting'.format(signum))
+            sys.exit(128+signum)
+        signal.signal(signal.SIGTERM,handler)
+
+class StatusRecorder(StatusBuffer):
+    #only collects the updates (in pending), or puts them to the queue as they
+    #come - used by the worker processes of a job, the updates are passed to
+    #the status writer of the job
+    def __init__(self,queue=None):
+        self.flushInterval = None
+        self.journal = None
+        self.pending = {}
+        self.queue = queue
+
+    def set(self,table,itemId,column,value):
+        if self.queue is None:
+            return super().set(table,itemId,column,value)
+        self.queue.put((table,itemId,column,value))
+
+    def flush(self):
+        return True
+
+class StatusWriter(StatusBuffer):
+    #write-behind version of StatusBuffer: updates (incl. job states) are
+    #queued and written by a background thread as they come, repeated updates
+    #of a row are coalesced. while the db is not reachable, the thread retries
+    #with exponentially growing waits (retryWait .. maxRetryWait [s]) and the
+    #processing goes on. at exit, flush() waits up to exitTimeout [s] for the
+    #queue to drain - what is not written stays in the journal, to be replayed
+    #by the next StatusBuffer/StatusWriter of the job or by the lotus cleanup
+    def __init__(self,journal=None,retryWait=5,maxRetryWait=600,exitTimeout=120):
+        self.flushInterval = None
+        self.journal = journal
+        self.pending = {}
+        self.writing = {}
+        self.retryWait = retryWait
+        self.maxRetryWait = maxRetryWait
+        self.exitTimeout = exitTimeout
+        self.urgent = False
+        self.lock = threading.Condition()
+        if self.journal and os.path.exists(self.journal):
+            self.read_journal()
+            if self.pending:
+                print('replaying {} status updates from {}'.format(len(self.pending),self.journal))
+        self.thread = threading.Thread(target=self.run,name='StatusWriter',daemon=True)
+        self.thread.start()
+        atexit.register(self.flush)
+
+    def set(self,table,itemId,column,value):
+        with self.lock:
+            StatusBuffer.set(self,table,itemId,column,value)
+            self.lock.notify_all()
+
+    def run(self):
+        wait = self.retryWait
+        while True:
+            with self.lock:
+                while not self.pending:
+                    self.lock.wait()
+                batch, self.pending = self.pending, {}
+                self.writing = batch
+            try:
+                self.write_pending(batch)
+                written = True
+            except Exception as e:
+                #(not only db errors - the thread must not die with the batch)
+                print('warning, could not write {} status updates to the database '\
+                        '(next attempt in {} s): {}'.format(len(batch),wait,e))
+                written = False
+            with self.lock:
+                self.writing = {}
+                if written:
+                    wait = self.retryWait
+                    if not self.pending and self.journal and os.path.exists(self.journal):
+                        os.remove(self.journal)
+                    self.lock.notify_all()
+                    continue
+                #back to the queue, unless there is a newer value already
+                for key,value in batch.items():
+                    self.pending.setdefault(key,value)
+                self.lock.notify_all()
+                retryAt = time.time() + (min(wait,5) if self.urgent else wait)
+                while time.time() < retryAt:
+                    self.lock.wait(retryAt - time.time())
+                    if self.urgent:
+                        retryAt = min(retryAt,time.time()+5)
+                wait = min(2*wait,self.maxRetryWait)
+
+    def flush(self,timeout=None):
+        #waits until everything queued so far is written (or timeout [s] passes,
+        #at once if the writer thread is gone)
+        if timeout is None:
+            timeout = self.exitTimeout
+        deadline = time.time()+timeout
+        with self.lock:
+            self.urgent = True
+            self.lock.notify_all()
+            while (self.pending or self.writing) and time.time() < deadline and self.thread.is_alive():
+                self.lock.wait(min(1,deadline-time.time()))
+            self.urgent = False
+            left = len(self.pending)+len(self.writing)
+        if left:
+            print('warning, {} status updates were not written to the database'.format(left))
+            if self.journal:
+                print('they are kept in '+self.journal)
+            return False
+        return True
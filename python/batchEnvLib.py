@@ -251,6 +251,11 @@ def get_ifgs_from_lics(frame,srcDir,cacheDir,startDate = False,endDate = False):
 ################################################################################
 # LiCS env
 ################################################################################
+#set in the worker processes of a job processing its items in parallel
+#(batchWorkerLib) or by the claim workers (claimWorker.py), so that each
+#worker gets its own env directory
+workerID = None
+
 class LicsEnv():
     def __init__(self,jobID,frame,cacheDir,tempDir):
         self.frameTmp = os.path.join(tempDir,frame+'_envs')
@@ -262,6 +267,9 @@ class LicsEnv():
         self.frame = frame
         self.cleanDirs = []
         self.cleanHook = None
+        self.statusBuffer = None
+        #ItemTimer of the item - gets the exception (that is not raised further)
+        self.timer = None
         try:
             try:
                 JOBID = os.environ['SLURM_JOBID']
@@ -270,6 +278,8 @@ class LicsEnv():
             self.envID = '{}_{}'.format(jobID,JOBID)
         except:
             self.envID = str(jobID)
+        if workerID is not None:
+            self.envID = '{}_w{}'.format(self.envID,workerID)
     def __enter__(self):
         #Create temporary dir if not present
         if not os.path.exists(self.frameTmp):
@@ -294,8 +304,12 @@ class LicsEnv():
     def __exit__(self, *args):
         if args[0]:
             print("Received exception {}".format(args[1]))
+            if self.timer:
+                self.timer.set_error(args[0],args[1])
             if self.cleanHook:
                 self.cleanHook()
+            if self.statusBuffer:
+                self.statusBuffer.flush()
             for cleanDir in self.cleanDirs:
                 if os.path.exists(cleanDir):
                     shutil.rmtree(cleanDir)                        
@@ -325,4 +339,7 @@ class LicsEnv():
                     shutil.rmtree(os.path.join(slcdir, slc))
                 except:
                     print('error deleting slc '+str(slc))
+        #the job is being killed (see StatusBuffer.catch_signals) - do not continue with next item
+        if args[0] and issubclass(args[0],SystemExit):
+            return False
         return True
@@ -0,0 +1,182 @@
+################################################################################
+# Imports
+################################################################################
+import numpy as np
+import subprocess
+import os
+from collections import namedtuple
+from configLib import config
+from batchPackLib import pack_lpt
+from batchTimingLib import defaultMemory
+from batchPlanLib import priorityQos
+
+# packing of the pending jobs of many frames (batchDBLib.get_fleet_jobs) to a
+# few large job arrays per stage, instead of the small arrays of every frame.
+# a task runs a list of jobs of any frames one after the other
+# (ab_LiCSAR_* JOBID [JOBID ..]). the jobs are grouped by the memory they need
+# (one array per stage and memory class) and packed by their predicted runtime
+# (batchTimingLib.ResourcePredictor), within the limits of the [Fleet] section
+# of FRAME_BATCH_CONFIG. jobs of high priority (batchPackLib, Priorities) get
+# arrays of their own, with a task per job and the PriorityQOS:
+#   MaxTasks: 2000 ....... array tasks of a run in total (the per user limit of
+#                          submitted jobs - fleetJobPlan.py subtracts the
+#                          tasks the user has queued already)
+#   MaxArraySize: 1000 ... tasks of one array (MaxArraySize of slurm)
+#   MaxRunning: 0 ........ running tasks of an array (%N, 0 - no limit)
+#   TaskHours: 23 ........ walltime of a task (limit of the qos)
+#   Account, Partition, QOS .... of the arrays (nceo_geohazards, standard, standard)
+#   PriorityQOS: high .... of the arrays of the high priority jobs
+
+################################################################################
+#Limits
+################################################################################
+def fleet_limits():
+    return {'maxTasks':config.getint('Fleet','MaxTasks',fallback=2000),
+            'maxArraySize':config.getint('Fleet','MaxArraySize',fallback=1000),
+            'maxRunning':config.getint('Fleet','MaxRunning',fallback=0),
+            'taskHours':config.getint('Fleet','TaskHours',fallback=23),
+            'account':config.get('Fleet','Account',fallback='nceo_geohazards'),
+            'partition':config.get('Fleet','Partition',fallback='standard'),
+            'qos':config.get('Fleet','QOS',fallback='standard'),
+            'priorityQos':priorityQos}
+
+def queued_tasks():
+    #tasks (array tasks counted one by one) the user has in the queue
+    try:
+        out = subprocess.run(['squeue','-h','-r','-u',os.environ.get('USER','')],
+                check=True,capture_output=True,text=True).stdout
+    except (OSError,subprocess.CalledProcessError):
+        return 0
+    return len([l for l in out.splitlines() if l.strip()])
+
+################################################################################
+#Packing
+################################################################################
+stageScripts = {'mk_image':'ab_LiCSAR_mk_image.py',
+                'coreg':'ab_LiCSAR_coreg.py',
+                'mk_ifg':'ab_LiCSAR_mk_ifg.py',
+                'unwrap':'ab_LiCSAR_unwrap.py'}
+#memory classes [MB] (those of the fixed rules), the arrays are made per class
+memClasses = sorted({m for rules in defaultMemory.values() for m in rules})
+
+#name - of the .tasks/.sh files, tasks - job ids of each task, hours - walltime,
+#priority - of its jobs
+FleetArray = namedtuple('FleetArray',['name','stage','mem','hours','tasks','priority'])
+
+def memory_class(mem):
+    #the smallest class with enough memory (above them the memory itself)
+    i = int(np.searchsorted(memClasses,mem,side='left'))
+    return int(memClasses[i]) if i < len(memClasses) else int(mem)
+
+def share_tasks(sizes,budget):
+    #tasks for each group according to its size, at least one
+    sizes = np.asarray(sizes,dtype=float)
+    return np.maximum(1,np.floor(budget*sizes/max(sizes.sum(),1e-9))).astype(int)
+
+def predict_jobs(stage,fleetJobs,predictor):
+    #(hours, memory class) of the jobs (the same for jobs of the same size)
+    predicted = {}
+    hours = []
+    mems = []
+    for job in fleetJobs.itertuples():
+        key = (int(job.n_items),int(job.n_bursts) if job.n_bursts else None)
+        if key not in predicted:
+            predicted[key] = predictor.job(stage,*key)
+        hours.append(predicted[key][0])
+        mems.append(memory_class(predicted[key][1]))
+    return np.array(hours),np.array(mems)
+
+def plan_fleet_stage(stage,fleetJobs,predictor,budget,limits):
+    #FleetArrays of the stage with at most budget tasks in total (more only if
+    #the jobs do not fit the task walltime), the higher priority first - each
+    #job of a priority above the routine gets its own task (out of the budget).
+    #fleetJobs as from get_fleet_jobs
+    if fleetJobs.empty:
+        return []
+    hours,mems = predict_jobs(stage,fleetJobs,predictor)
+    jobIds = fleetJobs['job_id'].values
+    if 'priority' in fleetJobs.columns:
+        priorities = fleetJobs['priority'].fillna(0).astype(int).values
+    else:
+        priorities = np.zeros(len(fleetJobs),dtype=int)
+    arrays = []
+    for priority in sorted(set(priorities),reverse=True):
+        lane = priorities==priority
+        if priority > 0:
+            laneBudget = int(lane.sum())
+            budget -= laneBudget
+        else:
+            laneBudget = max(budget,1)
+        arrays += plan_fleet_lane(stage,jobIds[lane],hours[lane],mems[lane],laneBudget,limits,priority)
+    return arrays
+
+def plan_fleet_lane(stage,jobIds,hours,mems,budget,limits,priority=0):
+    #FleetArrays of the jobs of one priority, one per memory class (split by
+    #the MaxArraySize)
+    classes = sorted(set(mems))
+    shares = share_tasks([hours[mems==mem].sum() for mem in classes],budget)
+    arrays = []
+    for mem,nTasks in zip(classes,shares):
+        idx = np.nonzero(mems==mem)[0]
+        tasks = pack_lpt(hours[idx],min(nTasks,len(idx)),limits['taskHours'])
+        taskJobs = [[int(jobIds[idx[i]]) for i in t] for t in tasks]
+        taskHours = [hours[idx[t]].sum() for t in tasks]
+        size = limits['maxArraySize']
+        for k in range(0,len(taskJobs),size):
+            name = 'fleet_{}_{}'.format(stage,mem)
+            if priority:
+                name += '_p{}'.format(priority)
+            if len(taskJobs) > size:
+                name += '_{}'.format(k//size+1)
+            arrays.append(FleetArray(name,stage,mem,
+                    min(int(max(taskHours[k:k+size])),limits['taskHours']),taskJobs[k:k+size],
+                    int(priority)))
+    return arrays
+
+def plan_fleet(stageJobs,predictors,limits,budget=None):
+    #FleetArrays of all the stages ({stage: fleet jobs}, in the processing
+    #order). the task budget is shared by the stages according to their jobs
+    budget = limits['maxTasks'] if budget is None else budget
+    stages = [s for s in stageJobs if not stageJobs[s].empty]
+    if not stages:
+        return []
+    shares = share_tasks([len(stageJobs[s]) for s in stages],budget)
+    arrays = []
+    for stage,share in zip(stages,shares):
+        arrays += plan_fleet_stage(stage,stageJobs[stage],predictors[stage],share,limits)
+    return arrays
+
+################################################################################
+#Array scripts
+################################################################################
+fleetScript = '''#!/bin/bash
+#SBATCH --job-name=fleet.{stage}.{mem}
+#SBATCH --time={hours:02d}:59:00
+#SBATCH --account={account}
+#SBATCH --partition={partition}
+#SBATCH --qos={qos}
+#SBATCH -o {logDir}/%A.%a.out
+#SBATCH -e {logDir}/%A.%a.err
+#SBATCH --array=1-{nTasks}
+#SBATCH --mem-per-cpu={mem}M
+
+JOBS=`gawk 'NR=='${{SLURM_ARRAY_TASK_ID}} {taskFile}`
+{stageScript} $JOBS
+for CID in $JOBS; do ab_LiCSAR_lotus_cleanup.py $CID; done
+'''
+
+def write_fleet_array(array,limits,logDir='LOGS'):
+    #ARRAY.tasks (job ids of task i on line i) and the ARRAY.sh array script,
+    #in the current dir. returns the script
+    taskFile = os.path.abspath(array.name+'.tasks')
+    with open(taskFile,'w') as f:
+        for jobIds in array.tasks:
+            f.write(' '.join(str(j) for j in jobIds)+'\n')
+    script = array.name+'.sh'
+    limits = dict(limits,qos=limits['priorityQos'] if array.priority else limits['qos'])
+    with open(script,'w') as f:
+        f.write(fleetScript.format(stage=array.stage,mem=array.mem,hours=array.hours,
+                logDir=os.path.abspath(logDir),nTasks=len(array.tasks),taskFile=taskFile,
+                stageScript=stageScripts[array.stage],**limits))
+    os.chmod(script,0o770)
+    return script
@@ -0,0 +1,210 @@
+################################################################################
+# Imports
+################################################################################
+import numpy as np
+import pandas as pd
+import ast
+import re
+import os
+
+# the interferogram network of a frame, built from its acquisition calendar.
+# dates are handled as numpy datetime64[D], pairs as int array (N,2) of indices
+# to the sorted unique dates (first index is always the earlier epoch)
+
+################################################################################
+#Network parameters
+################################################################################
+networkDefaults = {'nearest':3, #connections of each epoch to its following epochs
+        'maxBtemp':None, #days, for the nearest connections
+        'maxBperp':None, #m, needs the bperp values
+        'seasonal':None, #'tienshan' or 'add36m' (3/6/9 months connections)
+        'startmonth':5, #first month of the tienshan connections
+        'volcsSouth':False, #all Nov-Mar connections up to 456 days
+        'gapBridge':None, #days - epochs around a longer gap are connected
+        }
+
+#local_config.py parameters (as used by framebatch_gapfill.sh)
+localConfigKeys = {'max_ifg_comb':'nearest',
+        'max_ifg_btemp':'maxBtemp',
+        'max_ifg_bperp':'maxBperp',
+        'startmonth':'startmonth',
+        'ifg_gap_bridge':'gapBridge'}
+
+def read_local_config(localConfig):
+    #reads the 'key = value' lines of local_config.py (without executing it)
+    values = {}
+    if not localConfig or not os.path.exists(localConfig):
+        return values
+    with open(localConfig) as f:
+        for line in f:
+            m = re.match(r'^(\w+)\s*=\s*([^#]+)',line)
+            if not m:
+                continue
+            try:
+                values[m.group(1)] = ast.literal_eval(m.group(2).strip())
+            except (ValueError,SyntaxError):
+                pass
+    return values
+
+def network_config(localConfig=None,**overrides):
+    #network parameters - defaults, updated by the frame's local_config.py,
+    #updated by the given overrides
+    config = dict(networkDefaults)
+    values = read_local_config(localConfig)
+    for key,param in localConfigKeys.items():
+        #as in gapfill, only positive values are used
+        if isinstance(values.get(key),(int,float)) and values[key] > 0:
+            config[param] = values[key]
+    if values.get('tienshan') == 1:
+        config['seasonal'] = 'tienshan'
+    if values.get('volcs_south') == 1:
+        config['volcsSouth'] = True
+        if config['seasonal'] == 'tienshan':
+            config['seasonal'] = None
+    config.update(overrides)
+    return config
+
+################################################################################
+#Dates
+################################################################################
+def as_days_unsorted(dates):
+    #datetime64[D] of the given dates (str or int YYYYMMDD, date, ..)
+    dates = [str(d) if isinstance(d,(int,np.integer)) else d for d in dates]
+    return pd.to_datetime(dates).values.astype('datetime64[D]')
+
+def as_days(dates):
+    #sorted unique epochs
+    return np.unique(as_days_unsorted(dates))
+
+def pairs_to_dates(days,pairs):
+    #(N,2) array of datetime64[D]
+    return days[pairs]
+
+def pairs_to_strings(days,pairs):
+    #['YYYYMMDD_YYYYMMDD', ..]
+    dateStr = np.char.replace(np.datetime_as_string(days,unit='D'),'-','')
+    return ['{}_{}'.format(a,b) for a,b in dateStr[pairs]]
+
+def months(days):
+    #months since 1970 and the month of year (1-12)
+    monthIdx = days.astype('datetime64[M]').astype(np.int64)
+    return monthIdx, monthIdx%12+1
+
+################################################################################
+#Pair sets
+################################################################################
+def nearest_pairs(nEpochs,connections):
+    #each epoch with its following 1..connections epochs. ordered by the lag
+    #(all 1st neighbours, then 2nd, ..) as in the original create_ifgs
+    lags = range(1,connections+1)
+    first = np.concatenate([np.arange(nEpochs-lag) for lag in lags]+[np.zeros(0,dtype=int)])
+    lag = np.concatenate([np.full(max(nEpochs-lag,0),lag) for lag in lags]+[np.zeros(0,dtype=int)])
+    return np.stack([first,first+lag],axis=1).astype(np.int64)
+
+def matrix_pairs(mask):
+    #pairs (i,j), i<j, where mask[i,j]
+    first,second = np.nonzero(np.triu(mask,1))
+    return np.stack([first,second],axis=1).astype(np.int64)
+
+def window_pairs(days,inMonths,maxBtemp):
+    #all pairs of epochs in the given months of year with btemp < maxBtemp
+    monthIdx,month = months(days)
+    sel = np.isin(month,inMonths)
+    btemp = (days[None,:]-days[:,None]).astype(np.int64)
+    return matrix_pairs(sel[:,None] & sel[None,:] & (btemp < maxBtemp))
+
+def month_lag_pairs(days,connections,maxconn=None,exclude=None,seed=0,perLag=False):
+    #pairs of epochs in month1 with epochs lag months later, for each
+    #(month1,lag) of connections. at most maxconn random pairs per connection
+    #and year - or, perLag, per all the connections of the same lag and year
+    #(as the tienshan connections of the gapfill). the year is that of the
+    #first epoch, less one for month1 past 12 (the year the connections start)
+    monthIdx,month = months(days)
+    keep = np.ones(len(days),dtype=bool) if exclude is None else ~np.isin(days,exclude)
+    lagMatrix = monthIdx[None,:]-monthIdx[:,None]
+    year = days.astype('datetime64[Y]').astype(np.int64)
+    rng = np.random.default_rng(seed)
+    #{connection or lag: [(pairs, their years)]}
+    groups = {}
+    for month1,lag in connections:
+        wrap = (month1-1)//12
+        month1 = (month1-1)%12+1
+        pairs = matrix_pairs((lagMatrix==lag) & (month==month1)[:,None] & keep[:,None] & keep[None,:])
+        groups.setdefault(lag if perLag else (month1,lag),[]).append((pairs,year[pairs[:,0]]-wrap))
+    out = []
+    for parts in groups.values():
+        pairs = np.concatenate([p for p,y in parts])
+        years = np.concatenate([y for p,y in parts])
+        if maxconn:
+            for y in np.unique(years):
+                sel = pairs[years==y]
+                if len(sel) > maxconn:
+                    sel = sel[np.sort(rng.choice(len(sel),maxconn,replace=False))]
+                out.append(sel)
+        else:
+            out.append(pairs)
+    return np.concatenate(out+[np.zeros((0,2),dtype=np.int64)])
+
+def tienshan_connections(startmonth):
+    #3, 6, 9 and 12 months connections starting from the startmonth
+    s = startmonth
+    return [(m,3) for m in range(s,s+4)]+[(s,6),(s+6,6)]+\
+           [(m,9) for m in range(s+3,s+7)]+[(m,12) for m in range(s,s+7)]
+
+#march, june and september connections
+add36mConnections = [(3,3),(3,6),(6,3),(9,6),(9,9),(9,12),(3,12),(6,9),(6,12)]
+
+def gap_pairs(days,minGap,connections):
+    #epochs before and after a gap longer than minGap days are connected
+    #(the closest ones, up to connections pairs per epoch at the gap)
+    gaps = np.nonzero(np.diff(days).astype(np.int64) > minGap)[0]
+    out = [np.array([[k-i,k+1+j] for i in range(connections) for j in range(connections-i)
+                     if k-i >= 0 and k+1+j < len(days)],dtype=np.int64).reshape(-1,2) for k in gaps]
+    return np.concatenate(out+[np.zeros((0,2),dtype=np.int64)])
+
+def unique_pairs(pairs):
+    #deduplicated pairs, in order of their first appearance
+    if not len(pairs):
+        return pairs.reshape(-1,2)
+    pairs,first = np.unique(pairs,axis=0,return_index=True)
+    return pairs[np.argsort(first)]
+
+################################################################################
+#Network
+################################################################################
+def build_network(dates,config=None,bperp=None,master=None,seed=0):
+    #returns (days,pairs) - sorted unique epochs and the (N,2) int array of
+    #pairs of their indices. bperp (same order as dates) is needed for maxBperp,
+    #master is excluded from the add36m connections
+    config = dict(networkDefaults,**(config or {}))
+    if config['maxBperp'] and bperp is None:
+        raise ValueError('the max. bperp of the network ({} m) needs the bperp of the epochs'.format(
+            config['maxBperp']))
+    days = as_days(dates)
+    btemp = lambda p: (days[p[:,1]]-days[p[:,0]]).astype(np.int64)
+    parts = []
+    pairs = nearest_pairs(len(days),int(config['nearest']))
+    if config['maxBtemp']:
+        pairs = pairs[btemp(pairs) < config['maxBtemp']]
+    parts.append(pairs)
+    if config['volcsSouth']:
+        parts.append(window_pairs(days,[11,12,1,2,3],456))
+    #seasonal connections only for data longer than 3 months
+    if config['seasonal'] and len(days) > 3 and (days[-2]-days[1]).astype(np.int64) > 89:
+        if config['seasonal'] == 'tienshan':
+            parts.append(month_lag_pairs(days,tienshan_connections(int(config['startmonth'])),
+                                         maxconn=100,seed=seed,perLag=True))
+        elif config['seasonal'] == 'add36m':
+            exclude = as_days([master]) if master is not None else None
+            parts.append(month_lag_pairs(days,add36mConnections,maxconn=5,exclude=exclude,seed=seed))
+    pairs = unique_pairs(np.concatenate(parts))
+    if config['maxBperp']:
+        bperp = pd.Series(np.asarray(bperp,dtype=float),index=as_days_unsorted(dates))
+        bperp = bperp[~bperp.index.duplicated()].reindex(days).values
+        #(pairs with unknown bperp are kept)
+        pairs = pairs[~(np.abs(bperp[pairs[:,1]]-bperp[pairs[:,0]]) > config['maxBperp'])]
+    if config['gapBridge']:
+        #gap bridges are kept regardless of the limits
+        pairs = unique_pairs(np.concatenate([pairs,gap_pairs(days,config['gapBridge'],
+                                                             int(config['nearest']))]))
+    return days,pairs
@@ -0,0 +1,159 @@
+################################################################################
+# Imports
+################################################################################
+import numpy as np
+import heapq
+
+# packing of the items of a processing step (slcs, rslcs, ifgs, unws) to jobs,
+# balanced by their estimated runtime and with a cap on the runtime of a job
+# (and on its items for some steps)
+
+################################################################################
+#Runtime estimates
+################################################################################
+#hours per item of a typical frame (as in licsar_make_frame.sh)
+stageHours = {'mk_image':0.9,'coreg':1.9,'mk_ifg':0.4,'unwrap':1.5}
+#bursts of a typical IW frame (3 swaths of 13 bursts)
+refBursts = 39
+#job overhead (env setup, copying) and the walltime of the jobs - in hours
+jobOverhead = 1.5
+maxJobHours = 24-jobOverhead
+#re-coregistration using an existing LUT is about twice faster
+lutFactor = 0.5
+#max. items of a job (the coreg jobs keep the old maxperjob limit, an epoch
+#with a bad estimate does not make its job run out of the walltime so easily)
+maxJobItems = {'coreg':15}
+
+def estimate_costs(jobType,nItems,nBursts=None,lut=None,itemHours=None):
+    #estimated runtime [hours] of each item:
+    #   nBursts ... bursts of the frame (runtime scales with it, SM frames have none)
+    #   lut ... bool per item - coreg items having a LUT are only re-coregistered
+    #   itemHours ... runtime of an item, e.g. from the history (batchTimingLib),
+    #                 instead of the typical one scaled by nBursts
+    if itemHours:
+        costs = np.full(nItems,float(itemHours))
+    else:
+        costs = np.full(nItems,stageHours.get(jobType,1.0))
+        if nBursts:
+            costs *= np.clip(float(nBursts)/refBursts,0.25,4)
+    if lut is not None and jobType == 'coreg':
+        costs[np.asarray(lut,dtype=bool)] *= lutFactor
+    return costs
+
+################################################################################
+#Packing
+################################################################################
+def min_jobs(costs,nJobs,capHours,maxItems=None):
+    #at least as many jobs as needed to keep the total below the cap (and the
+    #items up to maxItems)
+    nJobs = max(int(nJobs),int(np.ceil(costs.sum()/capHours)),1)
+    if maxItems:
+        nJobs = max(nJobs,int(np.ceil(len(costs)/maxItems)))
+    return nJobs
+
+def pack_lpt(costs,nJobs,capHours=maxJobHours,maxItems=None):
+    #longest processing time first - each item (the expensive first) goes to
+    #the job that would finish first. a new job is opened if the item would
+    #exceed capHours or maxItems. returns lists of item indices (in their
+    #original order)
+    costs = np.asarray(costs,dtype=float)
+    nJobs = min_jobs(costs,nJobs,capHours,maxItems)
+    jobs = [(0.0,j) for j in range(nJobs)]
+    members = [[] for j in range(nJobs)]
+    #stable sort, so equal costs are spread round robin in the input order
+    for i in np.argsort(-np.asarray(costs),kind='stable'):
+        load,j = heapq.heappop(jobs)
+        if members[j] and (load+costs[i] > capHours or
+                           (maxItems and len(members[j]) >= maxItems)):
+            heapq.heappush(jobs,(load,j))
+            j = len(members)
+            members.append([])
+            load = 0.0
+        members[j].append(int(i))
+        heapq.heappush(jobs,(load+costs[i],j))
+    return [sorted(m) for m in members if m]
+
+def pack_contiguous(costs,nJobs,capHours=maxJobHours,maxItems=None):
+    #splits the items (in their order) to nJobs runs of similar total cost,
+    #runs exceeding capHours or maxItems are split further. keeps neighbouring
+    #items (e.g. ifgs sharing epochs) in the same job
+    costs = np.asarray(costs,dtype=float)
+    if not len(costs):
+        return []
+    nJobs = min(min_jobs(costs,nJobs,capHours,maxItems),len(costs))
+    cumCost = np.cumsum(costs)
+    cuts = np.searchsorted(cumCost,cumCost[-1]*np.arange(1,nJobs)/nJobs,side='right')
+    out = []
+    for run in np.split(np.arange(len(costs)),np.unique(cuts)):
+        start,load = 0,0.0
+        for k in range(len(run)):
+            if k > start and (load+costs[run[k]] > capHours or
+                              (maxItems and k-start >= maxItems)):
+                out.append([int(i) for i in run[start:k]])
+                start,load = k,0.0
+            load += costs[run[k]]
+        out.append([int(i) for i in run[start:]])
+    return [m for m in out if m]
+
+def window_starts(dateGroups):
+    #first date of each group of epochs (e.g. of the coreg jobs), sorted
+    return np.sort([np.asarray(g,dtype='datetime64[D]').min() for g in dateGroups if len(g)])
+
+def window_index(starts,dates):
+    #window of each date (dates before the first window go to the first one)
+    dates = np.asarray(dates,dtype='datetime64[D]')
+    return np.clip(np.searchsorted(starts,dates,side='right')-1,0,None)
+
+def pack_windows(windows,costs,nJobs,capHours=maxJobHours,maxItems=None):
+    #items (in their order) packed per window - every window gets at least one
+    #job and the nJobs are shared by the windows according to their cost, so
+    #a job never mixes items of two windows
+    windows = np.asarray(windows)
+    costs = np.asarray(costs,dtype=float)
+    if not len(costs):
+        return []
+    labels = np.unique(windows)
+    windowCosts = np.array([costs[windows==w].sum() for w in labels])
+    share = np.maximum(1,np.round(nJobs*windowCosts/max(windowCosts.sum(),1e-9))).astype(int)
+    out = []
+    for w,n in zip(labels,share):
+        idx = np.nonzero(windows==w)[0]
+        out += [[int(idx[i]) for i in g] for g in pack_contiguous(costs[idx],n,capHours,maxItems)]
+    return out
+
+def makespan(costs,groups):
+    #estimated runtime of the longest job
+    costs = np.asarray(costs,dtype=float)
+    return max([costs[g].sum() for g in groups]+[0.0])
+
+################################################################################
+#Priorities
+################################################################################
+#priority of the items and of their jobs (higher first): routine updates, the
+#epochs and pairs after an event (e.g. an earthquake) and the co-seismic pairs
+#spanning it with their epochs. an epoch on the event day counts as after it.
+#the items an item needs have at least its priority
+routinePriority = 0
+postEventPriority = 1
+coseismicPriority = 2
+
+def pair_priorities(dates1,dates2,eventDate):
+    dates1 = np.asarray(dates1,dtype='datetime64[D]')
+    dates2 = np.asarray(dates2,dtype='datetime64[D]')
+    eventDate = np.datetime64(eventDate,'D')
+    out = np.full(len(dates1),routinePriority)
+    out[dates1>=eventDate] = postEventPriority
+    out[(dates1<eventDate)&(dates2>=eventDate)] = coseismicPriority
+    return out
+
+def epoch_priorities(dates,dates1,dates2,eventDate):
+    #epochs after the event, and the epochs of the co-seismic pairs (given by
+    #their dates1/2) before all
+    dates = np.asarray(dates,dtype='datetime64[D]')
+    out = np.full(len(dates),routinePriority)
+    out[dates>=np.datetime64(eventDate,'D')] = postEventPriority
+    pairs = pair_priorities(dates1,dates2,eventDate)==coseismicPriority
+    coseismicDates = np.union1d(np.asarray(dates1,dtype='datetime64[D]')[pairs],
+                                np.asarray(dates2,dtype='datetime64[D]')[pairs])
+    out[np.isin(dates,coseismicDates)] = coseismicPriority
+    return out
@@ -0,0 +1,213 @@
+################################################################################
+# Imports
+################################################################################
+import subprocess
+import os
+from configLib import config
+
+# submission of the frame job arrays with per task dependencies. every step
+# ($step.lotus2.sh of licsar_make_frame.sh, task i runs the job of the i-th
+# line of $step.nowait.sh) is submitted as one or more (sub)arrays: tasks that
+# wait for the same tasks of the previous step go together. a task waiting only
+# for the task of the same index gets aftercorr, the others afterok (or
+# afterany) on the previous array tasks. the tasks of a submitted step are kept
+# in $step.plan (job id, array id, task index) for the next step. tasks of
+# high priority jobs (see batchPackLib, Priorities) go to their own arrays,
+# submitted first and with the PriorityQOS of the [Fleet] section of
+# FRAME_BATCH_CONFIG (default high)
+priorityQos = config.get('Fleet','PriorityQOS',fallback='high')
+
+################################################################################
+#Plan
+################################################################################
+stepOrder = ['framebatch_01_mk_image','framebatch_02_coreg',
+             'framebatch_03_mk_ifg','framebatch_04_unwrap']
+stepTypes = {'framebatch_01_mk_image':'mk_image',
+             'framebatch_02_coreg':'coreg',
+             'framebatch_03_mk_ifg':'mk_ifg',
+             'framebatch_04_unwrap':'unwrap'}
+
+def previous_step(step):
+    i = stepOrder.index(step)
+    return stepOrder[i-1] if i else None
+
+def read_array_tasks(nowaitFile):
+    #job ids of the array tasks 1..N
+    if not os.path.exists(nowaitFile):
+        return []
+    with open(nowaitFile) as f:
+        return [int(l.split()[-1]) for l in f if l.strip()]
+
+def read_plan(planFile):
+    #{job id: (array id, task index)} of a submitted step
+    tasks = {}
+    if os.path.exists(planFile):
+        with open(planFile) as f:
+            for l in f:
+                if l.strip():
+                    jobId,arrayId,index = l.split()
+                    tasks[int(jobId)] = (arrayId,int(index))
+    return tasks
+
+def write_plan(planFile,tasks):
+    with open(planFile,'w') as f:
+        for jobId,(arrayId,index) in sorted(tasks.items()):
+            f.write('{} {} {}\n'.format(jobId,arrayId,index))
+
+def plan_step(taskJobs,deps,prevTasks,afterany=False,priorities=None):
+    #[(task indices, dependency, priority)] of a step, the higher priority
+    #first - dependency is None, ('corr',array id) or ('tasks',[array id_index, ..]).
+    #taskJobs are the job ids of the tasks 1..N, deps {job id: [job ids of the
+    #previous step]}, prevTasks as from read_plan, priorities {job id: priority}
+    #of the jobs above the routine
+    priorities = priorities or {}
+    groups = {}
+    for index,jobId in enumerate(taskJobs,1):
+        need = sorted({prevTasks[p] for p in deps.get(jobId,[]) if p in prevTasks})
+        if not need:
+            key = None
+        elif len(need) == 1 and need[0][1] == index and not afterany:
+            key = ('corr',need[0][0])
+        else:
+            key = ('tasks',tuple('{}_{}'.format(a,i) for a,i in need))
+        groups.setdefault((priorities.get(jobId,0),key),[]).append(index)
+    return [(indices,key,priority) for (priority,key),indices in
+            sorted(groups.items(),key=lambda g : -g[0][0])]
+
+def dependency_string(dependency,afterany=False):
+    if not dependency:
+        return None
+    kind,on = dependency
+    if kind == 'corr':
+        return 'aftercorr:'+on
+    return ('afterany:' if afterany else 'afterok:')+':'.join(on)
+
+def array_string(indices):
+    #1,2,3,5 -> 1-3,5
+    out = []
+    indices = sorted(indices)
+    start = prev = indices[0]
+    for i in indices[1:]+[None]:
+        if i is not None and i == prev+1:
+            prev = i
+            continue
+        out.append(str(start) if start == prev else '{}-{}'.format(start,prev))
+        if i is not None:
+            start = prev = i
+    return ','.join(out)
+
+################################################################################
+#Backends
+################################################################################
+class SlurmBackend():
+    #sbatch - the options override the #SBATCH lines of the script. tasks whose
+    #afterok/aftercorr can no longer be satisfied are removed by slurm.
+    #throttle limits the running tasks of an array (--array=..%N), arrays of a
+    #priority above the routine get the priorityQos
+    def __init__(self,throttle=None,priorityQos=priorityQos):
+        self.throttle = throttle
+        self.priorityQos = priorityQos
+
+    def sbatch_command(self,script,indices,dependency,priority=0):
+        array = array_string(indices)
+        if self.throttle:
+            array += '%{}'.format(self.throttle)
+        cmd = ['sbatch','--parsable','--array='+array]
+        if priority and self.priorityQos:
+            cmd += ['--qos='+self.priorityQos]
+        if dependency:
+            cmd += ['--dependency='+dependency]
+            if not dependency.startswith('afterany'):
+                cmd += ['--kill-on-invalid-dep=yes']
+        return cmd+[script]
+
+    def submit(self,script,indices,dependency,priority=0):
+        out = subprocess.run(self.sbatch_command(script,indices,dependency,priority),
+                check=True,capture_output=True,text=True).stdout.strip()
+        #(--parsable prints 'jobid' or 'jobid;cluster')
+        return out.split(';')[0]
+
+    def cancel(self,arrayIds):
+        #True if the arrays were cancelled
+        try:
+            subprocess.run(['scancel']+list(arrayIds),check=True,capture_output=True)
+        except (OSError,subprocess.CalledProcessError):
+            return False
+        return True
+
+class DryRunBackend(SlurmBackend):
+    #prints the sbatch commands, the arrays get ids DRY1, DRY2, ..
+    def __init__(self,throttle=None,priorityQos=priorityQos):
+        SlurmBackend.__init__(self,throttle,priorityQos)
+        self.count = 0
+
+    def submit(self,script,indices,dependency,priority=0):
+        self.count += 1
+        print(' '.join(self.sbatch_command(script,indices,dependency,priority))+'   # DRY{}'.format(self.count))
+        return 'DRY{}'.format(self.count)
+
+    def cancel(self,arrayIds):
+        print('scancel '+' '.join(arrayIds))
+        return True
+
+class LocalBackend():
+    #runs the tasks right away, one after the other, with SLURM_ARRAY_TASK_ID set
+    #(the steps are submitted in order, so the dependencies are met). the
+    #output goes to logDir/local_STEP.TASK.out|err
+    def __init__(self,logDir='LOGS'):
+        self.logDir = logDir
+        self.count = 0
+
+    def submit(self,script,indices,dependency,priority=0):
+        self.count += 1
+        name = os.path.basename(script).split('.')[0]
+        for index in indices:
+            logName = os.path.join(self.logDir,'local_{}.{}'.format(name,index))
+            env = dict(os.environ,SLURM_ARRAY_TASK_ID=str(index),SLURM_ARRAY_JOB_ID='LOCAL{}'.format(self.count))
+            with open(logName+'.out','w') as out, open(logName+'.err','w') as err:
+                rc = subprocess.run(['bash',script],env=env,stdout=out,stderr=err).returncode
+            print('{} task {}: exit code {}'.format(name,index,rc))
+        return 'LOCAL{}'.format(self.count)
+
+    def cancel(self,arrayIds):
+        #(the tasks have run already)
+        return False
+
+################################################################################
+#Submission
+################################################################################
+class PartialSubmission(Exception):
+    #a (sub)array of the step failed to submit and the arrays submitted before
+    #it could not be cancelled - their tasks must not be submitted again
+    def __init__(self,step,tasks,arrayIds,error):
+        self.step = step
+        self.tasks = tasks
+        self.arrayIds = arrayIds
+        self.error = error
+    def __str__(self):
+        return 'only {} tasks of {} were submitted ({}): {}'.format(len(self.tasks),
+                self.step,':'.join(self.arrayIds),self.error)
+
+def submit_step(backend,step,deps,prevTasks,afterany=False,priorities=None):
+    #submits the step (from $step.nowait.sh and $step.lotus2.sh in the current
+    #dir), returns its tasks (as read_plan) and the ids of the submitted arrays.
+    #priorities {job id: priority} as from batchDBLib.get_job_priorities. if
+    #a (sub)array fails to submit, the arrays submitted before are cancelled
+    #and the error raised - so the step can be submitted again as a whole -
+    #or, if they cannot be cancelled, PartialSubmission with them
+    taskJobs = read_array_tasks(step+'.nowait.sh')
+    tasks = {}
+    arrayIds = []
+    if not taskJobs:
+        return tasks,arrayIds
+    for indices,dependency,priority in plan_step(taskJobs,deps,prevTasks,afterany,priorities):
+        try:
+            arrayId = backend.submit(step+'.lotus2.sh',indices,dependency_string(dependency,afterany),priority)
+        except (OSError,subprocess.CalledProcessError) as e:
+            if arrayIds and not backend.cancel(arrayIds):
+                raise PartialSubmission(step,tasks,arrayIds,e)
+            raise
+        arrayIds.append(arrayId)
+        for index in indices:
+            tasks[taskJobs[index-1]] = (arrayId,index)
+    return tasks,arrayIds
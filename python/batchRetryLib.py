@@ -0,0 +1,160 @@
+################################################################################
+# Imports
+################################################################################
+import os
+import datetime as dt
+import numpy as np
+import pandas as pd
+import batchDBLib as lq
+
+# retries of the failed items (retryFailed.py). every failure of an item (in
+# a job that is over, see batchDBLib, Retries) is classified and recorded in
+# its retry history (item_retry). if another attempt may succeed, the item is
+# requeued to a small follow-up job once its backoff has passed:
+#   killed ..... left building or unprocessed by its job, or stopped by a
+#                signal / out of memory (walltime kill, node failure) - retried
+#   transient .. db or connection error - retried
+#   filesystem . error of the file system (OSError, e.g. a stale NFS handle) -
+#                retried
+#   input ...... missing input (-2, -4) - retried once the input is there (the
+#                items it needs are built, the files/bursts of the epoch exist)
+#   gamma ...... failure status of the processing itself (GAMMA) - not retried
+#   error ...... other exception, deterministic - not retried
+#   unknown .... exception (-3) without a recorded error - retried
+# the n-th failure of an item waits backoffHours*2**(n-1) before its retry,
+# after maxAttempts failures the item is not retried anymore
+
+################################################################################
+#Classification
+################################################################################
+maxAttempts = 3
+backoffHours = 1
+#items of a follow-up job
+retryJobItems = 4
+MISSING_INPUT = [-2,-4]
+EXCEPTION = -3
+#exceptions (class names, as recorded by batchTimingLib.ItemTimer)
+transientErrors = ['OperationalError','InterfaceError','DisconnectionError','TimeoutError',
+                   'ConnectionError','ConnectionResetError','BrokenPipeError']
+filesystemErrors = ['OSError','IOError','BlockingIOError','InterruptedError']
+killErrors = ['SystemExit','KeyboardInterrupt','MemoryError']
+
+def error_class(error):
+    if not isinstance(error,str) or not error:
+        return None
+    return error.split(':')[0].strip()
+
+def classify_failure(status,error=None,inputsReady=True):
+    #(failure class, retryable now) of a failed item
+    errorClass = error_class(error)
+    if status in [lq.BUILDING,lq.UNPROCESSED] or errorClass in killErrors:
+        return 'killed',True
+    if status in MISSING_INPUT:
+        return 'input',bool(inputsReady)
+    if errorClass in transientErrors:
+        return 'transient',True
+    if errorClass in filesystemErrors:
+        return 'filesystem',True
+    if status == EXCEPTION:
+        return ('error',False) if errorClass else ('unknown',True)
+    return 'gamma',False
+
+def epoch_inputs_ready(frame,dates):
+    #[the files of the epoch exist and all the frame bursts were acquired]
+    #for each of the dates (the inputs of mk_image)
+    if not len(dates):
+        return []
+    filesOn = lq.get_frame_files_dates(frame,dates)
+    burstsOn = lq.get_frame_bursts_on_dates(frame,dates)
+    frameBursts = {b[0] for b in lq.get_bursts_in_frame(frame)}
+    out = []
+    for date in dates:
+        paths = [f[2] for f in filesOn.get(date,[])]
+        out.append(bool(paths) and all(os.path.exists(p) for p in paths) and
+                   frameBursts <= {b[0] for b in burstsOn.get(date,[])})
+    return out
+
+def backoff(attempt):
+    return dt.timedelta(hours=backoffHours*2**(attempt-1))
+
+def classify_failures(polyid,frame,jobType,now=None):
+    #the failed items of the frame stage merged with their retry history, one
+    #row per failure: item_id, job_id, status, error, failure, retryable,
+    #attempt, time_failed, retry_after, retry_id (None if not recorded yet)
+    #and changed (the class differs from the recorded one)
+    now = now or dt.datetime.now().replace(microsecond=0)
+    failed = lq.get_failed_items(polyid,jobType)
+    cols = ['item_id','job_id','status','error','failure','retryable','attempt',
+            'time_failed','retry_after','retry_id','changed']
+    if failed.empty:
+        return pd.DataFrame(columns=cols)
+    if jobType == 'mk_image':
+        failed['inputs_ready'] = epoch_inputs_ready(frame,list(failed['acq_date']))
+    history = lq.get_retry_history(polyid,jobType)
+    known = {}
+    attempts = {}
+    for row in history.itertuples():
+        known[(int(row.item_id),int(row.job_id))] = row
+        attempts[int(row.item_id)] = max(attempts.get(int(row.item_id),0),int(row.attempt))
+    out = []
+    for item in failed.itertuples():
+        failure,retryable = classify_failure(item.status,item.error,item.inputs_ready)
+        row = known.get((int(item.item_id),int(item.job_id)))
+        if row is not None:
+            if not pd.isna(row.retry_job_id):
+                #requeued already (and failed again in the same job?) - leave it
+                continue
+            out.append([item.item_id,item.job_id,item.status,item.error,failure,retryable,
+                    int(row.attempt),row.time_failed,row.retry_after,int(row.retry_id),
+                    (failure,retryable) != (row.failure,bool(row.retryable))])
+            continue
+        attempt = attempts.get(int(item.item_id),0)+1
+        timeFailed = now if pd.isna(item.time_finished) else pd.Timestamp(item.time_finished).to_pydatetime()
+        out.append([item.item_id,item.job_id,item.status,item.error,failure,retryable,
+                attempt,timeFailed,timeFailed+backoff(attempt),None,False])
+    return pd.DataFrame(out,columns=cols)
+
+def record_failures(polyid,jobType,failures):
+    #new failures to the retry history, the known ones with a changed class
+    #updated. returns the failures with their retry_id
+    newRows = []
+    updRows = []
+    for f in failures.itertuples():
+        values = {'failure':f.failure,'retryable':bool(f.retryable)}
+        if f.retry_id is None or pd.isna(f.retry_id):
+            newRows.append(dict(values,polyid=int(polyid),stage=jobType,item_id=int(f.item_id),
+                    job_id=int(f.job_id),attempt=int(f.attempt),status=int(f.status),
+                    error=f.error if isinstance(f.error,str) else None,
+                    time_failed=f.time_failed,retry_after=f.retry_after))
+        elif f.changed:
+            updRows.append(dict(values,retry_id=int(f.retry_id)))
+    if newRows or updRows:
+        lq.record_failures(newRows,updRows)
+    history = lq.get_retry_history(polyid,jobType)
+    retryIds = {(int(r.item_id),int(r.job_id)):int(r.retry_id) for r in history.itertuples()}
+    return failures.assign(retry_id=[retryIds.get((int(f.item_id),int(f.job_id)))
+                                     for f in failures.itertuples()])
+
+def due_failures(failures,now=None,maxAttempts=maxAttempts):
+    #the failures to be retried now
+    now = now or dt.datetime.now().replace(microsecond=0)
+    if failures.empty:
+        return failures
+    due = failures['retryable'].astype(bool) & (failures['attempt'] <= maxAttempts) & \
+          (pd.to_datetime(failures['retry_after']) <= pd.Timestamp(now))
+    return failures[due.values]
+
+################################################################################
+#Requeue
+################################################################################
+def requeue_failures(polyid,user,jobType,due):
+    #the items of the due failures (recorded, with retry_id) to new jobs of at
+    #most retryJobItems items, returns the job ids
+    if due.empty:
+        return []
+    idCol = lq.jobItems[jobType][1]
+    itemIds = due[['item_id']].rename(columns={'item_id':idCol}).reset_index(drop=True)
+    nJobs = int(np.ceil(len(itemIds)/float(retryJobItems)))
+    groups = lq.pack_job_items(polyid,jobType,itemIds,idCol,nJobs)
+    retryIds = dict(zip(due['item_id'].astype(int),due['retry_id'].astype(int)))
+    return lq.requeue_failed_items(polyid,user,jobType,groups,retryIds)
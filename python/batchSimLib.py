@@ -0,0 +1,171 @@
+################################################################################
+# Imports
+################################################################################
+import heapq
+import io
+import contextlib
+import numpy as np
+import pandas as pd
+from collections import namedtuple
+from configLib import config
+import batchDBLib as lq
+from batchNetworkLib import network_config,build_network,pairs_to_dates
+from batchPackLib import estimate_costs,jobOverhead,maxJobHours
+
+# discrete-event simulation of the processing of a frame (simulateSchedule.py),
+# to choose the batchN of createFrameCache.py and the cap of the runtime of its
+# jobs. the items (epochs and the pairs of the 3 nearest network, as
+# createFrameCache.py makes them) are packed to jobs by the rules of batchDBLib
+# (pack_slc_items, pack_rslc_items by date windows, pack_pair_items per window),
+# a job takes the predicted runtime of its items (batchTimingLib.ResourcePredictor)
+# and the job overhead. a job waits for the jobs of the previous stage with the
+# items it needs (the per task dependencies of frameJobPlan.py), then in the
+# queue - the model of the [Schedule] section of FRAME_BATCH_CONFIG:
+#   QueueWait: 1.0 ........ hours in the queue of every job
+#   QueueWaitPerHour: 0.1 . more hours in the queue per hour of the walltime
+#                           (short jobs are backfilled sooner)
+#   MaxRunning: 50 ........ jobs of the user running at once (0 - no limit)
+# jobs get a free slot in the order they left the queue wait. the makespan is
+# the time from the submission to the end of the last job, the core-hours the
+# runtime of all the jobs (one core each)
+
+################################################################################
+#Queue model
+################################################################################
+batchNCandidates = [1,2,4,8,12,16,24,32,48,64]
+jobHoursCandidates = [maxJobHours,12,6]
+#the fastest schedules within this fraction of the shortest makespan compete
+#by their core-hours
+makespanTolerance = 0.05
+
+def queue_model(**overrides):
+    queue = {'wait':config.getfloat('Schedule','QueueWait',fallback=1.0),
+             'waitPerHour':config.getfloat('Schedule','QueueWaitPerHour',fallback=0.1),
+             'maxRunning':config.getint('Schedule','MaxRunning',fallback=50)}
+    queue.update({k:v for k,v in overrides.items() if v is not None})
+    return queue
+
+def queue_wait(hours,queue):
+    #hours in the queue of a job of the given runtime (its walltime HOURS:59)
+    return queue['wait']+queue['waitPerHour']*(int(hours)+1)
+
+################################################################################
+#Frame jobs
+################################################################################
+stages = ['mk_image','coreg','mk_ifg','unwrap']
+#stage, hours - runtime incl. the overhead, needs - indices of the jobs it waits for
+SimJob = namedtuple('SimJob',['stage','hours','needs'])
+
+def frame_items(dates,masterDate=None,netConfig=None):
+    #{stage: DataFrame} of the items of a frame with the acquisition dates:
+    #slcs/rslcs of all the epochs but the master (acq_date), ifgs/unws of the
+    #pairs of the network (acq_date_1/2), the ids are their indices
+    netConfig = netConfig or network_config(nearest=3,seasonal=None,volcsSouth=False)
+    days,pairs = build_network(dates,netConfig)
+    if masterDate is None:
+        masterDate = days[0]
+    epochs = pd.to_datetime(days[days!=np.datetime64(masterDate,'D')])
+    pairDates = pairs_to_dates(days,pairs)
+    items = {'mk_image':pd.DataFrame({'slc_id':np.arange(len(epochs)),'acq_date':epochs}),
+             'coreg':pd.DataFrame({'rslc_id':np.arange(len(epochs)),'acq_date':epochs})}
+    for stage,idCol in [('mk_ifg','ifg_id'),('unwrap','unw_id')]:
+        items[stage] = pd.DataFrame({idCol:np.arange(len(pairDates)),
+                                     'acq_date_1':pd.to_datetime(pairDates[:,0]),
+                                     'acq_date_2':pd.to_datetime(pairDates[:,1])})
+    return items
+
+def pack_frame(items,itemHours,batchN,capHours=maxJobHours):
+    #SimJobs of all the stages, packed as by createFrameCache.py. itemHours
+    #{stage: hours of an item}
+    items = {stage:df.assign(cost=estimate_costs(stage,len(df),itemHours=itemHours[stage]))
+             for stage,df in items.items()}
+    #(the packing reports the jobs added to fit the walltime, not of use here)
+    with contextlib.redirect_stdout(io.StringIO()):
+        groups = {'mk_image':lq.pack_slc_items(None,items['mk_image'],batchN,capHours)}
+        groups['coreg'],windows = lq.pack_rslc_items(None,items['coreg'],batchN,byDate=True,
+                                                     capHours=capHours)
+        groups['mk_ifg'] = lq.pack_pair_items(None,'mk_ifg',items['mk_ifg'],'ifg_id',batchN,
+                                              windows,capHours)
+        groups['unwrap'] = lq.pack_pair_items(None,'unwrap',items['unwrap'],'unw_id',batchN,
+                                              windows,capHours)
+    jobs = []
+    #{stage: {item key (date or pair id): job index}}
+    jobOf = {}
+    for stage in stages:
+        df = items[stage].set_index(lq.jobItems[stage][1])
+        jobOf[stage] = {}
+        for group in groups[stage]:
+            rows = df.loc[group]
+            if stage == 'mk_image':
+                needs = set()
+            elif stage == 'coreg':
+                needs = {jobOf['mk_image'][d] for d in rows['acq_date']}
+            elif stage == 'mk_ifg':
+                #(the master has no rslc to wait for)
+                needs = {jobOf['coreg'][d] for d in pd.concat([rows['acq_date_1'],rows['acq_date_2']])
+                         if d in jobOf['coreg']}
+            else:
+                needs = {jobOf['mk_ifg'][i] for i in group}
+            keys = rows['acq_date'] if 'acq_date' in rows.columns else group
+            for key in keys:
+                jobOf[stage][key] = len(jobs)
+            jobs.append(SimJob(stage,rows['cost'].sum()+jobOverhead,sorted(needs)))
+    return jobs
+
+################################################################################
+#Simulation
+################################################################################
+def simulate(jobs,queue):
+    #(makespan, core-hours) of the jobs submitted at once at time 0
+    if not jobs:
+        return 0.0,0.0
+    waiting = [len(job.needs) for job in jobs]
+    dependents = [[] for job in jobs]
+    for i,job in enumerate(jobs):
+        for k in job.needs:
+            dependents[k].append(i)
+    #events (time, kind, job) - a job done (0) or out of the queue wait (1)
+    events = [(queue_wait(job.hours,queue),1,i) for i,job in enumerate(jobs) if not job.needs]
+    heapq.heapify(events)
+    ready = []
+    running = 0
+    maxRunning = queue['maxRunning'] or len(jobs)
+    end = 0.0
+    while events:
+        t,kind,i = heapq.heappop(events)
+        if kind == 1:
+            heapq.heappush(ready,(t,i))
+        else:
+            running -= 1
+            end = t
+            for k in dependents[i]:
+                waiting[k] -= 1
+                if not waiting[k]:
+                    heapq.heappush(events,(t+queue_wait(jobs[k].hours,queue),1,k))
+        while ready and running < maxRunning:
+            _,k = heapq.heappop(ready)
+            running += 1
+            heapq.heappush(events,(t+jobs[k].hours,0,k))
+    return end,float(sum(job.hours for job in jobs))
+
+def evaluate_schedules(items,itemHours,queue,batchNs=None,jobHours=None):
+    #DataFrame of the simulated schedules: batchN, job_hours (the cap), jobs,
+    #longest_job, makespan and core_hours [h]. batchN above the epochs are
+    #skipped (the same jobs)
+    nEpochs = max(len(items['coreg']),1)
+    batchNs = sorted({min(int(n),nEpochs) for n in (batchNs or batchNCandidates)})
+    out = []
+    for batchN in batchNs:
+        for capHours in (jobHours or jobHoursCandidates):
+            jobs = pack_frame(items,itemHours,batchN,capHours)
+            span,coreHours = simulate(jobs,queue)
+            out.append([batchN,float(capHours),len(jobs),max(job.hours for job in jobs),
+                        span,coreHours])
+    return pd.DataFrame(out,columns=['batchN','job_hours','jobs','longest_job',
+                                     'makespan','core_hours'])
+
+def pick_schedule(schedules,tolerance=makespanTolerance):
+    #the row with the fewest core-hours of those with a makespan close to the
+    #shortest one (then the fewer jobs)
+    fast = schedules[schedules['makespan'] <= schedules['makespan'].min()*(1+tolerance)]
+    return fast.sort_values(['core_hours','jobs','makespan'],kind='stable').iloc[0]
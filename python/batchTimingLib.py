@@ -0,0 +1,164 @@
+################################################################################
+# Imports
+################################################################################
+import numpy as np
+import pandas as pd
+import datetime as dt
+import resource
+import time
+import re
+from batchPackLib import stageHours,refBursts,jobOverhead,maxJobHours
+
+# runtime and peak memory of the processed items (written by the ab_LiCSAR_*
+# scripts to the item_timing table, see batchDBLib) and the walltime/memory
+# predictor built from them, used when submitting the jobs
+
+################################################################################
+#Measuring
+################################################################################
+def burst_swaths(burstList):
+    #number of swaths in the bursts of the frame (IW frames have 1-3, SM none)
+    swaths = set()
+    for b in burstList:
+        m = re.search(r'IW[1-3]',str(b[0]))
+        if m:
+            swaths.add(m.group(0))
+    return len(swaths)
+
+def self_peak_rss():
+    #peak RSS [MB] of this process since the last reset_self_peak
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])/1024.
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024.
+
+def reset_self_peak():
+    #(linux only - otherwise the peak of the whole process is reported)
+    try:
+        with open('/proc/self/clear_refs','w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+class ItemTimer():
+    #measures one item of a job: runtime incl. the env setup and the peak RSS.
+    #the processing runs mostly in GAMMA subprocesses, whose peak is only known
+    #as the max over all the finished children so far, so the item gets the
+    #higher of the two peaks - exact for the first item of the job, an upper
+    #bound for the others. the record is given to the status writer at exit,
+    #with the exception if the item raised one (for batchRetryLib). the env of
+    #the item swallows its exceptions, so it passes them on (LicsEnv.timer):
+    #   with ItemTimer(statusWriter,context,'coreg',rslcId) as timer, XxxEnv(..) as env:
+    #       env.timer = timer
+    #       ...
+    #       timer.rc = rc
+    def __init__(self,statusWriter,context,stage,itemId,rglks=None,aglks=None):
+        self.statusWriter = statusWriter
+        self.record = {'polyid':int(context.polyid),'job_id':int(context.job_id),
+                'stage':stage,'item_id':int(itemId),
+                'n_bursts':len(context.bursts) or None,
+                'n_swaths':burst_swaths(context.bursts) or None,
+                'rglks':rglks,'aglks':aglks}
+        self.rc = None
+        self.error = None
+
+    def set_error(self,excType,exc):
+        self.error = '{}: {}'.format(excType.__name__,exc)[:200]
+
+    def __enter__(self):
+        reset_self_peak()
+        self.start = time.time()
+        return self
+
+    def __exit__(self,*args):
+        childPeak = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss/1024.
+        self.record.update({'runtime_s':round(time.time()-self.start,1),
+                'max_rss_mb':round(max(self_peak_rss(),childPeak),1),
+                'rc':None if self.rc is None else int(self.rc),
+                'time_finished':dt.datetime.now().replace(microsecond=0).isoformat()})
+        if args[0]:
+            self.set_error(args[0],args[1])
+        if self.error:
+            self.record['error'] = self.error
+        try:
+            self.statusWriter.set_item_timing(self.record)
+        except Exception as e:
+            #never fail the processing because of the statistics
+            print('warning, could not record the item timing: {}'.format(e))
+
+################################################################################
+#Prediction
+################################################################################
+#memory [MB] per stage for frames up to 45, 89, 119 and more bursts
+#(the fixed rules of licsar_make_frame.sh, used while there is no history)
+defaultMemory = {'mk_image':[12288,16384,25000,32000],
+                 'coreg':[16384,25000,32000,48000],
+                 'mk_ifg':[4096,8192,16384,25000],
+                 'unwrap':[8192,16384,25000,32000]}
+#records needed to use the history of the frame size / of the stage
+minRecords = 5
+#quantiles of the runtime and the memory used for the request, memory margin
+runtimeQuantile = 0.9
+memoryQuantile = 0.95
+memoryMargin = 1.25
+minMemory = 2048
+
+def default_memory(stage,nBursts):
+    rules = defaultMemory.get(stage,defaultMemory['mk_image'])
+    nBursts = nBursts or 1
+    return rules[int(np.searchsorted([45,89,119],nBursts,side='left'))]
+
+def round_memory(mem):
+    #to whole GB, at least minMemory
+    return int(max(minMemory,np.ceil(mem/1024.)*1024))
+
+class ResourcePredictor():
+    #expected runtime [h] and memory [MB] per item and per job of a stage, from
+    #the item_timing history (DataFrame with stage, n_bursts, rglks, aglks,
+    #runtime_s, max_rss_mb, rc). only the items processed successfully (rc 0)
+    #count - the failed ones mostly abort early (e.g. missing input). records
+    #of frames of the same size (and multilook) are used if there are enough
+    #of them, otherwise all records of the stage scaled per burst, otherwise
+    #the fixed estimates (stageHours, defaultMemory)
+    def __init__(self,history=None):
+        if history is None:
+            history = pd.DataFrame(columns=['stage','n_bursts','rglks','aglks',
+                                            'runtime_s','max_rss_mb','rc'])
+        self.history = history[(history['runtime_s']>0) & (history['rc']==0)]
+
+    def records(self,stage,nBursts,rglks=None,aglks=None):
+        hist = self.history[self.history['stage']==stage]
+        same = hist[hist['n_bursts']==nBursts]
+        if rglks and aglks:
+            sameML = same[(same['rglks']==rglks) & (same['aglks']==aglks)]
+            if len(sameML) >= minRecords:
+                return sameML,1.0
+        if len(same) >= minRecords:
+            return same,1.0
+        hist = hist[hist['n_bursts']>0]
+        if nBursts and len(hist) >= minRecords:
+            return hist,float(nBursts)/hist['n_bursts']
+        return None,None
+
+    def item(self,stage,nBursts=None,rglks=None,aglks=None):
+        #(hours, MB) of one item
+        recs,scale = self.records(stage,nBursts,rglks,aglks)
+        if recs is None:
+            hours = stageHours.get(stage,1.0)
+            if nBursts:
+                hours *= np.clip(float(nBursts)/refBursts,0.25,4)
+            return float(hours),default_memory(stage,nBursts)
+        hours = np.quantile(recs['runtime_s']*scale,runtimeQuantile)/3600.
+        rss = (recs['max_rss_mb']*scale).dropna()
+        if rss.empty:
+            return float(hours),default_memory(stage,nBursts)
+        return float(hours),round_memory(np.quantile(rss,memoryQuantile)*memoryMargin)
+
+    def job(self,stage,nItems,nBursts=None,rglks=None,aglks=None):
+        #(hours, MB) of a job processing nItems items one after the other
+        hours,mem = self.item(stage,nBursts,rglks,aglks)
+        return min(hours*nItems+jobOverhead,maxJobHours+jobOverhead),mem
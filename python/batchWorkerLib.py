@@ -0,0 +1,127 @@
+################################################################################
+# Imports
+################################################################################
+from concurrent.futures import ProcessPoolExecutor,as_completed
+import multiprocessing
+import threading
+import traceback
+import os
+import batchDBLib as lq
+import batchEnvLib
+
+# processing of the items of a job in parallel worker processes (--workers N
+# of the ab_LiCSAR_* scripts, by default SLURM_CPUS_PER_TASK). every worker
+# has its own LicsEnv directory and db connections (the pool of the parent is
+# not shared), its status updates go through a queue to the status writer of
+# the job as they come (e.g. BUILDING while the item runs), which stays the
+# only writer and journals them. the workers start from a fork server (not
+# forked from the job, with the thread of its status writer running), the job
+# setup is passed to them at the start of the pool.
+# an array task may also run several jobs one after the other (run_jobs)
+
+################################################################################
+#Worker count
+################################################################################
+def get_workers(argv):
+    #--workers N (removed from argv), otherwise the cpus of the slurm task
+    workers = None
+    if '--workers' in argv:
+        i = argv.index('--workers')
+        workers = int(argv[i+1])
+        del argv[i:i+2]
+    if workers is None:
+        try:
+            workers = int(os.environ.get('SLURM_CPUS_PER_TASK',1))
+        except ValueError:
+            workers = 1
+    return max(workers,1)
+
+################################################################################
+#Pool
+################################################################################
+workerState = {}
+
+def init_worker(processItem,jobSetup,queue):
+    #new db connections in this process, own env dirs
+    try:
+        lq.engine.dispose(close=False)
+    except TypeError:
+        lq.engine.dispose()
+    batchEnvLib.workerID = os.getpid()
+    workerState['processItem'] = processItem
+    workerState['jobSetup'] = jobSetup
+    workerState['queue'] = queue
+
+def run_worker_item(row):
+    #returns the error (if the item failed), the status updates are queued
+    recorder = lq.StatusRecorder(workerState['queue'])
+    try:
+        workerState['processItem'](row,workerState['jobSetup'],recorder)
+    except Exception:
+        return traceback.format_exc()
+    return None
+
+def forward_updates(queue,statusWriter):
+    #passes the queued status updates of the workers to the status writer,
+    #until None
+    while True:
+        update = queue.get()
+        if update is None:
+            return
+        statusWriter.set(*update)
+
+def run_items(processItem,items,jobSetup,statusWriter,workers=1):
+    #processItem(row,jobSetup,statusBuffer) for every row of the items - one
+    #after the other, or in the given number of worker processes. a failed
+    #item in a worker is reported and the others go on
+    if workers <= 1 or len(items) <= 1:
+        for ind,row in items.iterrows():
+            processItem(row,jobSetup,statusWriter)
+        return
+    workers = min(workers,len(items))
+    print('processing {} items in {} worker processes'.format(len(items),workers))
+    ctx = multiprocessing.get_context('forkserver')
+    #(a put returns once the update is in the pipe, so the updates of a
+    #finished item are all there before the final None)
+    queue = ctx.SimpleQueue()
+    forwarder = threading.Thread(target=forward_updates,args=(queue,statusWriter),
+                                 name='StatusForwarder',daemon=True)
+    forwarder.start()
+    try:
+        with ProcessPoolExecutor(workers,mp_context=ctx,initializer=init_worker,
+                initargs=(processItem,jobSetup,queue)) as pool:
+            futures = [pool.submit(run_worker_item,row) for ind,row in items.iterrows()]
+            for future in as_completed(futures):
+                try:
+                    error = future.result()
+                except Exception as e:
+                    #(the worker died)
+                    print('error in a worker process: {}'.format(e))
+                    continue
+                if error:
+                    print('error processing an item:\n'+error)
+    finally:
+        queue.put(None)
+        forwarder.join()
+
+################################################################################
+#Jobs
+################################################################################
+def run_jobs(processJob,jobIDs):
+    #processJob(jobID) for the jobs of an array task. more jobs (of any frames,
+    #see fleetJobPlan.py) run one after the other, each in its frame batch
+    #dir, and a failing job does not stop the others
+    if len(jobIDs) == 1:
+        return processJob(jobIDs[0])
+    startDir = os.getcwd()
+    for jobID in jobIDs:
+        frame = lq.get_frame_from_job(jobID)
+        frameDir = os.path.join(os.environ.get('BATCH_CACHE_DIR','.'),frame or '')
+        if frame and os.path.isdir(frameDir):
+            os.chdir(frameDir)
+        try:
+            processJob(jobID)
+        except Exception:
+            print('error processing job {}:\n{}'.format(jobID,traceback.format_exc()))
+        finally:
+            os.chdir(startDir)
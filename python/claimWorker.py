@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+# pull based processing of a frame stage - instead of the items fixed to the
+# jobs by createFrameCache.py, the worker claims the next claimable item (see
+# batchDBLib, Work claiming), processes it as the stage script would
+# (ab_LiCSAR_*.py) and goes on until no more items of the stage can get ready.
+# any number of workers can run at once, e.g. as a job array in the frame
+# batch dir (needs the item_claim table, sql/migration_005_item_claim.sql):
+#   sbatch --array=1-40 ... --wrap 'claimWorker.py FRAME coreg'
+# items of a killed worker are claimed again once their lease expires
+# usage: claimWorker.py FRAME STAGE [--lease S] [--max-items N] [--max-idle S] [--clear]
+#   STAGE ......... mk_image, coreg, mk_ifg or unwrap
+#   --lease S ..... lease of a claim [s], renewed while processing (default 1800)
+#   --max-items N . stop after N items
+#   --max-idle S .. stop after S [s] without anything to claim, even if the
+#                   earlier stages are still being processed
+#   --clear ....... first drop the finished and expired claims of the stage, so
+#                   that the items that failed before are tried again
+################################################################################
+#imports
+################################################################################
+import batchDBLib as lq
+import batchEnvLib
+from batchClaimLib import run_claims,new_token
+import importlib
+import sys
+import os
+
+################################################################################
+#Stage scripts
+################################################################################
+#module and item function of each stage (the item functions take the item row,
+#the job setup from the job_setup of the module and the status writer)
+stageScripts = {'mk_image':('ab_LiCSAR_mk_image','process_slc'),
+                'coreg':('ab_LiCSAR_coreg','process_rslc'),
+                'mk_ifg':('ab_LiCSAR_mk_ifg','process_ifg'),
+                'unwrap':('ab_LiCSAR_unwrap','process_unw')}
+
+def option(argv,name,default=None):
+    if name in argv:
+        i = argv.index(name)
+        value = argv[i+1]
+        del argv[i:i+2]
+        return value
+    return default
+
+################################################################################
+#Main
+################################################################################
+def main(argv):
+    argv = list(argv)
+    lease = int(option(argv,'--lease',lq.claimLease))
+    maxItems = option(argv,'--max-items')
+    maxIdle = option(argv,'--max-idle')
+    clear = '--clear' in argv
+    args = [a for a in argv[1:] if not a.startswith('--')]
+    if len(args) != 2 or args[1] not in stageScripts:
+        print('usage: claimWorker.py FRAME STAGE [--lease S] [--max-items N] [--max-idle S] [--clear]')
+        return 1
+    frame,jobType = args
+    polyid = lq.get_polyid(frame)
+    if not polyid:
+        print('frame {} is not in the batch db'.format(frame))
+        return 1
+    if not lq.has_item_claim():
+        print('the item_claim table does not exist (sql/migration_005_item_claim.sql)')
+        return 1
+    if clear:
+        print('dropped {} claims'.format(lq.clear_claims(polyid,jobType)))
+    moduleName,processName = stageScripts[jobType]
+    stageScript = importlib.import_module(moduleName)
+    processItem = getattr(stageScript,processName)
+    #own env dirs also if more workers run here
+    batchEnvLib.workerID = os.getpid()
+    token = new_token()
+    statusWriter = lq.StatusWriter(journal=lq.get_status_journal(frame,'claim_'+token[:8]))
+    statusWriter.catch_signals()
+
+    def process_claimed(itemId):
+        context = lq.get_item_context(jobType,itemId)
+        if not context or context.items.empty:
+            print('{} {} is not to be processed (built or missing its input)'.format(
+                    lq.jobKinds[jobType],itemId))
+            return
+        #(set up per item - e.g. coreg takes the aux from the rslcs built so far)
+        jobSetup = stageScript.job_setup(context)
+        processItem(context.items.iloc[0],jobSetup,statusWriter)
+
+    print('claiming {} items of frame {}'.format(jobType,frame))
+    done = run_claims(polyid,jobType,process_claimed,token,lease,
+            maxItems=int(maxItems) if maxItems else None,
+            maxIdle=int(maxIdle) if maxIdle else None)
+    print('processed {} items'.format(done))
+    statusWriter.flush()
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -9,27 +9,47 @@ check_btemp = True
 #imports
 ################################################################################
 from configLib import config
-from batchDBLib import get_polyid,add_acq_images,set_master,\
-                    create_slcs,create_rslcs,create_ifgs,create_unws,\
+from batchDBLib import get_polyid,get_frame_acq_dates,\
+                    rebuild_frame_tables,update_frame_tables,\
+                    clear_frame_jobs,predict_item_hours,get_frame_burst_count,\
                     batch_link_slcs_to_new_jobs,\
                     batch_link_rslcs_to_new_jobs,\
                     batch_link_ifgs_to_new_jobs,\
                     batch_link_unws_to_new_jobs,\
-                    get_all_rslcs,set_rslc_status,\
-                    get_all_slcs,set_slc_status,\
-                    get_all_ifgs,set_ifg_status,\
-                    get_all_unws,set_unw_status
+                    FrameState,set_items_status
 from batchEnvLib import create_lics_cache_dir, get_rslcs_from_lics, get_ifgs_from_lics
+from batchNetworkLib import network_config, build_network, pairs_to_dates
+from batchPackLib import estimate_costs,epoch_priorities,pair_priorities,routinePriority,maxJobHours
 import sys
 import datetime as dt
 import os
 import glob
 import fnmatch
 import pandas as pd
+import numpy as np
 
 ################################################################################
 #get parameters
 ################################################################################
+#--incremental: keep the existing frame rows (and their statuses), only add the
+#new epochs/pairs and retire the dropped ones (the frame is not set inactive before)
+incremental = '--incremental' in sys.argv
+if incremental:
+    sys.argv.remove('--incremental')
+#--event YYYY-MM-DD: date of an event (e.g. earthquake) - the epochs and pairs
+#after it and the co-seismic pairs get their own jobs, processed first
+eventDate = None
+if '--event' in sys.argv:
+    i = sys.argv.index('--event')
+    eventDate = dt.datetime.strptime(sys.argv[i+1],'%Y-%m-%d')
+    del sys.argv[i:i+2]
+#--job-hours H: cap of the runtime of a job [h] (items of longer jobs go to more
+#jobs), e.g. as chosen by simulateSchedule.py
+capHours = maxJobHours
+if '--job-hours' in sys.argv:
+    i = sys.argv.index('--job-hours')
+    capHours = float(sys.argv[i+1])
+    del sys.argv[i:i+2]
 frame = sys.argv[1]
 batchN = int(sys.argv[2])
 if frame.split('_')[1] == 'SM':
@@ -84,15 +104,16 @@ polyid = get_polyid(frame)
 print('debug:')
 print('polyid is: '+str(polyid))
 print('mstrDate is: '+str(mstrDate))
-masterset = set_master(polyid,mstrDate)
 
-acq_imgs = add_acq_images(polyid, startdate.date(), enddate.date(), mstrDate.date())
+#the frame tables are (re)built at once below (see rebuild_frame_tables)
+acq_imgs = get_frame_acq_dates(polyid, startdate.date(), enddate.date(), mstrDate.date())
 #acq_imgs will now contain at least the master epoch
 if len(acq_imgs)<2:
     print('No acquisitions registered for this frame in this time period. Try framebatch_data_refill.sh first?')
     exit()
 
 
+acq_imgs['acq_date'] = pd.to_datetime(acq_imgs['acq_date'])
 acq_imgs = acq_imgs.sort_values('acq_date').reset_index(drop=True)
 mstrline = acq_imgs[acq_imgs['acq_date']==mstrDate]
 acq_imgs['btemp'] = acq_imgs.acq_date.apply(lambda x: abs(x - mstrDate)) #mstrline['acq_date']))
@@ -195,36 +216,65 @@ if check_btemp:
 #for r in existing_acq:
 #    acq_imgs2 = acq_imgs2[acq_imgs2.acq_date != dt.datetime.strptime(r,'%Y%m%d')]
 
-#slcs = create_slcs(polyid,acq_imgs2)
-slcs = create_slcs(polyid,acq_imgs)
-rslcs = create_rslcs(polyid,acq_imgs)
+#acq_img, slc, rslc, ifg and unw rows incl. the master epoch in one transaction
+#(slcs/rslcs in the btemp order, ifgs/unws including the master)
+acq_dates_with_m = pd.concat([acq_imgs, mstrline], ignore_index=True)['acq_date']
+#3 nearest connections, bridged by the frame's local_config.py if set there
+#(the extra connections, and the max_ifg_btemp limit, are left to the gapfill)
+netConfig = network_config(os.path.join(cacheDir,frame,'local_config.py'),
+                           nearest=3, seasonal=None, volcsSouth=False, maxBtemp=None)
+if netConfig['maxBperp']:
+    #(the bperp of the epochs is known only after the coregistration)
+    print('error - max_ifg_bperp of local_config.py can not be applied by framebatch, '\
+          'please remove it')
+    sys.exit(1)
+netDays, netPairs = build_network(acq_dates_with_m, netConfig)
+ifgPairs = pairs_to_dates(netDays, netPairs)
+if incremental:
+    #jobs of the previous run are replaced by the new ones
+    print('removed {} jobs of the previous run'.format(clear_frame_jobs(polyid)))
+    frameTables = update_frame_tables(polyid, acq_dates_with_m, ifgPairs,
+                                      slcDates=acq_imgs['acq_date'], masterdate=mstrDate)
+    print('incremental update - new: {0} slcs, {1} ifgs; retired: {slc} slcs, {ifg} ifgs'.format(
+            frameTables['slc']['new'].sum(), frameTables['ifg']['new'].sum(), **frameTables['retired']))
+else:
+    frameTables = rebuild_frame_tables(polyid, acq_dates_with_m, ifgPairs,
+                                       slcDates=acq_imgs['acq_date'], masterdate=mstrDate)
+slcs = frameTables['slc'][['slc_id','acq_date']]
+rslcs = frameTables['rslc'][['rslc_id','img_id']]
+#(ifgs/unws with the dates of their epochs, for the grouping to the jobs)
+imgDates = frameTables['acq_img'].set_index('img_id')['acq_date']
+ifgs = frameTables['ifg'][['ifg_id']].assign(acq_date_1=frameTables['ifg']['img_id_1'].map(imgDates).values,
+                                             acq_date_2=frameTables['ifg']['img_id_2'].map(imgDates).values)
+unws = frameTables['unw'][['unw_id']].assign(acq_date_1=frameTables['unw']['img_id_1'].map(imgDates).values,
+                                             acq_date_2=frameTables['unw']['img_id_2'].map(imgDates).values)
+acq_imgs = acq_imgs.join(frameTables['acq_img'].set_index('acq_date'), on='acq_date')
+#estimated runtimes for the job packing (the frame size is read once for all the steps)
+nBursts = get_frame_burst_count(polyid)
+itemHours = {stage:predict_item_hours(polyid,stage,nBursts) for stage in ['mk_image','coreg','mk_ifg','unwrap']}
+slcs = slcs.assign(cost=estimate_costs('mk_image', len(slcs), itemHours=itemHours['mk_image']))
+ifgs = ifgs.assign(cost=estimate_costs('mk_ifg', len(ifgs), itemHours=itemHours['mk_ifg']))
+unws = unws.assign(cost=estimate_costs('unwrap', len(unws), itemHours=itemHours['unwrap']))
+if eventDate:
+    #(the co-seismic epochs from all the pairs of the network)
+    pairDates = (ifgs['acq_date_1'].values, ifgs['acq_date_2'].values)
+    slcs = slcs.assign(priority=epoch_priorities(slcs['acq_date'], *pairDates, eventDate))
+    ifgs = ifgs.assign(priority=pair_priorities(*pairDates, eventDate))
+    unws = unws.assign(priority=pair_priorities(unws['acq_date_1'], unws['acq_date_2'], eventDate))
+    print('event {0}: {1} of {2} ifgs to be processed first'.format(eventDate.date(),
+            (ifgs['priority']>routinePriority).sum(), len(ifgs)))
 #
+#load the whole frame state at once for the checks below
+state = FrameState(polyid)
+
 #for all rslcs and slcs that already exist in current, make them set 'done'
-rslcids = get_all_rslcs(polyid)
-slcids = get_all_slcs(polyid)
-
-existing_rslcids = []
-if rslcids.rslc_id.count():
-    for acq in existing_acq:
-        if dt.datetime.strptime(acq,'%Y%m%d').date() in rslcids.acq_date.dt.date.tolist():
-            rslcID=int(rslcids[rslcids.acq_date == dt.datetime.strptime(acq,'%Y%m%d')].rslc_id)
-            set_rslc_status(rslcID,0)
-            existing_rslcids.append(rslcID)
-            slcID=int(slcids[slcids.acq_date == dt.datetime.strptime(acq,'%Y%m%d')].slc_id)
-            set_slc_status(slcID,0)
+#(matched in bulk against the frame state, statuses are set all at once below)
+existing_rslcids = state.ids_on_dates('rslc',existing_acq)
+existing_slcids = state.ids_on_dates('slc',existing_acq)
 
 #avoid regenerating existing SLC files
 existing_slcs = fnmatch.filter(os.listdir(cacheDir+'/'+frame+'/SLC'), '20??????')
-if slcids.slc_id.count():
-    for acq in existing_slcs:
-        if dt.datetime.strptime(acq,'%Y%m%d').date() in slcids.acq_date.dt.date.tolist():
-            slcID=int(slcids[slcids.acq_date == dt.datetime.strptime(acq,'%Y%m%d')].slc_id)
-            set_slc_status(slcID,0)
-
-#reingesting the master here
-acq_imgs_with_m = pd.concat([acq_imgs, mstrline], ignore_index=True)
-ifgs = create_ifgs(polyid,acq_imgs_with_m)
-unws = create_unws(polyid,acq_imgs_with_m)
+existing_slcids = np.union1d(existing_slcids,state.ids_on_dates('slc',existing_slcs))
 
 print('Getting existing interferograms from LiCS database')
 try:
@@ -234,33 +284,55 @@ except:
 
 
 existing_ifgs = fnmatch.filter(os.listdir(cacheDir+'/'+frame+'/IFG'), '20??????_20??????') # old way.. ok
-ifgids = get_all_ifgs(polyid)
-unwids = get_all_unws(polyid)
-for ifg in existing_ifgs:
-    rslcA = ifg.split('_')[0]
-    rslcB = ifg.split('_')[1]
-    i = ifgids.loc[(ifgids['acq_date_1'].dt.date == dt.datetime.strptime(rslcA,'%Y%m%d').date())\
-            & (ifgids['acq_date_2'].dt.date == dt.datetime.strptime(rslcB,'%Y%m%d').date()) ]
-    if not i.empty:
-        ifgID = int(i.ifg_id)
-        set_ifg_status(ifgID,0)
-        # if os.path.exists(os.path.join(cacheDir,frame,'GEOC',ifg,ifg+'.geo.unw.tif')):  # not relevant in 2026
-        u = unwids.loc[(unwids['acq_date_1'].dt.date == dt.datetime.strptime(rslcA,'%Y%m%d').date())\
-            & (unwids['acq_date_2'].dt.date == dt.datetime.strptime(rslcB,'%Y%m%d').date()) ]
-        unwID = int(u.unw_id)
-        set_unw_status(unwID,0)
-
-batch_link_slcs_to_new_jobs(polyid,user,slcs,batchN)
+existing_ifgids = state.ids_on_pairs('ifg',existing_ifgs)
+# if os.path.exists(os.path.join(cacheDir,frame,'GEOC',ifg,ifg+'.geo.unw.tif')):  # not relevant in 2026
+#(unws are set done for the existing ifgs)
+existing_unwids = state.ids_on_pairs('unw',existing_ifgs)
+
+if incremental:
+    #the already built items keep their status (e.g. slcs removed after coreg)
+    def unbuilt(kind,ids):
+        items = getattr(state,kind+'s')
+        return items[items[kind+'_id'].isin(ids) & (items[kind+'_status']!=0)][kind+'_id'].values
+    existing_slcids = unbuilt('slc',existing_slcids)
+    existing_rslcids = unbuilt('rslc',existing_rslcids)
+    existing_ifgids = unbuilt('ifg',existing_ifgids)
+    existing_unwids = unbuilt('unw',existing_unwids)
+
+counts = set_items_status({'slc':existing_slcids,'rslc':existing_rslcids,
+                           'ifg':existing_ifgids,'unw':existing_unwids},0)
+print('set as existing: {slc} slcs, {rslc} rslcs, {ifg} ifgs, {unw} unws'.format(**counts))
+
+if incremental:
+    #only the items still to be processed go to the new jobs
+    def to_process(kind,ids,doneIds):
+        items = getattr(state,kind+'s')
+        built = items[items[kind+'_status'].isin([0,-6])][kind+'_id']
+        return ids[~ids[kind+'_id'].isin(built) & ~ids[kind+'_id'].isin(doneIds)].reset_index(drop=True)
+    slcs = to_process('slc',slcs,existing_slcids)
+    ifgs = to_process('ifg',ifgs,existing_ifgids)
+    unws = to_process('unw',unws,existing_unwids)
+
+batch_link_slcs_to_new_jobs(polyid,user,slcs,batchN,capHours)
 #the rslcs job linking should be improved, but it is ok this way..
 #ok, first sort rslcs w.r.t. master:
 aa = acq_imgs.join(rslcs.set_index('img_id'), on='img_id')
-for exrs in existing_rslcids:
-    aa = aa[aa['rslc_id'] != exrs]
+aa = aa[~aa['rslc_id'].isin(existing_rslcids)]
 #.join(
 #            rslcids.rename(columns={"acq_date": "rslc_date"}).set_index('rslc_id'), on='rslc_id')
 #            rslcids.set_index('img_id'), on='img_id')
-rslcs = aa[['rslc_id']].reset_index(drop=True)
-batch_link_rslcs_to_new_jobs(polyid,user,rslcs,batchN)
-batch_link_ifgs_to_new_jobs(polyid,user,ifgs,batchN)
-batch_link_unws_to_new_jobs(polyid,user,unws,batchN)
+rslcs = aa[['rslc_id','acq_date']].reset_index(drop=True)
+#estimated coreg runtimes for the job packing - epochs with LUT are only re-coregistered
+has_lut = pd.to_datetime(aa['acq_date']).dt.strftime('%Y%m%d').isin(existing_luts).values
+rslcs['cost'] = estimate_costs('coreg', len(rslcs), lut=has_lut, itemHours=itemHours['coreg'])
+if eventDate:
+    rslcs['priority'] = epoch_priorities(rslcs['acq_date'], *pairDates, eventDate)
+if incremental:
+    rslcs = to_process('rslc',rslcs,existing_rslcids)
+#coreg jobs take windows of consecutive epochs and the ifgs/unws are grouped
+#by the same windows, so each mk_ifg job waits only for one or two coreg jobs
+#(see get_job_dependencies) instead of all of them
+coregWindows = batch_link_rslcs_to_new_jobs(polyid,user,rslcs,batchN,byDate=True,capHours=capHours)
+batch_link_ifgs_to_new_jobs(polyid,user,ifgs,batchN,windows=coregWindows,capHours=capHours)
+batch_link_unws_to_new_jobs(polyid,user,unws,batchN,windows=coregWindows,capHours=capHours)
 
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# runs the date based lookups of batchDBLib for a frame, EXPLAINs every issued
+# select and reports full table scans over the big tables (these should be
+# gone after sql/migration_002_date_indexes.sql)
+# usage: dbExplainCheck.py FRAME [YYYYMMDD]
+################################################################################
+#imports
+################################################################################
+import batchDBLib as lq
+from sqlalchemy import event
+import datetime as dt
+import sys
+
+#tables that must not be scanned in full
+checkedTables = ['files','files2bursts','polygs2bursts','acq_img']
+
+################################################################################
+#collect the statements
+################################################################################
+def capture_statements(frame,date):
+    statements = []
+    def collect(conn,cursor,statement,parameters,context,executemany):
+        if statement.lstrip().upper().startswith('SELECT'):
+            statements.append((statement,parameters))
+    event.listen(lq.engine,'before_cursor_execute',collect)
+    polyid = lq.get_polyid(frame)
+    checks = [('get_acq_dates',lambda: lq.get_acq_dates(polyid)),
+              ('get_frame_files_date',lambda: lq.get_frame_files_date(frame,date)),
+              ('get_frame_files_period',lambda: lq.get_frame_files_period(frame,date-dt.timedelta(days=30),date)),
+              ('get_frame_bursts_on_date',lambda: lq.get_frame_bursts_on_date(frame,date)),
+              ('get_frame_files_dates',lambda: lq.get_frame_files_dates(frame,[date-dt.timedelta(days=12),date])),
+              ('get_frame_bursts_on_dates',lambda: lq.get_frame_bursts_on_dates(frame,[date-dt.timedelta(days=12),date])),
+              ('get_burst_no',lambda: lq.get_burst_no(frame,date)),
+              ('get_unreq_slc_on_date',lambda: lq.get_unreq_slc_on_date(polyid,date))]
+    out = []
+    for name,check in checks:
+        del statements[:]
+        try:
+            check()
+        except Exception as e:
+            #e.g. empty results in functions building dataframes
+            print('warning, {} raised {}'.format(name,e))
+        out += [(name,st,par) for st,par in statements]
+    event.remove(lq.engine,'before_cursor_execute',collect)
+    return out
+
+################################################################################
+#Main
+################################################################################
+def main(argv):
+    frame = argv[1]
+    if len(argv) > 2:
+        date = dt.datetime.strptime(argv[2],'%Y%m%d')
+    else:
+        date = lq.get_master(frame)
+        if not date:
+            print('the frame has no reference epoch in the batch db, please give a date')
+            return 1
+        date = dt.datetime.combine(lq.to_day(date),dt.time())
+    scans = 0
+    with lq.engine.connect() as conn:
+        for name,statement,parameters in capture_statements(frame,date):
+            res = conn.exec_driver_sql('EXPLAIN '+statement,parameters)
+            cols = list(res.keys())
+            for row in res.fetchall():
+                row = dict(zip(cols,row))
+                fullScan = row['type'] == 'ALL' and row['table'] in checkedTables
+                scans += fullScan
+                print('{:26s} {:14s} {:7s} {:30s} rows={}{}'.format(name,str(row['table']),
+                    str(row['type']),str(row['key']),row['rows'],'  <- FULL SCAN' if fullScan else ''))
+    if scans:
+        print('{} full scans found - is sql/migration_002_date_indexes.sql applied?'.format(scans))
+        return 1
+    print('no full scans of {}'.format(', '.join(checkedTables)))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+# compares the db engine modes (see batchDBLib.make_engine) on a typical
+# read pattern of a stage script - number of opened connections and latency
+# usage: dbPoolBench.py FRAME [number_of_rounds]
+################################################################################
+#imports
+################################################################################
+import batchDBLib as lq
+from sqlalchemy import event
+import numpy as np
+import sys
+import time
+
+################################################################################
+#one round ~ what a stage script asks per item
+################################################################################
+def do_round(frame,date):
+    lq.get_polyid.uncached(frame)
+    lq.get_master.uncached(frame)
+    lq.get_bursts_in_frame(frame)
+    lq.get_frame_files_date(frame,date)
+    lq.get_frame_bursts_on_date(frame,date)
+
+def bench(pooling,frame,date,rounds):
+    lq.engine = lq.make_engine(pooling)
+    connects = []
+    event.listen(lq.engine,'connect',lambda dbapiConn,connRecord: connects.append(1))
+    latencies = []
+    start = time.time()
+    for i in range(rounds):
+        t = time.time()
+        do_round(frame,date)
+        latencies.append(time.time()-t)
+    total = time.time()-start
+    lq.engine.dispose()
+    latencies = np.array(latencies)*1000
+    return {'pooling':pooling,
+            'connections':len(connects),
+            'total_s':round(total,2),
+            'round_ms_mean':round(latencies.mean(),1),
+            'round_ms_median':round(np.median(latencies),1),
+            'round_ms_p95':round(np.percentile(latencies,95),1)}
+
+################################################################################
+#Main
+################################################################################
+def main(argv):
+    frame = argv[1]
+    rounds = 20
+    if len(argv) > 2:
+        rounds = int(argv[2])
+    date = lq.get_master(frame)
+    if not date:
+        print('the frame has no reference epoch in the batch db - is it active?')
+        return 1
+    print('running {} rounds of 5 queries for frame {}'.format(rounds,frame))
+    for pooling in ['null','queue']:
+        res = bench(pooling,frame,date,rounds)
+        print('{pooling:>6}: {connections:5d} connections, total {total_s} s, per round '\
+              'mean {round_ms_mean} ms, median {round_ms_median} ms, p95 {round_ms_p95} ms'.format(**res))
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
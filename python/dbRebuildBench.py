@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+# compares rebuilding the frame tables (acq_img, slc, rslc, ifg, unw) the old way
+# (add_acq_images, set_master and create_* - each with its own transactions and
+# readbacks) with rebuild_frame_tables (one transaction, multi-row inserts)
+# WARNING: both rebuild the frame tables - all the statuses and job links of the
+# frame are reset, so run it only on a frame that is not being processed
+# usage: dbRebuildBench.py FRAME MASTERDATE(YYYYMMDD) --yes
+################################################################################
+#imports
+################################################################################
+import batchDBLib as lq
+from sqlalchemy import event
+import datetime as dt
+import pandas as pd
+import sys
+import time
+
+################################################################################
+#the two ways
+################################################################################
+def rebuild_old(polyid,mstrDate):
+    acq_imgs = lq.add_acq_images(polyid,masterdate=mstrDate.date())
+    lq.set_master(polyid,mstrDate)
+    slcImgs = acq_imgs[acq_imgs['acq_date']!=mstrDate]
+    lq.create_slcs(polyid,slcImgs)
+    lq.create_rslcs(polyid,slcImgs)
+    lq.create_ifgs(polyid,acq_imgs)
+    lq.create_unws(polyid,acq_imgs)
+
+def rebuild_new(polyid,mstrDate):
+    acqDates = lq.get_frame_acq_dates(polyid,masterdate=mstrDate.date())['acq_date']
+    slcDates = [d for d in acqDates if d!=mstrDate.date()]
+    lq.rebuild_frame_tables(polyid,acqDates,lq.sequential_pairs(acqDates),
+                            slcDates=slcDates,masterdate=mstrDate)
+
+def bench(func,polyid,mstrDate):
+    counts = {'statements':0,'transactions':0}
+    def on_statement(*args):
+        counts['statements'] += 1
+    def on_commit(conn):
+        counts['transactions'] += 1
+    event.listen(lq.engine,'before_cursor_execute',on_statement)
+    event.listen(lq.engine,'commit',on_commit)
+    start = time.time()
+    try:
+        func(polyid,mstrDate)
+    finally:
+        event.remove(lq.engine,'before_cursor_execute',on_statement)
+        event.remove(lq.engine,'commit',on_commit)
+    counts['total_s'] = round(time.time()-start,2)
+    return counts
+
+################################################################################
+#Main
+################################################################################
+def main(argv):
+    if len(argv) < 4 or argv[3] != '--yes':
+        print('usage: dbRebuildBench.py FRAME MASTERDATE(YYYYMMDD) --yes')
+        print('(this resets all the statuses and job links of the frame)')
+        return 1
+    frame = argv[1]
+    mstrDate = dt.datetime.strptime(argv[2],'%Y%m%d')
+    polyid = lq.get_polyid(frame)
+    if not polyid:
+        print('frame {} is not in the batch db'.format(frame))
+        return 1
+    for name,func in [('old',rebuild_old),('new',rebuild_new)]:
+        res = bench(func,polyid,mstrDate)
+        print('{0:>4}: {statements:6d} statements, {transactions:4d} transactions, '\
+              'total {total_s} s'.format(name,**res))
+    state = lq.FrameState(polyid)
+    print('rebuilt {} epochs, {} ifgs'.format(len(state.acq),len(state.ifgs)))
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
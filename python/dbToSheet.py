@@ -130,7 +130,8 @@ else:
 ################################################################################
 # Get Frame Table
 ################################################################################
-frameQryFile = open(sqlPath+'/frameQry.sql', 'r')
+#(from the frame_progress summary - frameQry.sql groups the whole item tables)
+frameQryFile = open(sqlPath+'/frameProgressQry.sql', 'r')
 if frameQryFile:
     frameQry = frameQryFile.read()
     frameDatFrm = pd.read_sql_query(frameQry,engine)
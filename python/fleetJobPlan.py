@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# submits the pending jobs of many frames as a few large job arrays per stage
+# (see batchFleetLib), instead of the 4-6 small arrays of every frame. the
+# frames must be prepared before (licsar_make_frame.sh -n: jobs in the batch
+# db and the frame dirs in $BATCH_CACHE_DIR) and not submitted otherwise. the
+# arrays of a stage wait for (afterany) the arrays of the stage before. arrays
+# of high priority jobs (createFrameCache.py --event) are submitted first and
+# wait only for the high priority arrays before - their items need only items
+# of at least their priority
+# writes fleet_STAGE_MEM.tasks/.sh and LOGS/ to the current dir
+# usage: fleetJobPlan.py [FRAMELIST] [--stages S1,S2..] [--max-tasks N] [--dry-run|--local]
+#   FRAMELIST ..... file with the frames, one per line (e.g. alive/weekly.txt),
+#                   otherwise all active frames
+#   --stages ...... stages to submit (default mk_image,coreg,mk_ifg,unwrap)
+#   --max-tasks N . tasks of all the arrays (default MaxTasks of the [Fleet]
+#                   config section less the tasks the user has queued)
+#   --dry-run ..... only print the plan and the sbatch commands
+#   --local ....... run the tasks here, one after the other
+# prints 'STAGE ARRAYID1:ARRAYID2..' per stage
+################################################################################
+#imports
+################################################################################
+import batchDBLib as lq
+from batchFleetLib import fleet_limits,queued_tasks,plan_fleet,write_fleet_array,stageScripts
+from batchPlanLib import SlurmBackend,DryRunBackend,LocalBackend
+import sys
+import os
+
+################################################################################
+#Main
+################################################################################
+def option(argv,name,default=None):
+    if name in argv:
+        i = argv.index(name)
+        value = argv[i+1]
+        del argv[i:i+2]
+        return value
+    return default
+
+def main(argv):
+    argv = list(argv)
+    stages = option(argv,'--stages',','.join(stageScripts)).split(',')
+    maxTasks = option(argv,'--max-tasks')
+    dryRun = '--dry-run' in argv
+    args = [a for a in argv[1:] if not a.startswith('--')]
+    if len(args) > 1 or any(s not in stageScripts for s in stages):
+        print('usage: fleetJobPlan.py [FRAMELIST] [--stages S1,S2..] [--max-tasks N] [--dry-run|--local]')
+        return 1
+    frames = None
+    if args:
+        with open(args[0]) as f:
+            frames = [l.split()[0] for l in f if l.strip()]
+    limits = fleet_limits()
+    if maxTasks:
+        budget = int(maxTasks)
+    else:
+        budget = limits['maxTasks']-queued_tasks()
+    if budget < len(stages):
+        print('no tasks can be submitted (limit {}, queued {})'.format(limits['maxTasks'],
+                limits['maxTasks']-budget))
+        return 1
+    stageJobs = {}
+    predictors = {}
+    for stage in stages:
+        stageJobs[stage] = lq.get_fleet_jobs(stage,frames)
+        predictors[stage] = lq.get_resource_predictor(stage)
+        print('{}: {} jobs of {} frames'.format(stage,len(stageJobs[stage]),
+                stageJobs[stage]['frame'].nunique()))
+    arrays = plan_fleet(stageJobs,predictors,limits,budget)
+    nTasks = sum(len(a.tasks) for a in arrays)
+    if nTasks > budget:
+        print('warning, the jobs need {} tasks to fit the walltime, more than {}'.format(nTasks,budget))
+    if dryRun:
+        backend = DryRunBackend(limits['maxRunning'])
+    elif '--local' in argv:
+        backend = LocalBackend()
+    else:
+        backend = SlurmBackend(limits['maxRunning'])
+    os.makedirs('LOGS',exist_ok=True)
+    prevIds = []
+    prevPriorityIds = []
+    for stage in stages:
+        arrayIds = []
+        priorityIds = []
+        for array in [a for a in arrays if a.stage == stage]:
+            print('{}: {} tasks, {} MB, {}:59 h'.format(array.name,len(array.tasks),array.mem,array.hours))
+            script = write_fleet_array(array,limits)
+            waitFor = prevPriorityIds if array.priority else prevIds
+            dependency = 'afterany:'+':'.join(waitFor) if waitFor else None
+            arrayId = backend.submit(script,range(1,len(array.tasks)+1),dependency,array.priority)
+            arrayIds.append(arrayId)
+            if array.priority:
+                priorityIds.append(arrayId)
+        if arrayIds:
+            prevIds = arrayIds
+            prevPriorityIds = priorityIds
+        print('{} {}'.format(stage,':'.join(arrayIds)))
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+# submits the job arrays of the frame steps with per task dependencies - each
+# task waits only for the tasks of the previous step processing the items it
+# needs (see batchPlanLib, batchDBLib.get_job_dependencies), the tasks of high
+# priority jobs first in arrays of their own. run in the frame batch dir,
+# after licsar_make_frame.sh prepared the $step.nowait.sh/.lotus2.sh
+# usage: frameJobPlan.py FRAME STEP [STEP ..] [--dry-run|--local] [--afterany]
+#   STEP ........ e.g. framebatch_02_coreg, in the processing order. the tasks of
+#                 a preceding step submitted before are read from its .plan file
+#   --dry-run ... only print the sbatch commands
+#   --local ..... run the tasks here, one after the other (logs in LOGS/local_*)
+#   --afterany .. wait for the end of the needed tasks, not for their success
+# prints 'STEP ARRAYID1:ARRAYID2..' per step (for the -d afterany of later jobs)
+################################################################################
+#imports
+################################################################################
+import batchDBLib as lq
+from batchPlanLib import stepOrder,stepTypes,previous_step,read_plan,write_plan,submit_step,\
+                    SlurmBackend,DryRunBackend,LocalBackend,PartialSubmission
+import sys
+import os
+
+################################################################################
+#Main
+################################################################################
+def main(argv):
+    opts = [a for a in argv[1:] if a.startswith('--')]
+    args = [a for a in argv[1:] if not a.startswith('--')]
+    if len(args) < 2 or any(s not in stepOrder for s in args[1:]):
+        print('usage: frameJobPlan.py FRAME STEP [STEP ..] [--dry-run|--local] [--afterany]')
+        return 1
+    frame,steps = args[0],args[1:]
+    polyid = lq.get_polyid(frame)
+    if not polyid:
+        print('frame {} is not in the batch db'.format(frame))
+        return 1
+    if '--dry-run' in opts:
+        backend = DryRunBackend()
+    elif '--local' in opts:
+        backend = LocalBackend()
+    else:
+        backend = SlurmBackend()
+    afterany = '--afterany' in opts
+    submitted = {}
+    for step in steps:
+        prevStep = previous_step(step)
+        if prevStep in submitted:
+            prevTasks = submitted[prevStep]
+        else:
+            prevTasks = read_plan(prevStep+'.plan') if prevStep else {}
+        deps = lq.get_job_dependencies(polyid,stepTypes[step],os.environ.get('USER')) if prevStep else {}
+        priorities = lq.get_job_priorities(polyid,stepTypes[step])
+        try:
+            tasks,arrayIds = submit_step(backend,step,deps,prevTasks,afterany,priorities)
+        except PartialSubmission as e:
+            #(printed and kept, so that the caller does not submit the step again)
+            print('ERROR, {}'.format(e))
+            write_plan(step+'.plan',e.tasks)
+            print('{} {}'.format(step,':'.join(e.arrayIds)))
+            return 1
+        submitted[step] = tasks
+        if not isinstance(backend,DryRunBackend):
+            write_plan(step+'.plan',tasks)
+        print('{} {}'.format(step,':'.join(arrayIds)))
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
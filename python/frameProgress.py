@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+# frame progress report from the frame_progress summary table
+# usage: frameProgress.py [FRAME] ............ coverage of the active frames (or the FRAME)
+#        frameProgress.py --reconcile [FRAME] recompute the summary from the item tables
+#                                             (all frames, or the FRAME) and report the drift
+################################################################################
+#imports
+################################################################################
+import batchDBLib as lq
+from sqlalchemy import select
+import pandas as pd
+import sys
+
+################################################################################
+#reconcile
+################################################################################
+def read_summary(conn,polyids):
+    progSel = select(lq.frame_progress.c.polyid,lq.frame_progress.c.stage,
+            lq.frame_progress.c.status,lq.frame_progress.c.n)
+    if polyids is not None:
+        progSel = progSel.where(lq.frame_progress.c.polyid.in_(polyids))
+    return {tuple(r[:3]):r[3] for r in conn.execute(progSel)}
+
+def reconcile(frame=None):
+    #the table may have been created after the schema was cached
+    lq.load_schema(refresh=True)
+    if not lq.has_frame_progress():
+        print('there is no frame_progress table - see sql/migration_003_frame_progress.sql')
+        return 1
+    polyids = None
+    if frame:
+        polyids = [lq.get_polyid(frame)]
+    with lq.engine.begin() as conn:
+        before = read_summary(conn,polyids)
+        rows = lq.recount_frame_progress(conn,polyids)
+        after = read_summary(conn,polyids)
+    drift = [k for k in set(before)|set(after) if before.get(k,0)!=after.get(k,0)]
+    print('recomputed {} summary rows, {} of them differed'.format(rows,len(drift)))
+    for polyid,stage,status in sorted(drift)[:20]:
+        print('  polyid {} {} status {}: {} -> {}'.format(polyid,stage,status,
+            before.get((polyid,stage,status),0),after.get((polyid,stage,status),0)))
+
+################################################################################
+#Main
+################################################################################
+def main(argv):
+    if len(argv) > 1 and argv[1] == '--reconcile':
+        return reconcile(argv[2] if len(argv) > 2 else None)
+    frame = argv[1] if len(argv) > 1 else None
+    if not lq.has_frame_progress():
+        print('there is no frame_progress table - see sql/migration_003_frame_progress.sql')
+        return 1
+    report = lq.get_frame_progress(frame,activeOnly=not frame)
+    if report.empty:
+        print('no frames found')
+        return 1
+    if frame:
+        for stage,counts in sorted(lq.get_frame_status_counts(frame).items()):
+            print('{:>5}: '.format(stage)+', '.join('{}: {}'.format(st,n) for st,n in sorted(counts.items())))
+    with pd.option_context('display.max_rows',None,'display.width',200):
+        print(report)
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
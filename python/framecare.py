@@ -1104,6 +1104,27 @@ def make_bperp_file(frame, bperp_file, asfonly = False, donotstore = False):
         return bpd
 
 
+metadataCache = {}
+
+def grep_metadata(key, metafile):
+    """Returns grep1line(key, metafile), memoised until the metadata file changes
+    (by its mtime/size) or until metadataCache is cleared (e.g. by rename_frame_main)
+
+    Args:
+        key (str): key to search for, e.g. 'master'
+        metafile (str): path to metadata.txt of the frame
+    """
+    st = os.stat(metafile)
+    stamp = (st.st_mtime_ns, st.st_size)
+    cached = metadataCache.get(metafile)
+    if not cached or cached[0] != stamp:
+        cached = (stamp, {})
+        metadataCache[metafile] = cached
+    if key not in cached[1]:
+        cached[1][key] = misc.grep1line(key, metafile)
+    return cached[1][key]
+
+
 def get_master(frame, asfilenames = False, asdate = False, asdatetime = False, metafile = None):
     """Gets reference epoch of given frame, returns in several ways
 
@@ -1120,7 +1141,7 @@ def get_master(frame, asfilenames = False, asdate = False, asdatetime = False, m
     if not os.path.exists(metafile):
         print('frame {} is not initialised'.format(frame))
         return False
-    master = misc.grep1line('master',metafile)
+    master = grep_metadata('master',metafile)
     if not master:
         print('error parsing information from metadata.txt')
         return False
@@ -1152,7 +1173,7 @@ def get_master(frame, asfilenames = False, asdate = False, asdatetime = False, m
         masterdate = masterdate.replace(tzinfo=dt.timezone.utc)
     if asdatetime:
         a = masterdate
-        centime = misc.grep1line('center_time',metafile)
+        centime = grep_metadata('center_time',metafile)
         if not centime:
             print('error parsing center_time information from metadata.txt')
             return False
@@ -1377,6 +1398,7 @@ def rename_frame_main(framename,newname, reportcsv = '/gws/ssde/j25a/nceo_geohaz
                 os.rename(oldfile,newfile)
     if os.path.exists(procpath):
         os.rename(procpath, newprocpath)
+    metadataCache.clear()
     if os.path.exists(os.path.join(newprocpath,framename+'-poly.txt')):
         os.remove(os.path.join(newprocpath,framename+'-poly.txt'))
     print('frame {0} renamed to {1}'.format(framename,newname))
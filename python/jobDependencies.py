@@ -0,0 +1,37 @@
+#!/usr/bin/env python
+# jobs of the previous processing step that the jobs of a frame wait for
+# (see batchDBLib.get_job_dependencies - only the unbuilt items and the jobs
+# of $USER count, as in the step lists of licsar_make_frame.sh)
+# usage: jobDependencies.py FRAME [STEP]
+#   STEP ... job type (coreg, mk_ifg, unwrap) or the framebatch step name
+#            (e.g. framebatch_03_mk_ifg), all the steps if not given
+# prints 'JOBID PREVJOBID1 PREVJOBID2 ..' per job that has to wait
+################################################################################
+#imports
+################################################################################
+import batchDBLib as lq
+from batchPlanLib import stepTypes
+import sys
+import os
+
+################################################################################
+#Main
+################################################################################
+def main(argv):
+    if len(argv) < 2:
+        print('usage: jobDependencies.py FRAME [STEP]')
+        return 1
+    frame = argv[1]
+    jobType = stepTypes.get(argv[2],argv[2]) if len(argv) > 2 else None
+    if jobType and jobType not in lq.jobTypes:
+        print('unknown step '+argv[2])
+        return 1
+    polyid = lq.get_polyid(frame)
+    if not polyid:
+        print('frame {} is not in the batch db'.format(frame))
+        return 1
+    for jobId,preJobIds in lq.get_job_dependencies(polyid,jobType,os.environ.get('USER')).items():
+        print(' '.join(str(j) for j in [jobId]+preJobIds))
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+# prints the interferogram pairs (YYYYMMDD_YYYYMMDD) of the network built from
+# the given epochs (see batchNetworkLib), e.g. for framebatch_gapfill.sh
+################################################################################
+#imports
+################################################################################
+from batchNetworkLib import network_config, build_network, pairs_to_strings
+import argparse
+import sys
+
+################################################################################
+#Main
+################################################################################
+def parse(argv):
+    parser = argparse.ArgumentParser(description='Builds the ifg network from the epochs in EPOCHS_FILE '\
+            '(one YYYYMMDD per line, - for stdin). Parameters not given here are taken from local_config.py.')
+    parser.add_argument('epochs', help='file with the epochs')
+    parser.add_argument('-c', dest='localconfig', default='local_config.py', help='local_config.py of the frame')
+    parser.add_argument('-n', dest='nearest', type=int, help='connections to the following epochs')
+    parser.add_argument('-t', dest='maxBtemp', type=int, help='max temporal baseline [days] of the nearest connections')
+    parser.add_argument('-p', dest='maxBperp', type=float, help='max perpendicular baseline [m] (needs -b)')
+    parser.add_argument('-b', dest='bperp', help='file with YYYYMMDD bperp lines')
+    parser.add_argument('-g', dest='gapBridge', type=int, help='connect epochs around gaps longer than this [days]')
+    parser.add_argument('-s', dest='seasonal', choices=['none','tienshan','add36m'], help='seasonal connections')
+    parser.add_argument('-V', dest='volcsSouth', action='store_true', default=None, help='S American volcs connections')
+    parser.add_argument('-m', dest='master', help='reference epoch (no add36m connections)')
+    return parser.parse_args(argv[1:])
+
+def read_epochs(fileName):
+    f = sys.stdin if fileName == '-' else open(fileName)
+    epochs = [l.split()[0] for l in f if l.strip()]
+    if f is not sys.stdin:
+        f.close()
+    return epochs
+
+def main(argv):
+    inps = parse(argv)
+    overrides = {k:v for k,v in vars(inps).items()
+            if k in ['nearest','maxBtemp','maxBperp','gapBridge','seasonal','volcsSouth'] and v is not None}
+    if overrides.get('seasonal') == 'none':
+        overrides['seasonal'] = None
+    config = network_config(inps.localconfig,**overrides)
+    epochs = read_epochs(inps.epochs)
+    bperp = None
+    if inps.bperp:
+        bperpOfEpoch = dict((l.split()[0],float(l.split()[1])) for l in open(inps.bperp) if l.strip())
+        bperp = [bperpOfEpoch.get(e,float('nan')) for e in epochs]
+    try:
+        days,pairs = build_network(epochs,config,bperp=bperp,master=inps.master)
+    except ValueError as e:
+        print('error - {} (-b)'.format(e),file=sys.stderr)
+        return 1
+    for pair in pairs_to_strings(days,pairs):
+        print(pair)
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,43 @@
+#!/usr/bin/env python
+# expected walltime and memory of the jobs of a frame processing step, from the
+# item_timing history (see batchTimingLib.ResourcePredictor)
+# usage: predictResources.py FRAME STEP LISTFILE
+#   STEP ..... job type (mk_image, coreg, mk_ifg, unwrap) or the framebatch step
+#              name (e.g. framebatch_02_coreg)
+#   LISTFILE . items of the jobs, one per line with the job id in the first column
+#              (the $step.list of licsar_make_frame.sh)
+# prints 'JOBID HOURS MEMORY_MB' per job (HOURS rounded down, as used in -W HOURS:59)
+################################################################################
+#imports
+################################################################################
+import batchDBLib as lq
+from batchPlanLib import stepTypes
+from collections import Counter
+import sys
+
+################################################################################
+#Main
+################################################################################
+def main(argv):
+    if len(argv) < 4:
+        print('usage: predictResources.py FRAME STEP LISTFILE')
+        return 1
+    frame,step,listFile = argv[1:4]
+    jobType = stepTypes.get(step,step)
+    if jobType not in lq.jobTypes:
+        print('unknown step '+step)
+        return 1
+    polyid = lq.get_polyid(frame)
+    if not polyid:
+        print('frame {} is not in the batch db'.format(frame))
+        return 1
+    with open(listFile) as f:
+        itemCount = Counter(l.split()[0] for l in f if l.strip())
+    nBursts = lq.get_frame_burst_count(polyid)
+    predictor = lq.get_resource_predictor(jobType,nBursts)
+    for jobId,nItems in sorted(itemCount.items(),key=lambda x: int(x[0])):
+        hours,mem = predictor.job(jobType,nItems,nBursts)
+        print('{} {} {}'.format(jobId,int(hours),mem))
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+# raises an OperationalError, an OSError and a ValueError inside an item, set
+# up as in the ab_LiCSAR_* scripts (ItemTimer around the env of the item, in a
+# temporary frame cache), and checks that the failures recorded to item_timing
+# get three different classes (see batchRetryLib) - i.e. that the exceptions
+# swallowed by the env still reach the timer. FRAME must be initialised (its
+# master epoch is read from the metadata), the batch db is not touched
+# usage: retryClassCheck.py FRAME
+################################################################################
+#imports
+################################################################################
+from batchEnvLib import LicsEnv
+from batchTimingLib import ItemTimer
+import batchRetryLib as rl
+from framecare import get_master
+from sqlalchemy.exc import OperationalError
+from collections import namedtuple
+import tempfile
+import sys
+import os
+
+#the job context as used by ItemTimer
+Context = namedtuple('Context',['polyid','job_id','bursts'])
+
+class TimingCollector():
+    #status writer keeping the item timings
+    def __init__(self):
+        self.timings = []
+    def set_item_timing(self,record):
+        self.timings.append(dict(record))
+    def flush(self):
+        pass
+
+exceptions = [OperationalError('SELECT 1',{},Exception('Lost connection to MySQL server')),
+              OSError(116,'Stale file handle'),
+              ValueError('could not convert string to float')]
+
+################################################################################
+#Main
+################################################################################
+def main(argv):
+    if len(argv) != 2:
+        print('usage: retryClassCheck.py FRAME')
+        return 1
+    frame = argv[1]
+    master = get_master(frame)
+    if not master:
+        return 1
+    writer = TimingCollector()
+    context = Context(0,0,[])
+    with tempfile.TemporaryDirectory() as tmp:
+        cacheDir = os.path.join(tmp,'cache')
+        for sub in ['SLC/'+master,'RSLC']:
+            os.makedirs(os.path.join(cacheDir,frame,sub))
+        for itemId,exc in enumerate(exceptions):
+            with ItemTimer(writer,context,'coreg',itemId) as timer, \
+                    LicsEnv(itemId,frame,cacheDir,tmp) as env:
+                env.timer = timer
+                env.statusBuffer = writer
+                raise exc
+    classes = []
+    for exc,record in zip(exceptions,writer.timings):
+        failure,retryable = rl.classify_failure(rl.EXCEPTION,record.get('error'))
+        print('{}: {} ({})'.format(type(exc).__name__,failure,record.get('error')))
+        classes.append(failure)
+    if len(writer.timings) != len(exceptions) or len(set(classes)) != len(exceptions):
+        print('FAILED - the failures are not told apart')
+        return 1
+    print('OK')
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+# retries the failed items of the frames (see batchRetryLib): the failures are
+# classified and kept in the retry history (item_retry, needs
+# sql/migration_007_item_retry.sql), the retryable items whose backoff has
+# passed are requeued to small follow-up jobs and submitted as job arrays of
+# their own (as fleetJobPlan.py does, the arrays of a stage wait for those of
+# the stage before). meant to run regularly, e.g. from cron - the frame tables
+# stay as they are. writes retry_STAGE_MEM.tasks/.sh and LOGS/ to the current dir
+# usage: retryFailed.py [FRAMELIST] [--stages S1,S2..] [--max-attempts N] [--dry-run|--local]
+#   FRAMELIST ........ file with the frames, one per line, otherwise all active frames
+#   --stages ......... stages to retry (default mk_image,coreg,mk_ifg,unwrap)
+#   --max-attempts N . failures of an item after which it is not retried (default 3)
+#   --dry-run ........ only print the failures and what would be retried
+#   --local .......... run the follow-up jobs here, one after the other
+# prints 'STAGE ARRAYID1:ARRAYID2..' per stage
+################################################################################
+#imports
+################################################################################
+import batchDBLib as lq
+import batchRetryLib as rl
+from batchFleetLib import fleet_limits,plan_fleet_stage,write_fleet_array,stageScripts
+from batchPlanLib import SlurmBackend,LocalBackend
+import sys
+import os
+
+################################################################################
+#Main
+################################################################################
+def option(argv,name,default=None):
+    if name in argv:
+        i = argv.index(name)
+        value = argv[i+1]
+        del argv[i:i+2]
+        return value
+    return default
+
+def main(argv):
+    argv = list(argv)
+    stages = option(argv,'--stages',','.join(stageScripts)).split(',')
+    maxAttempts = int(option(argv,'--max-attempts',rl.maxAttempts))
+    dryRun = '--dry-run' in argv
+    args = [a for a in argv[1:] if not a.startswith('--')]
+    if len(args) > 1 or any(s not in stageScripts for s in stages):
+        print('usage: retryFailed.py [FRAMELIST] [--stages S1,S2..] [--max-attempts N] [--dry-run|--local]')
+        return 1
+    if not lq.has_item_retry():
+        print('the item_retry table does not exist (sql/migration_007_item_retry.sql)')
+        return 1
+    if args:
+        with open(args[0]) as f:
+            frames = [l.split()[0] for l in f if l.strip()]
+    else:
+        frames = lq.get_active_frames()
+    user = os.environ['USER']
+    stageJobs = {stage:[] for stage in stages}
+    for frame in frames:
+        polyid = lq.get_polyid(frame)
+        if not polyid:
+            print('frame {} is not in the batch db'.format(frame))
+            continue
+        for stage in stages:
+            failures = rl.classify_failures(polyid,frame,stage)
+            if failures.empty:
+                continue
+            if not dryRun:
+                failures = rl.record_failures(polyid,stage,failures)
+            due = rl.due_failures(failures,maxAttempts=maxAttempts)
+            print('{} {}: {} failed ({}), {} to retry'.format(frame,stage,len(failures),
+                    ', '.join('{} {}'.format(n,c) for c,n in failures['failure'].value_counts().items()),
+                    len(due)))
+            if dryRun or due.empty:
+                continue
+            stageJobs[stage] += rl.requeue_failures(polyid,user,stage,due)
+    if dryRun:
+        return 0
+    limits = fleet_limits()
+    if '--local' in argv:
+        backend = LocalBackend()
+    else:
+        backend = SlurmBackend(limits['maxRunning'])
+    os.makedirs('LOGS',exist_ok=True)
+    prevIds = []
+    for stage in stages:
+        arrayIds = []
+        fleetJobs = lq.get_fleet_jobs(stage,frames)
+        fleetJobs = fleetJobs[fleetJobs['job_id'].isin(stageJobs[stage])]
+        #(a task per job)
+        arrays = plan_fleet_stage(stage,fleetJobs,lq.get_resource_predictor(stage),
+                                  len(fleetJobs),limits)
+        for array in arrays:
+            array = array._replace(name=array.name.replace('fleet_','retry_',1))
+            print('{}: {} tasks, {} MB, {}:59 h'.format(array.name,len(array.tasks),array.mem,array.hours))
+            script = write_fleet_array(array,limits)
+            dependency = 'afterany:'+':'.join(prevIds) if prevIds else None
+            arrayIds.append(backend.submit(script,range(1,len(array.tasks)+1),dependency,array.priority))
+        if arrayIds:
+            prevIds = arrayIds
+        print('{} {}'.format(stage,':'.join(arrayIds)))
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+# predicts the makespan and core-hours of the processing of a frame for several
+# batchN (jobs per step, of createFrameCache.py) and caps of the job runtime,
+# by a discrete-event simulation of its jobs in the queue (see batchSimLib).
+# the epochs are those registered for the frame between the dates (run after
+# the data refill), all counted as to be processed. licsar_make_frame.sh uses
+# --pick for the batchN and --job-hours of createFrameCache.py of the full
+# scale runs (not of the incremental ones)
+# usage: simulateSchedule.py FRAME STARTDATE ENDDATE [--batchn N1,N2..] [--job-hours H1,H2..]
+#                            [--queue-wait H] [--wait-per-hour H] [--max-running N] [--pick]
+#   --batchn ........ batchN candidates (default 1,2,4,8,12,16,24,32,48,64)
+#   --job-hours ..... job runtime caps [h] (default 22.5,12,6)
+#   --queue-wait H, --wait-per-hour H, --max-running N ... the queue model
+#                     (default from the [Schedule] section of FRAME_BATCH_CONFIG)
+#   --pick .......... print only 'BATCHN JOB_HOURS' of the chosen schedule
+# prints the simulated schedules, the chosen one marked by *
+################################################################################
+#imports
+################################################################################
+import batchDBLib as lq
+import batchSimLib as sl
+from batchNetworkLib import network_config
+import datetime as dt
+import pandas as pd
+import sys
+import os
+
+################################################################################
+#Main
+################################################################################
+def option(argv,name,default=None):
+    if name in argv:
+        i = argv.index(name)
+        value = argv[i+1]
+        del argv[i:i+2]
+        return value
+    return default
+
+def main(argv):
+    argv = list(argv)
+    batchNs = option(argv,'--batchn')
+    jobHours = option(argv,'--job-hours')
+    queue = sl.queue_model(wait=option(argv,'--queue-wait'),
+                           waitPerHour=option(argv,'--wait-per-hour'),
+                           maxRunning=option(argv,'--max-running'))
+    queue = {k:(int(v) if k == 'maxRunning' else float(v)) for k,v in queue.items()}
+    pick = '--pick' in argv
+    args = [a for a in argv[1:] if not a.startswith('--')]
+    if len(args) != 3:
+        print('usage: simulateSchedule.py FRAME STARTDATE ENDDATE [--batchn N1,N2..] [--job-hours H1,H2..]')
+        print('       [--queue-wait H] [--wait-per-hour H] [--max-running N] [--pick]')
+        return 1
+    frame = args[0]
+    startdate,enddate = [dt.datetime.strptime(d,'%Y-%m-%d').date() for d in args[1:3]]
+    polyid = lq.get_polyid(frame)
+    if not polyid:
+        print('frame {} is not in the batch db'.format(frame))
+        return 1
+    masterDate = lq.get_master(frame)
+    acqDates = pd.to_datetime(lq.get_frame_acq_dates(polyid,startdate,enddate,masterDate)['acq_date'])
+    acqDates = acqDates[((acqDates>=pd.Timestamp(startdate)) & (acqDates<=pd.Timestamp(enddate))) |
+                        (acqDates==pd.Timestamp(masterDate))]
+    if len(acqDates) < 2:
+        print('No acquisitions registered for this frame in this time period')
+        return 1
+    #(as createFrameCache.py, the frame's local_config.py may bridge the gaps.
+    #its max_ifg_bperp stops createFrameCache.py, not needed for the estimate)
+    netConfig = network_config(os.path.join(os.environ.get('BATCH_CACHE_DIR',''),frame,'local_config.py'),
+                               nearest=3,seasonal=None,volcsSouth=False,maxBtemp=None,
+                               maxBperp=None)
+    items = sl.frame_items(acqDates.values,masterDate,netConfig)
+    nBursts = lq.get_frame_burst_count(polyid)
+    itemHours = {stage:lq.predict_item_hours(polyid,stage,nBursts) for stage in sl.stages}
+    schedules = sl.evaluate_schedules(items,itemHours,queue,
+            batchNs=[int(n) for n in batchNs.split(',')] if batchNs else None,
+            jobHours=[float(h) for h in jobHours.split(',')] if jobHours else None)
+    best = sl.pick_schedule(schedules)
+    if pick:
+        print('{} {:g}'.format(int(best['batchN']),best['job_hours']))
+        return 0
+    print('{}: {} epochs, {} ifgs, queue wait {wait:g} h + {waitPerHour:g} h per walltime hour, '
+          'max. {maxRunning} running'.format(frame,len(items['coreg']),len(items['mk_ifg']),**queue))
+    print(' batchN job_hours  jobs longest_job makespan core_hours')
+    for row in schedules.itertuples():
+        mark = '*' if row.Index == best.name else ' '
+        print('{}{:5d} {:9g} {:5d} {:11.1f} {:8.1f} {:10.1f}'.format(mark,row.batchN,row.job_hours,
+                row.jobs,row.longest_job,row.makespan,row.core_hours))
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
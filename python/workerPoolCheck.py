@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+# runs a few items of a made up coreg job in worker processes, as the
+# ab_LiCSAR_* scripts do with --workers N (see batchWorkerLib), and checks that
+# the job setup (incl. the job context) gets to the workers and the status
+# updates of every item get back to the status writer of the job. the batch db
+# is not touched
+# usage: workerPoolCheck.py [WORKERS]
+################################################################################
+#imports
+################################################################################
+import batchDBLib as lq
+from batchWorkerLib import run_items
+from types import MappingProxyType
+import pandas as pd
+import sys
+import os
+
+class StatusCollector(lq.StatusBuffer):
+    #status writer keeping the updates
+    def __init__(self):
+        self.flushInterval = None
+        self.journal = None
+        self.pending = {}
+
+def process_item(row,jobSetup,statusWriter):
+    #status of the rslc - its slc_id from the context
+    context = jobSetup['context']
+    slcId,slcStatus = context.slcs[row['acq_date']]
+    statusWriter.set_rslc_status(row['rslc_id'],slcId)
+    statusWriter.set_item_timing({'item_id':row['rslc_id'],'stage':'coreg','pid':os.getpid()})
+
+################################################################################
+#Main
+################################################################################
+def main(argv):
+    if len(argv) > 2:
+        print('usage: workerPoolCheck.py [WORKERS]')
+        return 1
+    workers = int(argv[1]) if len(argv) == 2 else 2
+    dates = pd.date_range('2020-01-01',periods=2*workers,freq='6D')
+    items = pd.DataFrame({'rslc_id':range(1,len(dates)+1),'acq_date':dates})
+    context = lq.JobContext(job_id=0,job_type='coreg',frame='000A_00000_000000',polyid=0,
+            master=None,items=items,bursts=(),epochs=MappingProxyType({}),
+            slcs=MappingProxyType({d:(100+i,-1) for i,d in enumerate(dates)}))
+    writer = StatusCollector()
+    run_items(process_item,items,{'context':context},writer,workers)
+    statuses = {k[1]:v for k,v in writer.pending.items() if k[0] == 'rslc'}
+    pids = {v['pid'] for k,v in writer.pending.items() if k[0] == 'item_timing'}
+    print('{} of {} items done in {} processes'.format(len(statuses),len(items),len(pids)))
+    if statuses != {i:100+i-1 for i in items['rslc_id']} or os.getpid() in pids:
+        print('FAILED - the items did not get through the worker processes')
+        return 1
+    print('OK')
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,13 @@
+SELECT polygs.polyid_name AS "Frame", 
+date(acq_img.acq_date) AS "Master Date",
+COALESCE(SUM(CASE WHEN fp.stage='slc' AND fp.status IN (0,-6) THEN fp.n ELSE 0 END)/SUM(CASE WHEN fp.stage='slc' THEN fp.n END),0) AS "SLC Coverage",
+COALESCE(SUM(CASE WHEN fp.stage='rslc' AND fp.status=0 THEN fp.n ELSE 0 END)/SUM(CASE WHEN fp.stage='rslc' THEN fp.n END),0) AS "RSLC Coverage",
+COALESCE(SUM(CASE WHEN fp.stage='ifg' AND fp.status=0 THEN fp.n ELSE 0 END)/SUM(CASE WHEN fp.stage='ifg' THEN fp.n END),0) AS "IFG Coverage",
+COALESCE(SUM(CASE WHEN fp.stage='unw' AND fp.status=0 THEN fp.n ELSE 0 END)/SUM(CASE WHEN fp.stage='unw' THEN fp.n END),0) AS "UNW Coverage",
+polygs.active AS "Active",
+MAX(fp.time_updated) AS "Updated"
+FROM polygs 
+INNER JOIN acq_img on acq_img.img_id = polygs.master_img_id 
+INNER JOIN frame_progress AS fp ON fp.polyid = polygs.polyid 
+where active=1
+GROUP BY polygs.polyid, polygs.polyid_name, acq_img.acq_date, polygs.active;
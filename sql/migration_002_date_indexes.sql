@@ -0,0 +1,10 @@
+-- batch db schema version 2 (schemaVersion in python/batchDBLib.py)
+-- indexes for the per-frame date lookups of batchDBLib, i.e. the half-open
+-- acq_date ranges over the frame's bursts (get_frame_files_date,
+-- get_frame_bursts_on_date, get_burst_no, get_unreq_slc_on_date, set_master..)
+-- check the query plans afterwards with python/dbExplainCheck.py FRAME
+-- (run once - mysql has no CREATE INDEX IF NOT EXISTS)
+CREATE INDEX ix_files2bursts_bid_fid ON files2bursts (bid, fid);
+CREATE INDEX ix_files_acq_date ON files (acq_date);
+CREATE INDEX ix_polygs2bursts_polyid_bid ON polygs2bursts (polyid, bid);
+CREATE INDEX ix_acq_img_polyid_acq_date ON acq_img (polyid, acq_date);
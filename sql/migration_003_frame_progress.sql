@@ -0,0 +1,15 @@
+-- batch db schema version 3 (schemaVersion in python/batchDBLib.py)
+-- per frame summary of the item statuses - number of slc/rslc/ifg/unw items
+-- of each status. kept up to date by the batchDBLib status setters and frame
+-- rebuilds, report queries read it instead of grouping the whole item tables
+-- (see frameProgressQry.sql). after creating it, fill it by
+--   frameProgress.py --reconcile
+-- (this also refreshes the cached schema of batchDBLib)
+CREATE TABLE frame_progress (
+    polyid INT NOT NULL,
+    stage VARCHAR(8) NOT NULL,
+    status INT NOT NULL,
+    n INT NOT NULL DEFAULT 0,
+    time_updated DATETIME,
+    PRIMARY KEY (polyid, stage, status)
+);
@@ -0,0 +1,26 @@
+-- batch db schema version 4 (schemaVersion in python/batchDBLib.py)
+-- runtime and peak memory of every processed item (slc/rslc/ifg/unw), with the
+-- frame size and multilook. written by the ab_LiCSAR_* scripts, read by the
+-- walltime/memory predictor (batchTimingLib.ResourcePredictor) used at job
+-- submission (see predictResources.py). stage is the job type (mk_image,
+-- coreg, mk_ifg, unwrap), rc the status the item got (NULL if it crashed)
+-- after creating it, refresh the cached schema of batchDBLib by
+--   rm ~/.cache/licsar_framebatch/schema_*_v*.pickle
+-- (otherwise it is refreshed within SchemaRecheckMinutes)
+CREATE TABLE item_timing (
+    timing_id INT NOT NULL AUTO_INCREMENT,
+    polyid INT NOT NULL,
+    job_id INT,
+    stage VARCHAR(8) NOT NULL,
+    item_id INT NOT NULL,
+    n_bursts SMALLINT,
+    n_swaths TINYINT,
+    rglks TINYINT,
+    aglks TINYINT,
+    runtime_s FLOAT,
+    max_rss_mb FLOAT,
+    rc INT,
+    time_finished DATETIME,
+    PRIMARY KEY (timing_id),
+    INDEX idx_item_timing_stage (stage, n_bursts, time_finished)
+);
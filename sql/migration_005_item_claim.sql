@@ -0,0 +1,22 @@
+-- batch db schema version 5 (schemaVersion in python/batchDBLib.py)
+-- claims of the items processed by the pull based workers (claimWorker.py):
+-- a worker takes the next claimable item of a frame stage by inserting its
+-- row here (or by taking over an expired lease with a conditional UPDATE),
+-- renews lease_until while processing and clears it when done. stage is the
+-- job type (mk_image, coreg, mk_ifg, unwrap), attempts counts the claims
+-- after creating it, refresh the cached schema of batchDBLib by
+--   rm ~/.cache/licsar_framebatch/schema_*_v*.pickle
+-- (otherwise it is refreshed within SchemaRecheckMinutes)
+CREATE TABLE item_claim (
+    stage VARCHAR(8) NOT NULL,
+    item_id INT NOT NULL,
+    polyid INT NOT NULL,
+    token VARCHAR(32) NOT NULL,
+    worker VARCHAR(64),
+    claimed_at DATETIME,
+    lease_until DATETIME,
+    attempts SMALLINT NOT NULL DEFAULT 1,
+    PRIMARY KEY (stage, item_id),
+    INDEX idx_item_claim_frame (polyid, stage, lease_until),
+    INDEX idx_item_claim_token (token)
+);
@@ -0,0 +1,13 @@
+-- batch db schema version 6 (schemaVersion in python/batchDBLib.py)
+-- priority of the items and jobs, higher first (0 - routine updates, see
+-- batchPackLib, Priorities). createFrameCache.py --event DATE raises it for
+-- the epochs/pairs after an earthquake and the co-seismic pairs and packs them
+-- to their own jobs - these are processed (claimed) and submitted first
+-- after the change, refresh the cached schema of batchDBLib by
+--   rm ~/.cache/licsar_framebatch/schema_*_v*.pickle
+-- (otherwise it is refreshed within SchemaRecheckMinutes)
+ALTER TABLE jobs ADD COLUMN priority TINYINT NOT NULL DEFAULT 0;
+ALTER TABLE slc ADD COLUMN priority TINYINT NOT NULL DEFAULT 0;
+ALTER TABLE rslc ADD COLUMN priority TINYINT NOT NULL DEFAULT 0;
+ALTER TABLE ifg ADD COLUMN priority TINYINT NOT NULL DEFAULT 0;
+ALTER TABLE unw ADD COLUMN priority TINYINT NOT NULL DEFAULT 0;
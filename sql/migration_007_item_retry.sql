@@ -0,0 +1,28 @@
+-- batch db schema version 7 (schemaVersion in python/batchDBLib.py)
+-- retries of the failed items (retryFailed.py, see batchRetryLib): every
+-- failure of an item (in the job job_id) gets a row with its class (killed,
+-- transient, filesystem, input, error, gamma, unknown), whether it can be
+-- retried, the earliest time of the retry (backoff) and the job of the retry -
+-- the retry history of the item. item_timing gets the exception a failed item raised
+-- after the change, refresh the cached schema of batchDBLib by
+--   rm ~/.cache/licsar_framebatch/schema_*_v*.pickle
+-- (otherwise it is refreshed within SchemaRecheckMinutes)
+ALTER TABLE item_timing ADD COLUMN error VARCHAR(200);
+CREATE TABLE item_retry (
+    retry_id INT NOT NULL AUTO_INCREMENT,
+    polyid INT NOT NULL,
+    stage VARCHAR(8) NOT NULL,
+    item_id INT NOT NULL,
+    job_id INT,
+    attempt SMALLINT NOT NULL,
+    status INT,
+    failure VARCHAR(16),
+    retryable BOOLEAN NOT NULL DEFAULT FALSE,
+    error VARCHAR(200),
+    time_failed DATETIME,
+    retry_after DATETIME,
+    retry_job_id INT,
+    PRIMARY KEY (retry_id),
+    UNIQUE INDEX idx_item_retry_item (stage, item_id, job_id),
+    INDEX idx_item_retry_frame (polyid, stage)
+);